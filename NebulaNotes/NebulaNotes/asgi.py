@@ -2,6 +2,9 @@
 ASGI config for NebulaNotes project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it under an ASGI server (e.g. ``uvicorn NebulaNotes.asgi:application``) to serve
+the ``live/`` Server-Sent Events feed: every connected client is a coroutine waiting on
+the in-process broker instead of a worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,12 +43,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'NebulaNotesApp.middleware.StaticAssetsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'NebulaNotesApp.middleware.ApiTokenMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'NebulaNotesApp.middleware.RateLimitMiddleware',
+    'NebulaNotesApp.middleware.ProfilingMiddleware',
+    'NebulaNotesApp.middleware.RequestTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'NebulaNotes.urls'
@@ -86,6 +92,31 @@ DATABASES = {
 }
 
 
+# Shared cache for sessions and users, e.g. NEBULANOTES_CACHE_URL=redis://localhost:6379/1.
+# Without it every process has its own memory cache, which is only correct with a single worker.
+if os.environ.get("NEBULANOTES_CACHE_URL", "").startswith(("redis://", "rediss://", "unix://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["NEBULANOTES_CACHE_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Sessions are read from the cache and written to the database at most every SESSION_WRITE_BEHIND_SECONDS, a change
+# inside the window is written by the next request after it. Logged in users are loaded from the cache for
+# USER_CACHE_SECONDS. See NebulaNotesApp/sessions.py and backends.py.
+SESSION_ENGINE = "NebulaNotesApp.sessions"
+SESSION_WRITE_BEHIND_SECONDS = 60
+AUTHENTICATION_BACKENDS = ["NebulaNotesApp.backends.CachedModelBackend"]
+USER_CACHE_SECONDS = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -122,6 +153,22 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 #STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    # Uploads are stored once per content under MEDIA_ROOT/blobs/, see gc_media and dedupe_media.
+    "default": {
+        "BACKEND": "NebulaNotesApp.storage.ContentAddressedStorage",
+    },
+    # Hashed names, purged Bootstrap and .gz/.br variants, written by collectstatic.
+    "staticfiles": {
+        "BACKEND": "NebulaNotesApp.storage.StaticAssetsStorage",
+    },
+}
+
+# Stylesheets stripped of the rules no template uses, classes added from JavaScript go in STATIC_PURGE_SAFELIST.
+STATIC_PURGE_CSS = ["vendor/bootstrap/bootstrap.min.css"]
+STATIC_PURGE_SAFELIST = []
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -131,5 +178,76 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploaded files are served by MediaFileView. Behind nginx set MEDIA_ACCEL_REDIRECT_PREFIX to an internal
+# location aliased to MEDIA_ROOT, behind Apache (mod_xsendfile) or lighttpd set MEDIA_SENDFILE_HEADER = "X-Sendfile".
+MEDIA_ACCEL_REDIRECT_PREFIX = None
+MEDIA_SENDFILE_HEADER = None
+MEDIA_LOGIN_REQUIRED = False
+
 
 LOGIN_URL = "/login/"
+
+
+# Live feed of catalog changes served over ASGI, see NebulaNotesApp/broadcast.py.
+# InMemoryBroker only reaches clients of the same process, use PostgresBroker with several workers.
+LIVE_FEED_BROKER = "NebulaNotesApp.broadcast.InMemoryBroker"
+
+# Reverse proxies (addresses or networks) whose X-Forwarded-For header gives the client address, e.g. the nginx
+# front end. Requests from other addresses are keyed by their own address, see NebulaNotesApp/ratelimit.py.
+TRUSTED_PROXIES = [proxy for proxy in os.environ.get("NEBULANOTES_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if proxy]
+
+# Bearer token Prometheus sends to scrape /metrics ("Authorization: Bearer <token>"). The endpoint is
+# closed while it is empty: behind the proxy every request comes from 127.0.0.1, so addresses prove nothing.
+METRICS_TOKEN = os.environ.get("NEBULANOTES_METRICS_TOKEN", "")
+# Directory where every worker process writes its metrics so /metrics exports their sum, see NebulaNotesApp/metrics.py.
+# Needed with more than one worker, empty it before the application starts.
+METRICS_DIR = os.environ.get("NEBULANOTES_METRICS_DIR", "")
+
+# Observations are range-partitioned by observation_date on PostgreSQL, "year" or "month" partitions.
+# Run `manage.py observation_partitions` daily to create the next ones ahead of time.
+OBSERVATION_PARTITION_INTERVAL = "year"
+
+# Columnar snapshot of the object catalog every worker memory-maps, see NebulaNotesApp/catalog.py.
+# After the catalog changed a worker rebuilds it in a background thread while the old one is served, or
+# run `manage.py build_catalog_snapshot`. Without background rebuilds the first request after a change rebuilds it.
+CATALOG_SNAPSHOT_PATH = BASE_DIR / "var" / "catalog.snapshot"
+CATALOG_SNAPSHOT_BACKGROUND_REBUILD = True
+
+# Cache lifetime of heatmap tiles in seconds, new observations show up in cached tiles after this.
+HEATMAP_TILE_MAX_AGE = 86400
+
+# Token-bucket rate limits per URL name: "rate" is requests per period ("10/m", "100/5m"), "burst" the
+# requests allowed at once (default: the rate's count), "key" is "ip", "user" (logged-in user, else IP) or
+# "route" (one bucket for everyone) and "methods" limits the rule to some methods.
+# The buckets are shared between workers in the cache when a shared cache is configured, else every
+# process has its own buckets and the limits are multiplied by the number of workers.
+RATE_LIMITS = {
+    "login": {"rate": "10/m", "key": "ip", "methods": ["POST"]},
+    "register": {"rate": "5/h", "key": "ip", "methods": ["POST"]},
+    "create-observation": {"rate": "30/m", "key": "user", "methods": ["POST"]},
+    "ingest-observations": {"rate": "10/m", "key": "user"},
+    "list-objects": {"rate": "60/m", "burst": 20, "key": "ip"},
+    "list-events": {"rate": "60/m", "burst": 20, "key": "ip"},
+    "list-galaxies": {"rate": "60/m", "burst": 20, "key": "ip"},
+    "list-object-types": {"rate": "60/m", "burst": 20, "key": "ip"},
+    "list-observations": {"rate": "60/m", "burst": 20, "key": "user"},
+}
+RATE_LIMIT_BACKEND = (
+    "NebulaNotesApp.ratelimit.LocalBuckets"
+    if CACHES["default"]["BACKEND"].endswith("LocMemCache")
+    else "NebulaNotesApp.ratelimit.CacheBuckets"
+)
+
+# Queries slower than this are stored with their EXPLAIN ANALYZE plan, None disables the recorder.
+# The plans are taken by a background thread, at most SLOW_QUERY_EXPLAINS_PER_MINUTE across all processes.
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_EXPLAINS_PER_MINUTE = 30
+SLOW_QUERY_BACKGROUND = True
+
+# Memory profiling of single requests, see NebulaNotesApp/profiling.py. When off, the middleware is dropped at startup.
+# When on, staff requests with the header ("X-Profile: 1", or "X-Profile: calls" for a call tree too) and a
+# PROFILING_SAMPLE_RATE share of all requests are profiled, the newest PROFILING_MAX_REPORTS are listed at /profiles/.
+PROFILING_ENABLED = os.environ.get("NEBULANOTES_PROFILING") == "1"
+PROFILING_HEADER = "X-Profile"
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_MAX_REPORTS = 1000
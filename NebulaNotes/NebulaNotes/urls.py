@@ -17,8 +17,6 @@ Including another URLconf
 from django.conf.urls import handler404
 from django.contrib import admin
 from django.urls import path
-from django.conf import settings
-from django.conf.urls.static import static
 
 from NebulaNotesApp.views import (
     HomeView,
@@ -27,6 +25,7 @@ from NebulaNotesApp.views import (
     UserCreateView,
     ObjectCreateView,
     ObjectsListView,
+    ObjectSuggestView,
     ObjectDetailView,
     ObjectDeleteView,
     ObjectUpdateView,
@@ -42,14 +41,24 @@ from NebulaNotesApp.views import (
     GalaxyDeleteView,
     EventCreateView,
     EventsListView,
+    EventsCalendarFeedView,
     EventDetailView,
     EventUpdateView,
     EventDeleteView,
     ObservationCreateView,
+    ObservationIngestView,
     ObservationsListView,
     ObservationDetailView,
     ObservationUpdateView,
     ObservationDeleteView,
+    SyncView,
+    LiveFeedView,
+    MetricsView,
+    MediaFileView,
+    HeatmapView,
+    HeatmapTileView,
+    ProfileReportsListView,
+    ProfileReportDetailView,
     Custom404View
 
 )
@@ -64,6 +73,7 @@ urlpatterns = [
     path('register/', UserCreateView.as_view(), name="register"),
     path('object/create', ObjectCreateView.as_view(), name="create-object"),
     path('objects/list', ObjectsListView.as_view(), name="list-objects"),
+    path('objects/suggest', ObjectSuggestView.as_view(), name="suggest-objects"),
     path('object/<int:pk>', ObjectDetailView.as_view(), name="object-detail"),
     path('object/<int:pk>/delete', ObjectDeleteView.as_view(), name="object-delete"),
     path('object/<int:pk>/update', ObjectUpdateView.as_view(), name="object-update"),
@@ -79,19 +89,27 @@ urlpatterns = [
     path('galaxy/<int:pk>/delete', GalaxyDeleteView.as_view(), name="galaxy-delete"),
     path('event/create', EventCreateView.as_view(), name="create-event"),
     path('events/list', EventsListView.as_view(), name="list-events"),
+    path('events/calendar.ics', EventsCalendarFeedView.as_view(), name="events-calendar"),
     path('event/<int:pk>', EventDetailView.as_view(), name="event-detail"),
     path('event/<int:pk>/update', EventUpdateView.as_view(), name="event-update"),
     path('event/<int:pk>/delete', EventDeleteView.as_view(), name="event-delete"),
     path('observation/create', ObservationCreateView.as_view(), name="create-observation"),
+    path('observations/ingest', ObservationIngestView.as_view(), name="ingest-observations"),
     path('observations/list', ObservationsListView.as_view(), name="list-observations"),
     path('observation/<int:pk>', ObservationDetailView.as_view(), name="observation-detail"),
     path('observation/<int:pk>/update', ObservationUpdateView.as_view(), name="observation-update"),
     path('observation/<int:pk>/delete', ObservationDeleteView.as_view(), name="observation-delete"),
+    path('sync/', SyncView.as_view(), name="sync"),
+    path('live/', LiveFeedView.as_view(), name="live-feed"),
+    path('metrics', MetricsView.as_view(), name="metrics"),
+    path('media/<path:path>', MediaFileView.as_view(), name="media"),
+    path('heatmap/', HeatmapView.as_view(), name="heatmap"),
+    path('heatmap/<int:zoom>/<int:x>/<int:y>.json', HeatmapTileView.as_view(), name="heatmap-tile"),
+    path('profiles/', ProfileReportsListView.as_view(), name="list-profiles"),
+    path('profiles/<int:pk>', ProfileReportDetailView.as_view(), name="profile-detail"),
 
 
 
 ]
 
 handler404 = Custom404View.as_view()
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,3 +1,255 @@
-from django.contrib import admin
+import csv
 
-# Register your models here.
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from NebulaNotesApp import bulk, reference
+from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Galaxy, Event, Observation, OccurrenceOverride
+from NebulaNotesApp.partitions import partitions
+from NebulaNotesApp.streaming import streaming_response
+
+
+# Below this many rows an exact COUNT(*) is cheap enough.
+ESTIMATE_COUNTS_ABOVE = 10_000
+
+
+def estimated_row_count(model):
+    """ Returns PostgreSQL's estimate of the number of rows of a table (summed over its partitions), or None"""
+    if connection.vendor != "postgresql":
+        return None
+    table = model._meta.db_table
+    tables = [name for name, _ in partitions(connection, table)] or [table]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT SUM(GREATEST(reltuples, 0))::bigint FROM pg_class WHERE relname = ANY(%s) AND relkind = 'r'",
+            [tables],
+        )
+        estimate = cursor.fetchone()[0]
+    return estimate or None
+
+
+class EstimatedCountPaginator(Paginator):
+    """ A paginator that uses the planner's row estimate for unfiltered changelists of large tables"""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate > ESTIMATE_COUNTS_ABOVE:
+                return estimate
+        return super().count
+
+
+class CatalogAdmin(admin.ModelAdmin):
+    """
+    Base admin for the catalog tables.
+
+    Changelists don't count the unfiltered table, searches only use lookups the name indexes
+    can answer (case-sensitive prefix or id), bulk actions are single UPDATE statements and
+    exports are streamed.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    actions = ["export_csv"]
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        # startswith is a LIKE 'term%' that PostgreSQL answers from the varchar_pattern_ops index
+        # Django creates for indexed CharFields, icontains would scan the whole table.
+        q = Q()
+        for field in self.search_fields:
+            q |= Q(**{f"{field}__startswith": term})
+        if term.isdigit():
+            q |= Q(pk=int(term))
+        return queryset.filter(q), False
+
+    def _chosen(self, request, model, field):
+        pk = request.POST.get(field, "")
+        return model.objects.filter(pk=pk).first() if pk.isdigit() else None
+
+    def merge(self, request, queryset, merge, target):
+        """ Merges every selected row into ``target`` with ``merge(source, target)``, all in one transaction"""
+        if target is None:
+            self.message_user(request, "Choose the row to merge into first.", messages.WARNING)
+            return
+        with transaction.atomic():
+            sources = list(queryset.exclude(pk=target.pk))
+            moved = sum(merge(source, target) for source in sources)
+        self.message_user(
+            request, f"Merged {len(sources)} {queryset.model._meta.verbose_name_plural} into {target}, {moved} objects moved.",
+            messages.SUCCESS,
+        )
+
+    def bulk_update(self, request, queryset, description, **values):
+        """ Updates the selected rows with one UPDATE statement, also when all rows of the changelist are selected"""
+        updated = bulk.update(queryset, **values)
+        self.message_user(request, f"{updated} {queryset.model._meta.verbose_name_plural} {description}.", messages.SUCCESS)
+
+    @admin.action(description="Export selected rows as CSV")
+    def export_csv(self, request, queryset):
+        # Derived columns like the rendered Markdown are left out.
+        fields = [field.attname for field in queryset.model._meta.concrete_fields if field.editable or field.primary_key]
+
+        class Echo:
+            def write(self, value):
+                return value
+
+        writer = csv.writer(Echo())
+        rows = queryset.order_by("pk").values_list(*fields).iterator(chunk_size=2000)
+        response = streaming_response(
+            request,
+            (writer.writerow(row) for row in _with_header(fields, rows)),
+            content_type="text/csv; charset=utf-8",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{queryset.model._meta.model_name}.csv"'
+        return response
+
+
+def _with_header(header, rows):
+    yield header
+    yield from rows
+
+
+class GalaxyActionForm(ActionForm):
+    galaxy_type = forms.ChoiceField(choices=[("", "---------")] + Galaxy.TYPE_CHOICES, required=False, label="Type")
+    target = forms.ChoiceField(required=False, label="Merge into")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["target"].choices = [("", "---------")] + reference.snapshot().galaxy_choices()
+
+
+@admin.register(Galaxy)
+class GalaxyAdmin(CatalogAdmin):
+    list_display = ("name", "type")
+    list_filter = ("type",)
+    search_fields = ("name",)
+    action_form = GalaxyActionForm
+    actions = ["set_type", "merge_into", "export_csv"]
+
+    @admin.action(description="Set the type chosen above")
+    def set_type(self, request, queryset):
+        galaxy_type = request.POST.get("galaxy_type")
+        if galaxy_type not in dict(Galaxy.TYPE_CHOICES):
+            self.message_user(request, "Choose a type first.", messages.WARNING)
+            return
+        self.bulk_update(request, queryset, f"set to {galaxy_type}", type=galaxy_type)
+
+    @admin.action(description="Merge into the galaxy chosen above")
+    def merge_into(self, request, queryset):
+        self.merge(request, queryset, bulk.merge_galaxies, self._chosen(request, Galaxy, "target"))
+
+
+class AstronomicalObjectTypeActionForm(ActionForm):
+    target = forms.ChoiceField(required=False, label="Merge into")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["target"].choices = [("", "---------")] + reference.snapshot().type_choices()
+
+
+@admin.register(AstronomicalObjectType)
+class AstronomicalObjectTypeAdmin(CatalogAdmin):
+    list_display = ("name",)
+    search_fields = ("name",)
+    action_form = AstronomicalObjectTypeActionForm
+    actions = ["merge_into", "export_csv"]
+
+    @admin.action(description="Merge into the type chosen above")
+    def merge_into(self, request, queryset):
+        self.merge(request, queryset, bulk.merge_types, self._chosen(request, AstronomicalObjectType, "target"))
+
+
+class AstronomicalObjectActionForm(ActionForm):
+    galaxy = forms.ChoiceField(required=False)
+    object_type = forms.ChoiceField(required=False, label="Type")
+    discovery_year = forms.IntegerField(required=False)
+    distance_from_earth = forms.FloatField(required=False, min_value=0, label="Distance (ly)")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        data = reference.snapshot()
+        self.fields["galaxy"].choices = [("", "---------")] + data.galaxy_choices()
+        self.fields["object_type"].choices = [("", "---------")] + data.type_choices()
+
+
+@admin.register(AstronomicalObject)
+class AstronomicalObjectAdmin(CatalogAdmin):
+    list_display = ("name", "type", "galaxy", "distance_from_earth", "discovery_year")
+    list_select_related = ("type", "galaxy")
+    list_filter = ("type",)
+    search_fields = ("name",)
+    autocomplete_fields = ("type", "galaxy", "parent")
+    action_form = AstronomicalObjectActionForm
+    actions = ["move_to_galaxy", "remove_from_galaxy", "set_type", "set_measurements", "export_csv"]
+
+    @admin.action(description="Move to the galaxy chosen above")
+    def move_to_galaxy(self, request, queryset):
+        galaxy = self._chosen(request, Galaxy, "galaxy")
+        if galaxy is None:
+            self.message_user(request, "Choose a galaxy first.", messages.WARNING)
+            return
+        self.bulk_update(request, queryset, f"moved to {galaxy}", galaxy=galaxy)
+
+    @admin.action(description="Remove from their galaxy")
+    def remove_from_galaxy(self, request, queryset):
+        self.bulk_update(request, queryset, "removed from their galaxy", galaxy=None)
+
+    @admin.action(description="Set the type chosen above")
+    def set_type(self, request, queryset):
+        object_type = self._chosen(request, AstronomicalObjectType, "object_type")
+        if object_type is None:
+            self.message_user(request, "Choose a type first.", messages.WARNING)
+            return
+        self.bulk_update(request, queryset, f"set to {object_type}", type=object_type)
+
+    @admin.action(description="Set the discovery year and/or distance entered above")
+    def set_measurements(self, request, queryset):
+        values = {}
+        for field in ("discovery_year", "distance_from_earth"):
+            try:
+                values[field] = self.action_form.base_fields[field].clean(request.POST.get(field, ""))
+            except ValidationError:
+                values[field] = None
+        if not any(value is not None for value in values.values()):
+            self.message_user(request, "Enter a valid discovery year or distance first.", messages.WARNING)
+            return
+        updated = bulk.set_fields(queryset, **values)
+        self.message_user(request, f"{updated} astronomical objects updated.", messages.SUCCESS)
+
+
+class OccurrenceOverrideInline(admin.TabularInline):
+    """ The cancelled, moved and renamed occurrences of a recurring event"""
+    model = OccurrenceOverride
+    extra = 0
+
+
+@admin.register(Event)
+class EventAdmin(CatalogAdmin):
+    list_display = ("name", "date", "repeat")
+    search_fields = ("name",)
+    raw_id_fields = ("related_objects",)
+    inlines = [OccurrenceOverrideInline]
+
+
+@admin.register(Observation)
+class ObservationAdmin(CatalogAdmin):
+    list_display = ("id", "user", "astronomical_object", "event", "observation_date", "location")
+    list_select_related = ("user", "astronomical_object__type", "event")
+    search_fields = ("user__username",)
+    raw_id_fields = ("user", "astronomical_object", "event")
+    actions = ["clear_event", "export_csv"]
+
+    @admin.action(description="Detach from their event")
+    def clear_event(self, request, queryset):
+        self.bulk_update(request, queryset, "detached from their event", event=None)
@@ -0,0 +1,69 @@
+"""
+API tokens, for clients that aren't browsers (telescope automation posting observations).
+
+A client sends ``Authorization: Bearer <token>``. ApiTokenMiddleware makes the token's user the
+request's user, so rate limits and permissions work as for a logged in user. Views that accept
+tokens are wrapped in token_or_csrf(): a request authenticated by a token has no cookie a
+third-party site could ride on, so it skips the CSRF check, every other request still gets it.
+Tokens are created by ``manage.py create_api_token``, only their SHA-256 is stored.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+from functools import wraps
+
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from NebulaNotesApp.models import ApiToken
+
+
+# Keys start with it, other bearer tokens (the /metrics scraper's) are told apart without a query.
+PREFIX = "nn_"
+# last_used is only written when it is older than this, not on every request.
+LAST_USED_PRECISION = timedelta(minutes=5)
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_token(user, name):
+    """ Creates a token for the user and returns its key, which can't be read again"""
+    key = PREFIX + secrets.token_urlsafe(32)
+    ApiToken.objects.create(user=user, name=name, key_hash=hash_key(key))
+    return key
+
+
+def bearer_token(request):
+    """ Returns the API token of an "Authorization: Bearer" header, or None"""
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    credentials = credentials.strip()
+    return credentials if scheme.lower() == "bearer" and credentials.startswith(PREFIX) else None
+
+
+def authenticate(key):
+    """ Returns the active user of the token ``key``, or None"""
+    token = ApiToken.objects.select_related("user").filter(key_hash=hash_key(key)).first()
+    if token is None or not token.user.is_active:
+        return None
+    now = timezone.now()
+    if token.last_used is None or now - token.last_used > LAST_USED_PRECISION:
+        ApiToken.objects.filter(pk=token.pk).update(last_used=now)
+    return token.user
+
+
+def token_or_csrf(view):
+    """ Exempts a view from the CSRF check for requests authenticated by an API token only"""
+    check = CsrfViewMiddleware(lambda request: None)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(request, "api_token_user", False):
+            rejected = check.process_view(request, None, args, kwargs)
+            if rejected is not None:
+                return rejected
+        return view(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
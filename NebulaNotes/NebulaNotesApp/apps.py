@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class NebulanotesappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'NebulaNotesApp'
+
+    def ready(self):
+        from NebulaNotesApp import signals  # noqa: F401
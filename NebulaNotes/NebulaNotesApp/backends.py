@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+USER_CACHE_PREFIX = "nebulanotes.user"
+DEFAULT_USER_CACHE_SECONDS = 300
+
+# Permission caches ModelBackend sets on the instance, they aren't invalidated with the user.
+PERMISSION_CACHES = ("_perm_cache", "_user_perm_cache", "_group_perm_cache")
+
+
+def user_cache_key(user_id):
+    return f"{USER_CACHE_PREFIX}:{user_id}"
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user of a session from the cache instead of the database.
+
+    The cached copy is dropped whenever the user is saved or deleted (password changes and
+    last_login included) and when their groups or permissions change, see signals.py.
+    ``QuerySet.update()`` on users bypasses that and must call ``forget_user()``.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                for attribute in PERMISSION_CACHES:
+                    user.__dict__.pop(attribute, None)
+                cache.set(key, user, getattr(settings, "USER_CACHE_SECONDS", DEFAULT_USER_CACHE_SECONDS))
+        return user
@@ -0,0 +1,259 @@
+"""
+Full snapshot and restore of the NebulaNotesApp tables, for backups and copying the data between databases.
+
+dumpdata and loaddata turn every row into a model instance and a serialized object. Here every
+table goes to and from a gzipped file in one streamed statement instead. On PostgreSQL that is a
+``COPY`` in binary (the default, fastest, same server version and schema only) or CSV form. Tables
+are dumped by several worker processes that all read one exported transaction snapshot, so the
+files are consistent with each other. They are restored level by level in foreign key order,
+the tables of one level in parallel, and the sequences are reset afterwards. On other databases,
+like SQLite in the tests, the tables are written to CSV with plain SELECTs and INSERTs in this
+process.
+
+A snapshot directory holds one ``<table>.<format>.gz`` file per table and ``manifest.json`` with
+the format, the columns and row counts and the applied migrations of the app. Restoring needs the
+same migrations, replaces all rows of the app's tables and expects the referenced users to exist.
+A parallel restore commits table by table: when it fails, fix the cause and run it again.
+"""
+import csv
+import gzip
+import io
+import json
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import django
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+
+# Models are looked up through the app registry when needed: worker processes import this
+# module before Django is set up.
+APP_LABEL = "NebulaNotesApp"
+MANIFEST = "manifest.json"
+FORMATS = ("binary", "csv")
+DEFAULT_WORKERS = 4
+COMPRESS_LEVEL = 3
+BATCH_SIZE = 5000
+# NULL in CSV files, as in PostgreSQL's text format. A text value of exactly \N reads back as NULL.
+NULL = "\\N"
+
+
+def levels():
+    """ Returns the app's models (with the many-to-many tables) in foreign key order, a list per level"""
+    models = [
+        model for model in apps.get_app_config(APP_LABEL).get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy
+    ]
+    depends_on = {
+        model: {
+            field.related_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model in models and field.related_model is not model
+        }
+        for model in models
+    }
+    result, done = [], set()
+    while len(done) < len(models):
+        level = [model for model in models if model not in done and depends_on[model] <= done]
+        if not level:
+            raise ValueError("The foreign keys of the app's tables form a cycle.")
+        result.append(sorted(level, key=lambda model: model._meta.db_table))
+        done.update(level)
+    return result
+
+
+def columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def _file_name(table, file_format):
+    return f"{table}.{file_format}.gz"
+
+
+def _copy_options(file_format):
+    return "FORMAT binary" if file_format == "binary" else f"FORMAT csv, NULL '{NULL}'"
+
+
+def _column_list(connection, names):
+    return ", ".join(connection.ops.quote_name(name) for name in names)
+
+
+def _text(value):
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _start_worker():
+    django.setup()
+
+
+def _dump_table(directory, table, names, file_format, snapshot_id=None):
+    """ Writes one table to its gzipped file, returns the number of rows"""
+    connection = connections["default"]
+    path = Path(directory) / _file_name(table, file_format)
+    query = f"SELECT {_column_list(connection, names)} FROM {connection.ops.quote_name(table)}"
+    with transaction.atomic(), connection.cursor() as cursor, gzip.open(path, "wb", COMPRESS_LEVEL) as file:
+        if connection.vendor == "postgresql":
+            if snapshot_id:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot_id])
+            # COPY (SELECT ...) also works for the partitioned observation table.
+            cursor.cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH ({_copy_options(file_format)})", file)
+            return cursor.rowcount
+
+        rows = 0
+        with io.TextIOWrapper(file, encoding="utf-8", newline="") as text:
+            writer = csv.writer(text)
+            cursor.execute(query)
+            while batch := cursor.fetchmany(BATCH_SIZE):
+                writer.writerows([_text(value) for value in row] for row in batch)
+                rows += len(batch)
+        return rows
+
+
+def _restore_table(directory, table, names, file_format):
+    """ Loads one table from its gzipped file, returns the number of rows"""
+    connection = connections["default"]
+    path = Path(directory) / _file_name(table, file_format)
+    target = f"{connection.ops.quote_name(table)} ({_column_list(connection, names)})"
+    with transaction.atomic(), connection.cursor() as cursor, gzip.open(path, "rb") as file:
+        if connection.vendor == "postgresql":
+            cursor.cursor.copy_expert(f"COPY {target} FROM STDIN WITH ({_copy_options(file_format)})", file)
+            return cursor.rowcount
+
+        rows = 0
+        insert = f"INSERT INTO {target} VALUES ({', '.join(['%s'] * len(names))})"
+        reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8", newline=""))
+        batch = []
+        for row in reader:
+            batch.append([None if value == NULL else value for value in row])
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(insert, batch)
+                rows, batch = rows + len(batch), []
+        if batch:
+            cursor.executemany(insert, batch)
+            rows += len(batch)
+        return rows
+
+
+def _parallel(workers):
+    return connection.vendor == "postgresql" and workers > 1
+
+
+def _run(function, jobs, workers):
+    """ Returns ``[function(*job) for job in jobs]``, computed by worker processes when ``workers`` > 1"""
+    if not _parallel(workers):
+        return [function(*job) for job in jobs]
+    # Spawned workers open connections of their own, forked ones would share the parent's.
+    with ProcessPoolExecutor(min(workers, len(jobs)), mp_context=get_context("spawn"), initializer=_start_worker) as pool:
+        return list(pool.map(function, *zip(*jobs)))
+
+
+def applied_migrations():
+    return sorted(name for app, name in MigrationRecorder(connection).applied_migrations() if app == APP_LABEL)
+
+
+def snapshot(directory, file_format="binary", workers=DEFAULT_WORKERS):
+    """ Writes all tables of the app to ``directory``, returns the manifest"""
+    if file_format not in FORMATS:
+        raise ValueError(f"The format must be one of {', '.join(FORMATS)}, not {file_format!r}.")
+    if file_format == "binary" and connection.vendor != "postgresql":
+        raise ValueError("Binary snapshots need PostgreSQL, use the csv format.")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    models = [model for level in levels() for model in level]
+
+    with transaction.atomic():
+        snapshot_id = None
+        if connection.vendor == "postgresql":
+            # Every table is read at the same snapshot, at READ COMMITTED each COPY would take its own and the
+            # files could disagree. Parallel workers import the snapshot, this transaction stays open until they are done.
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                if _parallel(workers):
+                    cursor.execute("SELECT pg_export_snapshot()")
+                    snapshot_id = cursor.fetchone()[0]
+        counts = _run(
+            _dump_table,
+            [(str(directory), model._meta.db_table, columns(model), file_format, snapshot_id) for model in models],
+            workers,
+        )
+        migrations = applied_migrations()
+
+    manifest = {
+        "format": file_format,
+        "vendor": connection.vendor,
+        "migrations": migrations,
+        "tables": [
+            {
+                "table": model._meta.db_table,
+                "columns": columns(model),
+                "file": _file_name(model._meta.db_table, file_format),
+                "rows": rows,
+            }
+            for model, rows in zip(models, counts)
+        ],
+    }
+    (directory / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def read_manifest(directory):
+    """ Returns the manifest of a snapshot after checking that it can be restored into this database"""
+    path = Path(directory) / MANIFEST
+    if not path.exists():
+        raise ValueError(f"{directory} is not a snapshot, it has no {MANIFEST}.")
+    manifest = json.loads(path.read_text())
+    if manifest["format"] == "binary" and connection.vendor != "postgresql":
+        raise ValueError("Binary snapshots can only be restored into PostgreSQL.")
+    if manifest["migrations"] != applied_migrations():
+        raise ValueError("The snapshot was taken at other migrations of the app, migrate to the same ones first.")
+    tables = {model._meta.db_table: columns(model) for level in levels() for model in level}
+    if {table["table"]: table["columns"] for table in manifest["tables"]} != tables:
+        raise ValueError("The tables of the snapshot don't match the models.")
+    return manifest
+
+
+def _clear(models):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"TRUNCATE {', '.join(connection.ops.quote_name(model._meta.db_table) for model in models)}")
+        else:
+            for model in reversed(models):
+                cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def _reset_sequences(models):
+    with connection.cursor() as cursor:
+        for statement in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(statement)
+
+
+def restore(directory, workers=DEFAULT_WORKERS):
+    """ Replaces the rows of all tables of the app with the snapshot in ``directory``, returns {table: rows}"""
+    from NebulaNotesApp import catalog, reference
+
+    manifest = read_manifest(directory)
+    order = levels()
+    models = [model for level in order for model in level]
+    parallel = _parallel(workers)
+    counts = {}
+
+    # Without worker processes the whole restore is one transaction, workers commit table by table.
+    with transaction.atomic() if not parallel else nullcontext():
+        with transaction.atomic():
+            _clear(models)
+        for level in order:
+            jobs = [(str(directory), model._meta.db_table, columns(model), manifest["format"]) for model in level]
+            counts.update(zip([model._meta.db_table for model in level], _run(_restore_table, jobs, workers)))
+        _reset_sequences(models)
+
+    reference.changed()
+    catalog.changed()
+    return counts
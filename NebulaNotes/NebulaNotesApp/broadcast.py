@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from NebulaNotesApp.models import AstronomicalObject, Event, Galaxy
+
+
+logger = logging.getLogger(__name__)
+
+# Saves of these models are published, one message per row from signals.py or per operation from bulk.py.
+LIVE_FEED_MODELS = (Event, AstronomicalObject, Galaxy)
+DEFAULT_BROKER = "NebulaNotesApp.broadcast.InMemoryBroker"
+KEEP_ALIVE_SECONDS = 15
+
+
+class InMemoryBroker:
+    """
+    Fans out published messages to every live feed subscriber of this process.
+
+    Subscribers are asyncio queues grouped by their event loop, so a publish from any thread
+    schedules a single callback per loop no matter how many clients are connected.
+    Slow clients lose their oldest messages instead of growing their queue without limit.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(loop, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            for loop, queues in list(self._subscribers.items()):
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[loop]
+
+    def publish(self, message):
+        self._fan_out(message)
+
+    def _fan_out(self, message):
+        with self._lock:
+            targets = [(loop, tuple(queues)) for loop, queues in self._subscribers.items()]
+        for loop, queues in targets:
+            if loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(self._deliver, queues, message)
+
+    @staticmethod
+    def _deliver(queues, message):
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+class PostgresBroker(InMemoryBroker):
+    """
+    Shares messages between worker processes with PostgreSQL LISTEN/NOTIFY.
+
+    Each process keeps one listening connection and feeds its notifications into the
+    in-process fan-out, so one NOTIFY reaches every connected client of every worker.
+    """
+    channel = "nebulanotes_live_feed"
+
+    def __init__(self, queue_size=100):
+        super().__init__(queue_size)
+        self._listener = None
+
+    def subscribe(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="live-feed-listener", daemon=True)
+                    self._listener.start()
+        return super().subscribe()
+
+    def publish(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, json.dumps(message)])
+
+    def _listen(self):
+        import select
+        import psycopg2
+
+        params = connection.get_connection_params()
+        params.pop("cursor_factory", None)
+        while True:
+            try:
+                listener = psycopg2.connect(**params)
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([listener], [], [], 60) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        notify = listener.notifies.pop(0)
+                        self._fan_out(json.loads(notify.payload))
+            except Exception:
+                logger.exception("Live feed listener lost its connection, reconnecting")
+                time.sleep(5)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, "LIVE_FEED_BROKER", DEFAULT_BROKER))()
+
+
+def notify(model, pk, action, name=""):
+    """ Publishes a change to the live feed once the current transaction commits"""
+    message = {"model": model._meta.model_name, "id": pk, "action": action, "name": name}
+    transaction.on_commit(lambda: get_broker().publish(message))
+
+
+def notify_bulk(model, action, count):
+    """ Publishes a set-based change of ``count`` rows as one message, clients reload the rows they show"""
+    message = {"model": model._meta.model_name, "id": None, "action": action, "name": "", "count": count}
+    transaction.on_commit(lambda: get_broker().publish(message))
+
+
+def format_event(message):
+    return f"event: {message['action']}\ndata: {json.dumps(message)}\n\n"
+
+
+async def event_stream(broker, keep_alive=KEEP_ALIVE_SECONDS):
+    """ Yields Server-Sent Events for every message the broker publishes until the client disconnects"""
+    queue = broker.subscribe()
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=keep_alive)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(message)
+    finally:
+        broker.unsubscribe(queue)
@@ -0,0 +1,104 @@
+"""
+Set-based edits of the catalog for curation: reassigning, merging and batch-setting fields.
+
+Every operation runs a fixed number of statements in one transaction, whatever the number of
+rows, and returns the number of rows it changed. QuerySet.update() sends no signals, so the
+operations do what the signals would have done once for the whole set: append the rows to the
+sync change log (INSERT ... SELECT from the same query), publish one message to the live feed,
+move heatmap counts and mark the reference and catalog snapshots stale.
+"""
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+
+from NebulaNotesApp import broadcast, catalog, heatmap, reference
+from NebulaNotesApp.models import AstronomicalObject, HeatmapCell
+from NebulaNotesApp.sync import record_queryset
+
+
+def invalidate(model, updated=0):
+    """ Marks the snapshots built from ``model`` stale and tells the live feed, once for a whole operation"""
+    if updated and model in broadcast.LIVE_FEED_MODELS:
+        broadcast.notify_bulk(model, "updated", updated)
+    if model in reference.REFERENCE_MODELS:
+        reference.changed()
+    if model is AstronomicalObject:
+        catalog.changed()
+
+
+@transaction.atomic
+def update(queryset, **values):
+    """ Sets ``values`` on all rows of ``queryset`` with one UPDATE, returns the number of rows"""
+    previous_types = None
+    if queryset.model is AstronomicalObject and "type" in values:
+        previous_types = dict(queryset.values_list("pk", "type_id"))
+    record_queryset(queryset)
+    updated = queryset.update(**values)
+    if previous_types:
+        new_type = values["type"]
+        heatmap.retype_objects(previous_types, getattr(new_type, "pk", new_type))
+    invalidate(queryset.model, updated)
+    return updated
+
+
+def reassign(objects, galaxy=None, object_type=None, clear_galaxy=False):
+    """ Moves ``objects`` to another galaxy (or none with ``clear_galaxy``) and/or type"""
+    values = {}
+    if galaxy is not None or clear_galaxy:
+        values["galaxy"] = galaxy
+    if object_type is not None:
+        values["type"] = object_type
+    return update(objects, **values) if values else 0
+
+
+def set_fields(objects, discovery_year=None, distance_from_earth=None):
+    """ Sets the discovery year and/or the distance of ``objects``, fields left as None are kept"""
+    values = {
+        field: value
+        for field, value in (("discovery_year", discovery_year), ("distance_from_earth", distance_from_earth))
+        if value is not None
+    }
+    return update(objects, **values) if values else 0
+
+
+@transaction.atomic
+def merge_types(source, target):
+    """
+    Moves every object of the ``source`` type to ``target`` and deletes ``source``, returns the number of moved objects.
+
+    The heatmap counts of ``source`` are added to ``target``'s cells in three statements
+    instead of being recounted from the observations.
+    """
+    if source.pk == target.pk:
+        return 0
+    same_cell = HeatmapCell.objects.filter(
+        object_type=source, quadkey=OuterRef("quadkey"), month=OuterRef("month"),
+    )
+    HeatmapCell.objects.filter(Exists(same_cell), object_type=target).update(
+        count=F("count") + Subquery(same_cell.values("count")[:1])
+    )
+    HeatmapCell.objects.filter(object_type=source).exclude(
+        Exists(HeatmapCell.objects.filter(object_type=target, quadkey=OuterRef("quadkey"), month=OuterRef("month")))
+    ).update(object_type=target)
+    HeatmapCell.objects.filter(object_type=source).delete()
+
+    objects = AstronomicalObject.objects.filter(type=source)
+    record_queryset(objects)
+    moved = objects.update(type=target)
+    # Deleting the type marks the reference snapshot stale through its signal.
+    source.delete()
+    invalidate(AstronomicalObject, moved)
+    return moved
+
+
+@transaction.atomic
+def merge_galaxies(source, target):
+    """ Moves every object of the ``source`` galaxy to ``target`` and deletes ``source``, returns the number of moved objects"""
+    if source.pk == target.pk:
+        return 0
+    objects = AstronomicalObject.objects.filter(galaxy=source)
+    record_queryset(objects)
+    moved = objects.update(galaxy=target)
+    # Deleting the galaxy marks the reference and catalog snapshots stale through its signals.
+    source.delete()
+    invalidate(AstronomicalObject, moved)
+    return moved
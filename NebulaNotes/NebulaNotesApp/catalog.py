@@ -0,0 +1,309 @@
+"""
+Memory-mapped columnar snapshot of the astronomical object catalog.
+
+The object list filters, counts, sorts and pages from this file and only loads the rows of the
+page it shows. The file holds one array per column (ids, type and galaxy ids, distance,
+discovery year, the position of the name in name order) and the names as one UTF-8 blob with
+offsets. Every worker maps it read-only, so the columns are shared through the page cache
+instead of being copied into each process.
+
+The file records the catalog version it was built at. Saving or deleting objects replaces the
+version in the shared cache once the transaction commits (see signals.py), so rows that may
+still roll back never get into a file. A worker that finds its file older than the version
+keeps serving the old mapping and rebuilds the file in a background thread, one worker per
+version, into a temporary file it os.replace()s. Every worker maps the new file at its next
+version check, once per request. ``manage.py build_catalog_snapshot`` writes it ahead of time.
+Until a file exists, the object list queries the database.
+
+NumPy is optional, without it ``snapshot()`` returns None and the object list queries the
+database.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections, transaction
+
+from NebulaNotesApp import reference, versions
+from NebulaNotesApp.facets import DISTANCE_BUCKETS, YEAR_BUCKETS, facet_result
+from NebulaNotesApp.models import AstronomicalObject
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - the object list falls back to the database
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "nebulanotes.catalog-version"
+BUILDING_KEY = "nebulanotes.catalog-building"
+# A build that didn't finish in this time (its worker died) no longer keeps the others from building.
+BUILD_TIMEOUT = 600
+MAGIC = b"NNCATv1\n"
+PREAMBLE = struct.Struct("<8sQ")
+NO_ID = -1
+
+# Column name: array typecode of the column, NaN stands for a missing discovery year.
+COLUMNS = {
+    "id": "q",
+    "type_id": "q",
+    "galaxy_id": "q",
+    "distance": "d",
+    "discovery_year": "d",
+    "name_rank": "q",
+    "name_offsets": "q",
+    "names": "B",
+}
+DTYPES = {"q": "int64", "d": "float64", "B": "uint8"}
+SORT_COLUMNS = {"name": "name_rank", "distance": "distance", "year": "discovery_year"}
+
+
+def snapshot_path():
+    return Path(getattr(settings, "CATALOG_SNAPSHOT_PATH", Path(tempfile.gettempdir()) / "nebulanotes-catalog"))
+
+
+def build(path, version):
+    """ Writes a snapshot of the catalog at ``version`` to ``path``, replacing the old file atomically, returns the row count"""
+    columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+    names = []
+    rows = (
+        AstronomicalObject.objects.order_by("pk")
+        .values_list("pk", "type_id", "galaxy_id", "distance_from_earth", "discovery_year", "name")
+        .iterator(chunk_size=5000)
+    )
+    columns["name_offsets"].append(0)
+    for pk, type_id, galaxy_id, distance, year, name in rows:
+        columns["id"].append(pk)
+        columns["type_id"].append(type_id)
+        columns["galaxy_id"].append(NO_ID if galaxy_id is None else galaxy_id)
+        columns["distance"].append(distance)
+        columns["discovery_year"].append(float("nan") if year is None else year)
+        encoded = name.encode()
+        columns["names"].frombytes(encoded)
+        columns["name_offsets"].append(len(columns["names"]))
+        names.append(name)
+    rank = array("q", bytes(8 * len(names)))
+    for position, index in enumerate(sorted(range(len(names)), key=lambda index: names[index].casefold())):
+        rank[index] = position
+    columns["name_rank"] = rank
+
+    header = {"version": version, "count": len(names), "columns": {}}
+    offset = 0
+    for name, column in columns.items():
+        header["columns"][name] = [DTYPES[column.typecode], offset, len(column)]
+        offset += _padded(len(column) * column.itemsize)
+    encoded_header = json.dumps(header).encode()
+    start = _padded(PREAMBLE.size + len(encoded_header))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(PREAMBLE.pack(MAGIC, len(encoded_header)) + encoded_header)
+            file.write(bytes(start - file.tell()))
+            for column in columns.values():
+                data = column.tobytes()
+                file.write(data + bytes(_padded(len(data)) - len(data)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return len(names)
+
+
+def _padded(size):
+    return (size + 7) // 8 * 8
+
+
+class CatalogSnapshot:
+    """ A read-only mapping of a snapshot file, the columns are NumPy arrays over the mapped pages"""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = PREAMBLE.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header = json.loads(self._map[PREAMBLE.size:PREAMBLE.size + header_size])
+        start = _padded(PREAMBLE.size + header_size)
+        self.version = header["version"]
+        self.count = header["count"]
+        self.columns = {
+            name: np.frombuffer(self._map, dtype=dtype, count=length, offset=start + offset)
+            for name, (dtype, offset, length) in header["columns"].items()
+        }
+
+    def name(self, index):
+        offsets = self.columns["name_offsets"]
+        return self.columns["names"][offsets[index]:offsets[index + 1]].tobytes().decode()
+
+    def masks(self, filters):
+        """ Returns the boolean masks of the type, galaxy, distance and year filters"""
+        everything = np.ones(self.count, dtype=bool)
+        type_mask = np.isin(self.columns["type_id"], filters["type"]) if filters["type"] else everything
+
+        galaxy_mask = everything
+        if filters["galaxy"] or filters["no_galaxy"]:
+            galaxy_mask = np.isin(self.columns["galaxy_id"], filters["galaxy"] + ([NO_ID] if filters["no_galaxy"] else []))
+
+        distance, distance_mask = self.columns["distance"], everything.copy()
+        if filters["distance_min"] is not None:
+            distance_mask &= distance >= filters["distance_min"]
+        if filters["distance_max"] is not None:
+            distance_mask &= distance < filters["distance_max"]
+
+        year, year_mask = self.columns["discovery_year"], everything.copy()
+        if filters["year_min"] is not None:
+            year_mask &= year >= filters["year_min"]
+        if filters["year_max"] is not None:
+            year_mask &= year <= filters["year_max"]
+        return type_mask, galaxy_mask, distance_mask, year_mask
+
+    def ids(self, filters, sort=None):
+        """ Returns the ids of the matching objects, by id or in the order of a facets.parse_sort() value"""
+        type_mask, galaxy_mask, distance_mask, year_mask = self.masks(filters)
+        indexes = np.flatnonzero(type_mask & galaxy_mask & distance_mask & year_mask)
+        if sort:
+            key = self.columns[SORT_COLUMNS[sort.lstrip("-")]][indexes]
+            # Rows are stored by id, a stable sort keeps ties in id order like the database query.
+            indexes = indexes[np.argsort(-key if sort.startswith("-") else key, kind="stable")]
+        return self.columns["id"][indexes]
+
+    def facet_counts(self, filters):
+        """ Returns the same counts as facets.facet_counts(), computed from the columns"""
+        type_mask, galaxy_mask, distance_mask, year_mask = self.masks(filters)
+        data = reference.snapshot()
+        type_ids, galaxy_ids = self.columns["type_id"], self.columns["galaxy_id"]
+
+        types = {int(pk): [data.types.get(int(pk), ""), 0] for pk in np.unique(type_ids)}
+        for pk, count in zip(*np.unique(type_ids[galaxy_mask & distance_mask & year_mask], return_counts=True)):
+            types[int(pk)][1] = int(count)
+
+        galaxies = {}
+        for pk in np.unique(galaxy_ids):
+            pk = None if pk == NO_ID else int(pk)
+            galaxies[pk] = [data.galaxies[pk]["name"] if pk in data.galaxies else None, 0]
+        for pk, count in zip(*np.unique(galaxy_ids[type_mask & distance_mask & year_mask], return_counts=True)):
+            galaxies[None if pk == NO_ID else int(pk)][1] = int(count)
+
+        selected = type_mask & galaxy_mask
+        distance_edges = [upper for _, _, upper in DISTANCE_BUCKETS if upper is not None]
+        distances = np.bincount(
+            np.digitize(self.columns["distance"][selected & year_mask], distance_edges), minlength=len(DISTANCE_BUCKETS)
+        )
+        year = self.columns["discovery_year"][selected & distance_mask]
+        known = ~np.isnan(year)
+        # Year buckets include their last year, the next bucket starts a year later.
+        year_edges = [upper + 1 for _, _, upper in YEAR_BUCKETS if upper is not None]
+        years = np.bincount(np.digitize(year[known], year_edges), minlength=len(YEAR_BUCKETS))
+
+        return facet_result(
+            filters,
+            int(np.count_nonzero(selected & distance_mask & year_mask)),
+            types,
+            galaxies,
+            [int(count) for count in distances],
+            [int(count) for count in years],
+            int(np.count_nonzero(~known)),
+        )
+
+
+_snapshot = None
+_checked = threading.local()
+_lock = threading.Lock()
+_builder = None
+
+
+def _open(path):
+    try:
+        return CatalogSnapshot(path)
+    except (OSError, ValueError):
+        return None
+
+
+def snapshot():
+    """ Returns the mapped catalog (possibly older than the catalog version while it is rebuilt), None without NumPy or a file"""
+    global _snapshot
+    if np is None:
+        return None
+    if _snapshot is not None and getattr(_checked, "value", False):
+        return _snapshot
+    with _lock:
+        version = versions.current(VERSION_KEY)
+        if _snapshot is None or _snapshot.version != version:
+            path = snapshot_path()
+            mapped = _open(path)
+            if mapped is None or mapped.version != version:
+                if getattr(settings, "CATALOG_SNAPSHOT_BACKGROUND_REBUILD", True):
+                    _rebuild_in_background(version)
+                else:
+                    rebuild(version)
+                    mapped = _open(path)
+            # The old mapping is unmapped once no page of objects refers to its arrays any more.
+            if mapped is not None and (_snapshot is None or mapped.version != _snapshot.version):
+                _snapshot = mapped
+        _checked.value = True
+    return _snapshot
+
+
+def rebuild(version):
+    """ Builds the snapshot at ``version`` unless it exists or another process is building it, returns the row count or None"""
+    path = snapshot_path()
+    mapped = _open(path)
+    if mapped is not None and mapped.version == version:
+        return None
+    key = f"{BUILDING_KEY}:{version}"
+    if not cache.add(key, True, BUILD_TIMEOUT):
+        return None
+    try:
+        return build(path, version)
+    finally:
+        cache.delete(key)
+
+
+def _rebuild_in_background(version):
+    # Called with _lock held, one build thread per process at a time.
+    global _builder
+    if _builder is not None and _builder.is_alive():
+        return
+    _builder = threading.Thread(target=_build_thread, args=(version,), name="catalog-snapshot", daemon=True)
+    _builder.start()
+
+
+def _build_thread(version):
+    try:
+        rebuild(version)
+    except Exception:
+        logger.exception("Rebuilding the catalog snapshot failed")
+    finally:
+        connections.close_all()
+
+
+def changed():
+    """ Marks the snapshot stale for all processes once the current transaction commits"""
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    versions.replace(VERSION_KEY)
+    _checked.value = False
+
+
+def _start_request(**kwargs):
+    _checked.value = False
+
+
+request_started.connect(_start_request, dispatch_uid="nebulanotes.catalog")
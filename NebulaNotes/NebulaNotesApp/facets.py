@@ -0,0 +1,193 @@
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from NebulaNotesApp import reference
+from NebulaNotesApp.models import AstronomicalObject
+
+
+NO_GALAXY = "none"
+
+# (label, lower bound included, upper bound excluded) in light years.
+DISTANCE_BUCKETS = [
+    ("Solar System", None, 0.001),
+    ("Nearby stars", 0.001, 100),
+    ("Milky Way", 100, 100_000),
+    ("Local Group", 100_000, 10_000_000),
+    ("Beyond", 10_000_000, None),
+]
+
+# (label, first year, last year), objects without a discovery year are counted as unknown.
+YEAR_BUCKETS = [
+    ("Before 1800", None, 1799),
+    ("1800–1899", 1800, 1899),
+    ("1900–1949", 1900, 1949),
+    ("1950–1999", 1950, 1999),
+    ("2000 and later", 2000, None),
+]
+
+
+def _number(value, cast):
+    try:
+        return cast(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def _ids(values):
+    return sorted({int(value) for value in values if value.isdigit()})
+
+
+# ?sort= values and the fields they order by, "-" in front sorts descending.
+SORTS = {"name": "name", "distance": "distance_from_earth", "year": "discovery_year"}
+
+
+def parse_sort(params):
+    """ Returns the ?sort= value if it is a known one, else None (by id)"""
+    sort = params.get("sort", "")
+    return sort if sort.lstrip("-") in SORTS else None
+
+
+def order_objects(queryset, sort):
+    if not sort:
+        return queryset.order_by("pk")
+    descending, key = sort.startswith("-"), sort.lstrip("-")
+    return queryset.order_by(("-" if descending else "") + SORTS[key], "pk")
+
+
+def parse_filters(params):
+    """ Reads the object list filters from a QueryDict, invalid values are ignored"""
+    galaxies = params.getlist("galaxy")
+    return {
+        "type": _ids(params.getlist("type")),
+        "galaxy": _ids(galaxies),
+        "no_galaxy": NO_GALAXY in galaxies,
+        "distance_min": _number(params.get("distance_min"), float),
+        "distance_max": _number(params.get("distance_max"), float),
+        "year_min": _number(params.get("year_min"), int),
+        "year_max": _number(params.get("year_max"), int),
+    }
+
+
+def distance_q(filters):
+    q = Q()
+    if filters["distance_min"] is not None:
+        q &= Q(distance_from_earth__gte=filters["distance_min"])
+    if filters["distance_max"] is not None:
+        q &= Q(distance_from_earth__lt=filters["distance_max"])
+    return q
+
+
+def year_q(filters):
+    q = Q()
+    if filters["year_min"] is not None:
+        q &= Q(discovery_year__gte=filters["year_min"])
+    if filters["year_max"] is not None:
+        q &= Q(discovery_year__lte=filters["year_max"])
+    return q
+
+
+def type_q(filters):
+    return Q(type_id__in=filters["type"]) if filters["type"] else Q()
+
+
+def galaxy_q(filters):
+    if not filters["galaxy"] and not filters["no_galaxy"]:
+        return Q()
+    q = Q(galaxy_id__in=filters["galaxy"])
+    if filters["no_galaxy"]:
+        q |= Q(galaxy__isnull=True)
+    return q
+
+
+def filter_objects(queryset, filters):
+    return queryset.filter(type_q(filters), galaxy_q(filters), distance_q(filters), year_q(filters))
+
+
+def _bucket(field, buckets, inclusive_upper):
+    whens = [When(**{f"{field}__isnull": True}, then=Value(-1))]
+    for index, (_, _, upper) in enumerate(buckets):
+        if upper is not None:
+            whens.append(When(**{f"{field}__{'lte' if inclusive_upper else 'lt'}": upper}, then=Value(index)))
+    return Case(*whens, default=Value(len(buckets) - 1), output_field=IntegerField())
+
+
+def _matches(value, selected, include_none=False):
+    if not selected and not include_none:
+        return True
+    return value in selected or (include_none and value is None)
+
+
+def facet_counts(filters):
+    """
+    Returns the number of matching objects and the counts of every facet value, from one grouped query.
+
+    Each facet is counted with all the other filters applied but not its own, so the counts
+    say how many objects a click would add or leave. The query groups by type, galaxy and
+    distance and year bucket, conditional counts leave out the range filters per facet and
+    the type and galaxy filters are applied while the groups are added up. Names come from the
+    reference snapshot, so the query doesn't join the type and galaxy tables.
+    """
+    by_distance, by_year = distance_q(filters), year_q(filters)
+    data = reference.snapshot()
+    groups = (
+        AstronomicalObject.objects
+        .values("type_id", "galaxy_id")
+        .annotate(
+            distance_bucket=_bucket("distance_from_earth", DISTANCE_BUCKETS, inclusive_upper=False),
+            year_bucket=_bucket("discovery_year", YEAR_BUCKETS, inclusive_upper=True),
+        )
+        .annotate(
+            matching=Count("id", filter=by_distance & by_year),
+            without_distance=Count("id", filter=by_year),
+            without_year=Count("id", filter=by_distance),
+        )
+        .order_by()
+    )
+
+    types, galaxies = {}, {}
+    distances, years = [0] * len(DISTANCE_BUCKETS), [0] * len(YEAR_BUCKETS)
+    unknown_year, total = 0, 0
+    for group in groups:
+        type_selected = _matches(group["type_id"], filters["type"])
+        galaxy_selected = _matches(group["galaxy_id"], filters["galaxy"], filters["no_galaxy"])
+        types.setdefault(group["type_id"], [data.types.get(group["type_id"], ""), 0])
+        galaxy = data.galaxies.get(group["galaxy_id"])
+        galaxies.setdefault(group["galaxy_id"], [galaxy["name"] if galaxy else None, 0])
+        if galaxy_selected:
+            types[group["type_id"]][1] += group["matching"]
+        if type_selected:
+            galaxies[group["galaxy_id"]][1] += group["matching"]
+        if type_selected and galaxy_selected:
+            total += group["matching"]
+            distances[group["distance_bucket"]] += group["without_distance"]
+            if group["year_bucket"] == -1:
+                unknown_year += group["without_year"]
+            else:
+                years[group["year_bucket"]] += group["without_year"]
+
+    return facet_result(filters, total, types, galaxies, distances, years, unknown_year)
+
+
+def facet_result(filters, total, types, galaxies, distances, years, unknown_year):
+    """ Builds the facets of the template from the counts, ``types`` and ``galaxies`` map pk to [name, count]"""
+    return {
+        "total": total,
+        "type": sorted(
+            ({"value": pk, "label": name, "count": count, "selected": pk in filters["type"]}
+             for pk, (name, count) in types.items()),
+            key=lambda facet: facet["label"],
+        ),
+        "galaxy": sorted(
+            ({"value": NO_GALAXY if pk is None else pk, "label": name or "No galaxy", "count": count,
+              "selected": filters["no_galaxy"] if pk is None else pk in filters["galaxy"]}
+             for pk, (name, count) in galaxies.items()),
+            key=lambda facet: (facet["value"] == NO_GALAXY, facet["label"]),
+        ),
+        "distance": [
+            {"label": label, "min": lower, "max": upper, "count": count}
+            for (label, lower, upper), count in zip(DISTANCE_BUCKETS, distances)
+        ],
+        "year": [
+            {"label": label, "min": lower, "max": upper, "count": count}
+            for (label, lower, upper), count in zip(YEAR_BUCKETS, years)
+        ] + [{"label": "Unknown", "min": None, "max": None, "count": unknown_year}],
+    }
@@ -0,0 +1,132 @@
+import mimetypes
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def requested_range(request, size, etag):
+    """
+    Returns the (start, end) byte range the client asked for, both inclusive.
+
+    None means the whole file should be sent (no Range, a stale If-Range or several ranges,
+    which servers may ignore), False means the range can't be satisfied.
+    """
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag:
+        return None
+    match = BYTE_RANGE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size or size == 0:
+        return False
+    return start, end
+
+
+class FileRange:
+    """
+    A read-only window of ``length`` bytes of an open file, starting at ``start``.
+
+    It keeps ``fileno()`` and leaves the file positioned at ``start``, so servers that
+    sendfile() a FileResponse (gunicorn) still send the range without copying it.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def serve_file(request, path, content_type=None, encoding=None, cache_control=None):
+    """
+    Returns a FileResponse for ``path`` with ETag and Last-Modified validators and byte ranges.
+
+    Conditional requests are answered with 304, FileResponse lets the WSGI server use
+    ``wsgi.file_wrapper`` (sendfile) for the body.
+    """
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if content_type is None:
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        byte_range = requested_range(request, stat.st_size, etag)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+        elif byte_range is None:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = FileResponse(FileRange(open(path, "rb"), start, end - start + 1), content_type=content_type, status=206)
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Accept-Ranges"] = "bytes"
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    if cache_control:
+        response["Cache-Control"] = cache_control
+    return response
+
+
+def accepted_encodings(request):
+    """ Returns the content codings the client accepts, without the ones it refused with q=0"""
+    encodings = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if coding:
+            encodings.add(coding.lower())
+    return encodings
+
+
+def serve_precompressed(request, path, cache_control=None):
+    """ Serves the .br or .gz sibling of ``path`` when the client accepts it, otherwise the file itself"""
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    accepted = accepted_encodings(request)
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if encoding in accepted and os.path.isfile(path + suffix):
+            response = serve_file(request, path + suffix, content_type, encoding, cache_control)
+            break
+    else:
+        response = serve_file(request, path, content_type, cache_control=cache_control)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
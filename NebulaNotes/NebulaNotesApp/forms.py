@@ -5,7 +5,10 @@ from django.utils.timezone import now
 # from formset.widgets import DateTimeInput
 from django import forms
 from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils.html import format_html
 
+from NebulaNotesApp import reference
 from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Galaxy, Event, User, Observation
 from django.http import request
 
@@ -48,10 +51,40 @@ class UserCreateForm(forms.ModelForm):
         return password_confirm
 
 
+class ObjectNameInput(forms.TextInput):
+    """ A text input for the name of an astronomical object, with suggestions fetched as the user types"""
+
+    class Media:
+        js = ['object_suggestions.js']
+
+    def __init__(self, attrs=None):
+        super().__init__({'class': 'form-control', 'autocomplete': 'off', **(attrs or {})})
+
+    def render(self, name, value, attrs=None, renderer=None):
+        datalist = f"{(attrs or {}).get('id', name)}-suggestions"
+        attrs = {**(attrs or {}), 'list': datalist, 'data-suggest-url': reverse('suggest-objects')}
+        return format_html('{}<datalist id="{}"></datalist>', super().render(name, value, attrs, renderer), datalist)
+
+
 class ObjectForm(forms.ModelForm):
+    # Entered by name: a dropdown of the whole catalog would be rendered on every create and edit page.
+    parent = forms.ModelChoiceField(
+        queryset=AstronomicalObject.objects.all(), to_field_name='name', required=False,
+        widget=ObjectNameInput, label='Part of', help_text='The name of the object this one belongs to',
+    )
+
     class Meta:
         model = AstronomicalObject
-        fields = ['name', 'type', 'distance_from_earth','description', 'discovery_year', 'galaxy']
+        fields = ['name', 'type', 'distance_from_earth','description', 'discovery_year', 'galaxy', 'parent']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The dropdowns come from the reference snapshot, only the chosen values are looked up on submit.
+        data = reference.snapshot()
+        self.fields['type'].choices = [("", "---------")] + data.type_choices()
+        self.fields['galaxy'].choices = [("", "---------")] + data.galaxy_choices()
+        if self.instance.parent_id is not None:
+            self.initial['parent'] = self.instance.parent.name
 
 
 class ObjectTypeForm(forms.ModelForm):
@@ -69,9 +102,22 @@ class GalaxyForm(forms.ModelForm):
 class EventForm(forms.ModelForm):
     date = forms.DateTimeField(
         widget=forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'})    )
+    repeat_interval = forms.IntegerField(min_value=1, max_value=32767, required=False, initial=1, label="Every")
+
     class Meta:
         model = Event
-        fields = ['name', 'date', 'description', 'related_objects']
+        fields = ['name', 'date', 'description', 'related_objects', 'repeat', 'repeat_interval', 'repeat_until']
+        widgets = {'repeat_until': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})}
+
+    def clean_repeat_interval(self):
+        return self.cleaned_data['repeat_interval'] or 1
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, until = cleaned_data.get('date'), cleaned_data.get('repeat_until')
+        if start and until and until < start.date():
+            self.add_error('repeat_until', "The last day can't be before the first occurrence.")
+        return cleaned_data
 
 
 def validate_past_date(value):
@@ -88,7 +134,7 @@ class ObservationForm(forms.ModelForm):
 
     class Meta:
         model = Observation
-        fields = ['location', 'notes', 'astronomical_object', 'event', 'observation_date']
+        fields = ['location', 'latitude', 'longitude', 'notes', 'astronomical_object', 'event', 'observation_date']
         exclude = ['user']
 
     def save(self, commit=True, user=None):
@@ -0,0 +1,166 @@
+"""
+Heatmap of where observations are made, per object type and month.
+
+The map is cut into Web Mercator tiles named by quadkeys: one digit (0-3) per zoom level, so
+the cells inside a tile are the keys one level deeper that start with the tile's key. Every
+observation with coordinates is counted in its cell at each level from DETAIL to MAX_ZOOM,
+in HeatmapCell rows keyed by (quadkey, object type, month). A tile at zoom z is served as
+the GRID x GRID cells of level z + DETAIL inside it, read with one index range scan.
+
+Counts are adjusted as observations are saved and deleted (signals.py), bulk-loaded
+(ingest.py) or their object changes type (admin.py). ``manage.py rebuild_heatmap``
+recomputes them from scratch.
+"""
+import math
+from collections import Counter
+from datetime import date, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Greatest
+
+from NebulaNotesApp.models import HeatmapCell, Observation
+
+
+MAX_ZOOM = 16
+DETAIL = 4
+GRID = 2 ** DETAIL
+MAX_TILE_ZOOM = MAX_ZOOM - DETAIL
+# Web Mercator stops short of the poles.
+MAX_LATITUDE = 85.05112878
+REBUILD_BATCH_SIZE = 5000
+
+
+def tile_xy(latitude, longitude, zoom):
+    """ Returns the (x, y) of the tile at ``zoom`` containing the point"""
+    latitude = min(max(latitude, -MAX_LATITUDE), MAX_LATITUDE)
+    sin_latitude = math.sin(math.radians(latitude))
+    size = 2 ** zoom
+    x = (longitude + 180) / 360 * size
+    y = (0.5 - math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi)) * size
+    return min(max(int(x), 0), size - 1), min(max(int(y), 0), size - 1)
+
+
+def quadkey(x, y, zoom):
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def tile_of(key):
+    """ Returns (zoom, x, y) of a quadkey"""
+    x = y = 0
+    for digit in key:
+        x, y = x * 2 + (int(digit) & 1), y * 2 + (int(digit) >> 1)
+    return len(key), x, y
+
+
+def month_of(moment):
+    day = moment.astimezone(dt_timezone.utc).date()
+    return date(day.year, day.month, 1)
+
+
+def cell_keys(object_type_id, latitude, longitude, observation_date):
+    """ Returns the (object type, month, quadkey) cells an observation is counted in, none without coordinates"""
+    if latitude is None or longitude is None or observation_date is None:
+        return []
+    key = quadkey(*tile_xy(latitude, longitude, MAX_ZOOM), MAX_ZOOM)
+    month = month_of(observation_date)
+    return [(object_type_id, month, key[:zoom]) for zoom in range(DETAIL, MAX_ZOOM + 1)]
+
+
+def observation_keys(observation, object_type_id=None):
+    if observation.latitude is None or observation.longitude is None:
+        return []
+    if object_type_id is None:
+        object_type_id = observation.astronomical_object.type_id
+    return cell_keys(object_type_id, observation.latitude, observation.longitude, observation.observation_date)
+
+
+@transaction.atomic(savepoint=False)
+def apply(deltas):
+    """ Adds a Counter of {(object type, month, quadkey): delta} to the cell counts"""
+    deltas = {cell: delta for cell, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    HeatmapCell.objects.bulk_create(
+        [
+            HeatmapCell(object_type_id=object_type_id, month=month, quadkey=key, zoom=len(key), count=0)
+            for (object_type_id, month, key), delta in deltas.items() if delta > 0
+        ],
+        ignore_conflicts=True,
+    )
+    # One UPDATE per distinct delta, usually just +1 or -1.
+    by_delta = {}
+    for (object_type_id, month, key), delta in deltas.items():
+        by_delta.setdefault(delta, {}).setdefault((object_type_id, month), []).append(key)
+    decremented = Q()
+    for delta, groups in by_delta.items():
+        cells = Q()
+        for (object_type_id, month), keys in groups.items():
+            cells |= Q(object_type_id=object_type_id, month=month, quadkey__in=keys)
+        if delta > 0:
+            HeatmapCell.objects.filter(cells).update(count=F("count") + delta)
+        else:
+            # Counts that drifted below the delta stop at 0 instead of breaking the unsigned column.
+            HeatmapCell.objects.filter(cells, count__gt=0).update(count=Greatest(F("count") + delta, 0))
+            decremented |= cells
+    if decremented:
+        HeatmapCell.objects.filter(decremented, count__lte=0).delete()
+
+
+def difference(old_keys, new_keys):
+    deltas = Counter(new_keys)
+    deltas.subtract(old_keys)
+    return deltas
+
+
+def retype_objects(previous_types, object_type_id):
+    """ Moves the counts of the objects' observations from their previous types, ``{object id: type id}``"""
+    deltas = Counter()
+    rows = Observation.objects.filter(
+        astronomical_object_id__in=previous_types, latitude__isnull=False, longitude__isnull=False,
+    ).values_list("astronomical_object_id", "latitude", "longitude", "observation_date")
+    for object_id, latitude, longitude, observation_date in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        if previous_types[object_id] != object_type_id:
+            deltas.subtract(cell_keys(previous_types[object_id], latitude, longitude, observation_date))
+            deltas.update(cell_keys(object_type_id, latitude, longitude, observation_date))
+    apply(deltas)
+
+
+def tile(zoom, x, y, object_types=(), months=()):
+    """ Returns [[column, row, count]] of the non-empty cells of a tile, optionally for some types and months"""
+    key = quadkey(x, y, zoom)
+    cells = HeatmapCell.objects.filter(zoom=zoom + DETAIL, quadkey__gte=key, quadkey__lt=key + "4")
+    if object_types:
+        cells = cells.filter(object_type_id__in=object_types)
+    if months:
+        cells = cells.filter(month__in=months)
+    counts = cells.values("quadkey").annotate(total=Sum("count")).order_by("quadkey")
+    result = []
+    for row in counts:
+        _, cell_x, cell_y = tile_of(row["quadkey"][zoom:])
+        result.append([cell_x, cell_y, row["total"]])
+    return result
+
+
+@transaction.atomic
+def rebuild():
+    """ Recomputes all cell counts from the observations, returns the number of cells"""
+    counts = Counter()
+    rows = Observation.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+        "astronomical_object__type_id", "latitude", "longitude", "observation_date"
+    )
+    for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        counts.update(cell_keys(*row))
+    HeatmapCell.objects.all().delete()
+    HeatmapCell.objects.bulk_create(
+        (
+            HeatmapCell(object_type_id=object_type_id, month=month, quadkey=key, zoom=len(key), count=count)
+            for (object_type_id, month, key), count in counts.items()
+        ),
+        batch_size=REBUILD_BATCH_SIZE,
+    )
+    return len(counts)
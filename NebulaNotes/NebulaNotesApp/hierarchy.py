@@ -0,0 +1,116 @@
+"""
+Hierarchy of astronomical objects (moons of planets, planets of star systems, stars of clusters) in a closure table.
+
+ObjectClosure has a row for every (ancestor, descendant) pair with the number of levels between
+them, including (object, object, 0). The subtree of an object is the rows of one ancestor and
+its ancestors are the rows of one descendant, so both are a single indexed join however deep
+the hierarchy is:
+
+    AstronomicalObject.objects.filter(ancestor_links__ancestor=solar_system)
+    Observation.objects.filter(astronomical_object__ancestor_links__ancestor=pleiades)
+
+signals.py maintains the rows. A new object gets a copy of its parent's ancestor rows. Moving
+an object replaces the rows between its subtree and its old ancestors with rows to the new ones,
+in two statements whatever the subtree's size. Deleting an object turns its children into roots.
+``manage.py rebuild_object_closure`` recomputes the table from the parents.
+"""
+from django.db import connection, transaction
+
+from NebulaNotesApp.models import AstronomicalObject, ObjectClosure
+from NebulaNotesApp.sync import record_changes
+
+
+REBUILD_BATCH_SIZE = 5000
+
+
+def _table():
+    return connection.ops.quote_name(ObjectClosure._meta.db_table)
+
+
+def descendants(obj, include_self=False):
+    """ Returns the objects below ``obj`` at any depth"""
+    # One filter() call, so both conditions apply to the same closure row.
+    return AstronomicalObject.objects.filter(ancestor_links__ancestor=obj, ancestor_links__depth__gte=0 if include_self else 1)
+
+
+def ancestors(obj):
+    """ Returns the objects above ``obj``, from the root down to its parent"""
+    return AstronomicalObject.objects.filter(
+        descendant_links__descendant=obj, descendant_links__depth__gt=0,
+    ).order_by("-descendant_links__depth")
+
+
+def is_within(obj_id, ancestor_id):
+    """ Returns whether ``obj_id`` is ``ancestor_id`` or one of its descendants"""
+    return ObjectClosure.objects.filter(ancestor_id=ancestor_id, descendant_id=obj_id).exists()
+
+
+def check_parent(obj_id, parent_id):
+    """ Raises ValueError when ``parent_id`` would make the object its own ancestor"""
+    if obj_id is not None and parent_id is not None and is_within(parent_id, obj_id):
+        raise ValueError("An object can't be placed inside itself or one of its members.")
+
+
+def insert(obj_id, parent_id):
+    """ Adds the rows of a new object, call after it was saved"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {_table()} (ancestor_id, descendant_id, depth) "
+            f"SELECT ancestor_id, %s, depth + 1 FROM {_table()} WHERE descendant_id = %s "
+            f"UNION ALL SELECT %s, %s, 0",
+            [obj_id, parent_id, obj_id, obj_id],
+        )
+
+
+def _unlink_subtree(cursor, obj_id, depth):
+    # Deletes the rows from above into the subtree, the rows inside it stay. With depth 0 the subtree
+    # includes the object and "above" are its ancestors, with depth 1 it starts at its children and
+    # "above" includes the object.
+    cursor.execute(
+        f"DELETE FROM {_table()} "
+        f"WHERE descendant_id IN (SELECT descendant_id FROM {_table()} WHERE ancestor_id = %s AND depth >= %s) "
+        f"AND ancestor_id IN (SELECT ancestor_id FROM {_table()} WHERE descendant_id = %s AND depth >= 1 - %s)",
+        [obj_id, depth, obj_id, depth],
+    )
+
+
+@transaction.atomic(savepoint=False)
+def move(obj_id, parent_id):
+    """ Moves the subtree of an object under a new parent (or makes it a root), call after it was saved"""
+    with connection.cursor() as cursor:
+        _unlink_subtree(cursor, obj_id, 0)
+        if parent_id is not None:
+            cursor.execute(
+                f"INSERT INTO {_table()} (ancestor_id, descendant_id, depth) "
+                f"SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1 "
+                f"FROM {_table()} above CROSS JOIN {_table()} below "
+                f"WHERE above.descendant_id = %s AND below.ancestor_id = %s",
+                [parent_id, obj_id],
+            )
+
+
+@transaction.atomic(savepoint=False)
+def detach_children(obj):
+    """ Makes the subtrees below an object roots, call before it is deleted"""
+    # The children's parent is set to NULL by an UPDATE that sends no signals.
+    record_changes(AstronomicalObject, list(obj.children.values_list("pk", flat=True)))
+    with connection.cursor() as cursor:
+        _unlink_subtree(cursor, obj.pk, 1)
+
+
+@transaction.atomic
+def rebuild():
+    """ Recomputes all rows from the objects' parents, returns the number of rows"""
+    parents = dict(AstronomicalObject.objects.values_list("pk", "parent_id").iterator(chunk_size=REBUILD_BATCH_SIZE))
+
+    def rows():
+        for pk in parents:
+            ancestor, depth, seen = pk, 0, set()
+            # A cycle left behind by raw updates stops at the first repeated object.
+            while ancestor is not None and ancestor not in seen:
+                yield ObjectClosure(ancestor_id=ancestor, descendant_id=pk, depth=depth)
+                seen.add(ancestor)
+                ancestor, depth = parents.get(ancestor), depth + 1
+
+    ObjectClosure.objects.all().delete()
+    return len(ObjectClosure.objects.bulk_create(rows(), batch_size=REBUILD_BATCH_SIZE))
@@ -0,0 +1,69 @@
+"""
+The events as an iCalendar (RFC 5545) feed that calendar apps can subscribe to.
+
+Every occurrence is its own all-day VEVENT, recurring events are sent expanded rather than as
+RRULEs so the overrides don't need RECURRENCE-IDs. The UID is the event and the original day of
+the occurrence, so a moved occurrence replaces itself in the subscriber's calendar. The feed is
+built one occurrence at a time from recurrence.Occurrences and streamed in chunks.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+
+PRODID = "-//NebulaNotes//Astronomical Events//EN"
+EVENTS_PER_CHUNK = 100
+LINE_LIMIT = 75
+
+
+def escape(text):
+    """ Escapes a TEXT value (RFC 5545 3.3.11)"""
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n")
+    )
+
+
+def fold(line):
+    """ Splits a content line into lines of at most 75 octets, continuation lines start with a space"""
+    encoded = line.encode()
+    if len(encoded) <= LINE_LIMIT:
+        return line + "\r\n"
+    parts, start, limit = [], 0, LINE_LIMIT
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Don't cut a UTF-8 sequence in half.
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start, limit = end, LINE_LIMIT - 1
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def vevent(occurrence, stamp, domain):
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{occurrence.id}-{occurrence.original_date:%Y%m%d}@{domain}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{occurrence.date:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{occurrence.date + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{escape(occurrence.name)}",
+    ]
+    if occurrence.description:
+        lines.append(f"DESCRIPTION:{escape(occurrence.description)}")
+    lines.append("END:VEVENT")
+    return "".join(fold(line) for line in lines)
+
+
+def feed(occurrences, domain):
+    """ Yields the calendar of ``occurrences`` as bytes, a chunk per EVENTS_PER_CHUNK events"""
+    stamp = f"{timezone.now().astimezone(dt_timezone.utc):%Y%m%dT%H%M%SZ}"
+    yield (fold("BEGIN:VCALENDAR") + fold("VERSION:2.0") + fold(f"PRODID:{PRODID}") + fold("CALSCALE:GREGORIAN")).encode()
+    batch = []
+    for occurrence in occurrences:
+        batch.append(vevent(occurrence, stamp, domain))
+        if len(batch) == EVENTS_PER_CHUNK:
+            yield "".join(batch).encode()
+            batch = []
+    batch.append(fold("END:VCALENDAR"))
+    yield "".join(batch).encode()
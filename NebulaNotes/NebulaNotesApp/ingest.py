@@ -0,0 +1,162 @@
+import json
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from NebulaNotesApp import heatmap, markup
+from NebulaNotesApp.forms import validate_past_date
+from NebulaNotesApp.models import AstronomicalObject, Event, Observation
+from NebulaNotesApp.recommendations import add_observed, observed_objects
+from NebulaNotesApp.sync import record_changes
+
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def _parse_lines(lines):
+    """ Yields (line number, decoded row or error message) for every non-blank NDJSON line"""
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "Each line must be a JSON object."
+            continue
+        yield line_number, row
+
+
+def _clean_row(row, user, objects, events):
+    """ Validates a single decoded row and returns an unsaved Observation or a dict of errors"""
+    errors = {}
+
+    astronomical_object = objects.get(row.get("astronomical_object"))
+    if astronomical_object is None:
+        errors["astronomical_object"] = ["Select a valid astronomical object."]
+
+    event = None
+    if row.get("event") not in (None, ""):
+        event = events.get(row["event"])
+        if event is None:
+            errors["event"] = ["Select a valid event."]
+
+    observation_date = row.get("observation_date")
+    if isinstance(observation_date, str):
+        try:
+            observation_date = parse_datetime(observation_date)
+        except ValueError:
+            observation_date = None
+    else:
+        observation_date = None
+    if observation_date is None:
+        errors["observation_date"] = ["Enter a valid ISO 8601 date and time."]
+    else:
+        if is_naive(observation_date):
+            observation_date = make_aware(observation_date)
+        try:
+            validate_past_date(observation_date)
+        except ValidationError as e:
+            errors["observation_date"] = e.messages
+
+    observation = Observation(
+        user=user,
+        astronomical_object=astronomical_object,
+        event=event,
+        observation_date=observation_date,
+        location=row.get("location") or "",
+        latitude=row.get("latitude"),
+        longitude=row.get("longitude"),
+        notes=row.get("notes") or "",
+    )
+    try:
+        # Foreign keys are excluded because they were already resolved in bulk above.
+        observation.clean_fields(exclude=["user", "astronomical_object", "event", "observation_date"])
+    except ValidationError as e:
+        errors.update(e.message_dict)
+    if errors:
+        return errors
+    # bulk_create sends no pre_save signal, the notes are rendered here.
+    markup.render_instance(observation)
+    return observation
+
+
+def _to_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ingest_batch(batch, user):
+    """ Validates and saves one batch of parsed rows, returns (created count, list of row errors)"""
+    rows = [(line_number, row) for line_number, row in batch if isinstance(row, dict)]
+    errors = [
+        {"line": line_number, "errors": {"__all__": [row]}}
+        for line_number, row in batch if not isinstance(row, dict)
+    ]
+
+    for _, row in rows:
+        row["astronomical_object"] = _to_pk(row.get("astronomical_object"))
+        if row.get("event") not in (None, ""):
+            row["event"] = _to_pk(row.get("event"))
+
+    object_ids = {row["astronomical_object"] for _, row in rows} - {None}
+    event_ids = {row["event"] for _, row in rows if row.get("event") not in (None, "")} - {None}
+    objects = AstronomicalObject.objects.in_bulk(object_ids) if object_ids else {}
+    events = Event.objects.in_bulk(event_ids) if event_ids else {}
+
+    observations = []
+    for line_number, row in rows:
+        result = _clean_row(row, user, objects, events)
+        if isinstance(result, Observation):
+            observations.append(result)
+        else:
+            errors.append({"line": line_number, "errors": result})
+
+    if observations:
+        with transaction.atomic():
+            # bulk_create sends no signals, the co-observation counts are updated here.
+            observed = observed_objects(user.pk)
+            Observation.objects.bulk_create(observations)
+            record_changes(Observation, [observation.pk for observation in observations], user_id=user.pk)
+            add_observed(user.pk, {observation.astronomical_object_id for observation in observations} - observed, others=observed)
+            cells = Counter()
+            for observation in observations:
+                cells.update(heatmap.observation_keys(observation))
+            heatmap.apply(cells)
+
+    return len(observations), errors
+
+
+def ingest_observations(lines, user, batch_size=None):
+    """
+    Bulk-loads observations for ``user`` from an iterable of NDJSON lines.
+
+    Rows are processed in chunks of ``batch_size``: every chunk resolves its object and event
+    references with one query each and is written with a single ``bulk_create`` in its own
+    transaction, so a bad row only shows up in the returned errors instead of aborting the load.
+    """
+    batch_size = batch_size or getattr(settings, "OBSERVATION_INGEST_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    parsed = _parse_lines(lines)
+    created = 0
+    errors = []
+    while True:
+        batch = list(islice(parsed, batch_size))
+        if not batch:
+            break
+        batch_created, batch_errors = _ingest_batch(batch, user)
+        created += batch_created
+        errors.extend(batch_errors)
+    errors.sort(key=lambda error: error["line"])
+    return {"created": created, "errors": errors}
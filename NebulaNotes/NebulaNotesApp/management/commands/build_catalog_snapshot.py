@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from NebulaNotesApp import catalog, versions
+
+
+class Command(BaseCommand):
+    help = "Writes the memory-mapped catalog snapshot, e.g. on deploy before the workers start."
+
+    def handle(self, *args, **options):
+        path = catalog.snapshot_path()
+        count = catalog.build(path, versions.current(catalog.VERSION_KEY))
+        self.stdout.write(f"Wrote {count} objects to {path}.")
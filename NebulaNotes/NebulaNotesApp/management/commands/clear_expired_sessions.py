@@ -0,0 +1,29 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+
+class Command(BaseCommand):
+    help = "Deletes expired sessions in small batches, so the table isn't locked by one long DELETE."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches.")
+
+    def handle(self, *args, **options):
+        cutoff = now()
+        deleted = batches = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            keys = list(
+                Session.objects.filter(expire_date__lt=cutoff).values_list("session_key", flat=True)[:options["batch_size"]]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            batches += 1
+            if options["pause"]:
+                time.sleep(options["pause"])
+        self.stdout.write(f"Deleted {deleted} expired sessions in {batches} batches.")
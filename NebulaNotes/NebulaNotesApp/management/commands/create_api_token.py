@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from NebulaNotesApp import apitokens
+
+
+class Command(BaseCommand):
+    help = "Creates an API token for a user and prints it, it can't be shown again."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--name", default="", help="What the token is for, e.g. the telescope using it.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+        self.stdout.write(apitokens.create_token(user, options["name"] or options["username"]))
@@ -0,0 +1,61 @@
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from NebulaNotesApp.media import blob_fields, recount_blobs
+from NebulaNotesApp.storage import ContentAddressedStorage
+from NebulaNotesApp.sync import record_changes
+
+
+class Command(BaseCommand):
+    help = "Moves files uploaded before ContentAddressedStorage into deduplicated blobs and repoints the rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-originals", action="store_true", help="Leave the old files in place.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report how much space would be saved.")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not a ContentAddressedStorage.")
+
+        blob_names, digests, total, unique = {}, set(), 0, 0
+        for model, field_name in blob_fields():
+            rows = model.objects.exclude(**{f"{field_name}__isnull": True}).exclude(**{field_name: ""})
+            moved = []
+            for pk, name in rows.values_list("pk", field_name).iterator():
+                if ContentAddressedStorage.is_blob(name):
+                    continue
+                if not storage.exists(name):
+                    self.stderr.write(f"Missing file {name} of {model._meta.model_name} #{pk}, skipped.")
+                    continue
+                if name not in blob_names:
+                    total += storage.size(name)
+                    if options["dry_run"]:
+                        digest = hashlib.sha256()
+                        with storage.open(name) as file:
+                            for chunk in file.chunks(ContentAddressedStorage.chunk_size):
+                                digest.update(chunk)
+                        blob_names[name] = digest.hexdigest()
+                    else:
+                        with storage.open(name) as file:
+                            blob_names[name] = storage.save(name, file)
+                    if blob_names[name] not in digests:
+                        digests.add(blob_names[name])
+                        unique += storage.size(name)
+                if not options["dry_run"]:
+                    model.objects.filter(pk=pk).update(**{field_name: blob_names[name]})
+                    moved.append(pk)
+            record_changes(model, moved)
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{len(blob_names)} files would become {len(digests)} blobs, saving {total - unique} bytes."
+            )
+            return
+        recount_blobs(storage)
+        if not options["keep_originals"]:
+            for name in blob_names:
+                storage.delete(name)
+        self.stdout.write(f"Moved {len(blob_names)} files into {len(digests)} blobs, saved {total - unique} bytes.")
@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from NebulaNotesApp.media import recount_blobs
+from NebulaNotesApp.models import Blob
+from NebulaNotesApp.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = "Deletes the stored blobs that no row references anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours", type=float, default=24,
+            help="Keep unreferenced blobs written more recently, their rows may not be saved yet.",
+        )
+        parser.add_argument("--recount", action="store_true", help="Recompute the reference counts first.")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the blobs that would be deleted.")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not a ContentAddressedStorage.")
+        if options["recount"]:
+            recount_blobs(storage)
+
+        cutoff = time.time() - options["grace_hours"] * 3600
+        referenced = set(Blob.objects.filter(refcount__gt=0).values_list("name", flat=True))
+        root = storage.path(ContentAddressedStorage.blob_directory)
+        deleted, freed = [], 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                stat = os.stat(path)
+                if name in referenced or stat.st_mtime >= cutoff:
+                    continue
+                if options["dry_run"]:
+                    self.stdout.write(name)
+                else:
+                    os.unlink(path)
+                deleted.append(name)
+                freed += stat.st_size
+
+        if not options["dry_run"]:
+            Blob.objects.filter(name__in=deleted, refcount=0).delete()
+        action = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{action} {len(deleted)} unreferenced blobs ({freed} bytes).")
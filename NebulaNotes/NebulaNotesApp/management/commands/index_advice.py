@@ -0,0 +1,159 @@
+import hashlib
+import json
+import re
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.migrations.loader import MigrationLoader
+from django.utils.timezone import now
+
+from NebulaNotesApp.models import SlowQuery
+
+
+COLUMN = r'"(?P<table>[^"]+)"\."(?P<column>[^"]+)"'
+EQUALITY = re.compile(COLUMN + r"\s*(?:=|IN\s*\(|IS\s+NULL)", re.IGNORECASE)
+RANGE = re.compile(COLUMN + r"\s*(?:<|>|BETWEEN)", re.IGNORECASE)
+ORDERING = re.compile(COLUMN)
+CLAUSE_END = re.compile(r"\s(?:GROUP BY|ORDER BY|LIMIT|OFFSET|HAVING)\s", re.IGNORECASE)
+
+
+def _clause(sql, keyword):
+    """ Returns the text of the last top-level WHERE or ORDER BY clause of a query"""
+    start = sql.upper().rfind(f" {keyword} ")
+    if start == -1:
+        return ""
+    clause = sql[start + len(keyword) + 2:]
+    end = CLAUSE_END.search(" " + clause + " ")
+    return clause[:end.start()] if end else clause
+
+
+def _unique(items):
+    return list(dict.fromkeys(items))
+
+
+def _walk_plan(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk_plan(child)
+
+
+def parse_plan(plan):
+    """ Returns (tables read with a full scan, whether the query sorts rows) for a stored plan"""
+    try:
+        nodes = [node for root in json.loads(plan) for node in _walk_plan(root["Plan"])]
+    except (ValueError, TypeError, KeyError):
+        # SQLite: "SCAN <table>" without an index and "USE TEMP B-TREE FOR ORDER BY".
+        scanned = set()
+        for line in plan.splitlines():
+            match = re.match(r"\s*SCAN (?:TABLE )?(\S+)", line)
+            if match and "USING" not in line:
+                scanned.add(match.group(1))
+        return scanned, "TEMP B-TREE FOR ORDER BY" in plan
+    scanned = {node["Relation Name"] for node in nodes if node.get("Node Type") == "Seq Scan"}
+    return scanned, any(node.get("Node Type") in ("Sort", "Incremental Sort") for node in nodes)
+
+
+def candidate_indexes(sql, plan):
+    """ Yields (table, columns) for indexes that would let the query avoid a full scan or a sort"""
+    where = _clause(sql, "WHERE")
+    order_by = _clause(sql, "ORDER BY")
+    scanned, sorts = parse_plan(plan)
+
+    tables = {match.group("table") for match in ORDERING.finditer(where + order_by)}
+    for table in tables:
+        equality = _unique(m.group("column") for m in EQUALITY.finditer(where) if m.group("table") == table)
+        ranges = _unique(m.group("column") for m in RANGE.finditer(where) if m.group("table") == table)
+        ordering = _unique(m.group("column") for m in ORDERING.finditer(order_by) if m.group("table") == table)
+        if table in scanned:
+            columns = equality + (ordering or ranges[:1])
+        elif sorts and ordering:
+            columns = equality + ordering
+        else:
+            continue
+        columns = _unique(columns)
+        if columns:
+            yield table, tuple(columns)
+
+
+def _existing_indexes(model):
+    """ Returns the column lists of the indexes the model already has"""
+    opts = model._meta
+    indexes = [[field.column] for field in opts.concrete_fields if field.db_index or field.unique or field.primary_key]
+    indexes += [[opts.get_field(name.lstrip("-")).column for name in index.fields] for index in opts.indexes]
+    indexes += [[opts.get_field(name).column for name in fields] for fields in opts.unique_together]
+    indexes += [
+        [opts.get_field(name).column for name in constraint.fields]
+        for constraint in opts.constraints if getattr(constraint, "fields", None)
+    ]
+    return indexes
+
+
+def _index_name(model_name, fields):
+    base = "_".join([model_name] + list(fields))
+    return f"{base[:21]}_{hashlib.md5(base.encode()).hexdigest()[:4]}_idx"
+
+
+class Command(BaseCommand):
+    help = "Proposes indexes for the slow queries recorded by RequestTimingMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Only use queries recorded in the last DAYS days.")
+        parser.add_argument("--min-queries", type=int, default=1, help="Ignore indexes suggested by fewer queries.")
+
+    def handle(self, *args, **options):
+        models_by_table = {model._meta.db_table: model for model in apps.get_app_config("NebulaNotesApp").get_models()}
+        queries = SlowQuery.objects.all()
+        if options["days"]:
+            queries = queries.filter(created__gte=now() - timedelta(days=options["days"]))
+
+        suggestions = {}
+        analyzed = 0
+        for slow_query in queries.only("sql", "plan", "duration", "view").iterator():
+            analyzed += 1
+            for table, columns in candidate_indexes(slow_query.sql, slow_query.plan):
+                model = models_by_table.get(table)
+                if model is None:
+                    continue
+                if any(existing[:len(columns)] == list(columns) for existing in _existing_indexes(model)):
+                    continue
+                fields_by_column = {field.column: field.name for field in model._meta.concrete_fields}
+                if not all(column in fields_by_column for column in columns):
+                    continue
+                key = (model, tuple(fields_by_column[column] for column in columns))
+                suggestion = suggestions.setdefault(key, {"count": 0, "duration": 0.0, "views": set()})
+                suggestion["count"] += 1
+                suggestion["duration"] += slow_query.duration
+                suggestion["views"].add(slow_query.view)
+
+        suggestions = {
+            key: value for key, value in suggestions.items() if value["count"] >= options["min_queries"]
+        }
+        if not suggestions:
+            self.stdout.write(f"No index suggestions from {analyzed} slow queries.")
+            return
+
+        ranked = sorted(suggestions.items(), key=lambda item: item[1]["duration"], reverse=True)
+        self.stdout.write(f"Suggested indexes from {analyzed} slow queries:\n")
+        for (model, fields), suggestion in ranked:
+            self.stdout.write(
+                f"  {model._meta.model_name} ({', '.join(fields)}): {suggestion['count']} queries, "
+                f"{suggestion['duration']:.0f} ms total, views: {', '.join(sorted(suggestion['views']))}"
+            )
+
+        leaf = MigrationLoader(None, ignore_no_migrations=True).graph.leaf_nodes("NebulaNotesApp")
+        dependencies = "".join(f"        ('{app_label}', '{name}'),\n" for app_label, name in leaf)
+        operations = "".join(
+            f"        migrations.AddIndex(\n"
+            f"            model_name='{model._meta.model_name}',\n"
+            f"            index=models.Index(fields={list(fields)!r}, name='{_index_name(model._meta.model_name, fields)}'),\n"
+            f"        ),\n"
+            for (model, fields), _ in ranked
+        )
+        self.stdout.write(
+            "\nAdd them to the models' Meta.indexes and run makemigrations, the resulting migration will be:\n\n"
+            "from django.db import migrations, models\n\n\n"
+            "class Migration(migrations.Migration):\n\n"
+            f"    dependencies = [\n{dependencies}    ]\n\n"
+            f"    operations = [\n{operations}    ]"
+        )
@@ -0,0 +1,60 @@
+import gzip
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from NebulaNotesApp.partitions import (
+    OBSERVATION_TABLE, detach_partitions, ensure_partitions, is_partitioned, partitions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the observation partitions of the coming periods and detaches or archives old ones. "
+        "Run it daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=2, help="Number of future periods to create partitions for.")
+        parser.add_argument(
+            "--detach-before", type=date.fromisoformat, default=None,
+            help="Detach the partitions that only hold observations older than this date (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--archive-dir", default=None,
+            help="Write detached partitions to gzipped CSV files in this directory and drop them.",
+        )
+        parser.add_argument("--list", action="store_true", help="List the attached partitions.")
+
+    def handle(self, *args, **options):
+        if not is_partitioned(connection):
+            raise CommandError(f"{OBSERVATION_TABLE} is not partitioned, partitioning needs PostgreSQL.")
+        if options["archive_dir"] and not options["detach_before"]:
+            raise CommandError("--archive-dir needs --detach-before.")
+
+        with transaction.atomic():
+            for name in ensure_partitions(connection, ahead=options["ahead"]):
+                self.stdout.write(f"Created {name}")
+
+        if options["detach_before"]:
+            with transaction.atomic():
+                detached = detach_partitions(connection, options["detach_before"])
+            for name in detached:
+                self.stdout.write(f"Detached {name}")
+                if options["archive_dir"]:
+                    self._archive(name, options["archive_dir"])
+
+        if options["list"]:
+            for name, bound in partitions(connection):
+                self.stdout.write(f"{name} {bound}")
+
+    def _archive(self, table, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{table}.csv.gz")
+        quoted = connection.ops.quote_name(table)
+        with transaction.atomic(), connection.cursor() as cursor, gzip.open(path, "wb") as file:
+            cursor.cursor.copy_expert(f"COPY {quoted} TO STDOUT WITH (FORMAT csv, HEADER)", file)
+            cursor.execute(f"DROP TABLE {quoted}")
+        self.stdout.write(f"Archived {table} to {path}")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from NebulaNotesApp import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recomputes the co-observation counts behind the object suggestions from all observations."
+
+    def handle(self, *args, **options):
+        pairs = recommendations.rebuild()
+        method = "SciPy" if recommendations.sparse is not None else "Python"
+        self.stdout.write(f"Stored {pairs} object pairs (counted with {method}).")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from NebulaNotesApp import heatmap
+
+
+class Command(BaseCommand):
+    help = "Recomputes the observation heatmap counts from all observations with coordinates."
+
+    def handle(self, *args, **options):
+        cells = heatmap.rebuild()
+        self.stdout.write(f"Stored {cells} heatmap cells.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from NebulaNotesApp import hierarchy
+
+
+class Command(BaseCommand):
+    help = "Recomputes the object hierarchy closure table from the objects' parents, e.g. after loaddata."
+
+    def handle(self, *args, **options):
+        rows = hierarchy.rebuild()
+        self.stdout.write(f"Stored {rows} object hierarchy rows.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from NebulaNotesApp import markup
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders the Markdown of the descriptions and notes stored by an older renderer version. "
+        "Run it after deploying a new markup.VERSION, until then stale rows are rendered on every view."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=markup.RENDER_BATCH_SIZE, help="Rows per transaction.")
+
+    def handle(self, *args, **options):
+        for model in markup.MARKUP_FIELDS:
+            rendered = markup.rerender(model, batch_size=options["batch_size"])
+            self.stdout.write(f"Rendered {rendered} {model._meta.verbose_name_plural}.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from NebulaNotesApp import backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces all rows of the NebulaNotesApp tables with a snapshot written by `manage.py snapshot`. "
+        "The database has to be migrated to the same migrations as when the snapshot was taken."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory of the snapshot.")
+        parser.add_argument(
+            "--workers", type=int, default=backup.DEFAULT_WORKERS,
+            help="Number of tables loaded at the same time on PostgreSQL, 1 restores in a single transaction.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            counts = backup.restore(options["directory"], workers=options["workers"])
+        except ValueError as error:
+            raise CommandError(error)
+        for table, rows in counts.items():
+            self.stdout.write(f"{table}: {rows} rows")
+        self.stdout.write(f"Restored {len(counts)} tables from {options['directory']}.")
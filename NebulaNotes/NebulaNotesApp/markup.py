@@ -0,0 +1,84 @@
+"""
+Markdown in descriptions and observation notes, rendered to sanitized HTML once per save.
+
+Every model of MARKUP_FIELDS stores the HTML of each source field in ``<field>_html`` next to
+it, together with the VERSION of the renderer that produced it. signals.py renders on save and
+ingest.py renders observations before they are bulk-created, pages show the stored HTML.
+
+Raising VERSION (a new Markdown extension, other allowed tags) makes the stored HTML stale.
+Stale rows are rendered on the fly when shown, without saving, until
+``manage.py render_markup`` re-renders them in batches. The migration adding the fields leaves
+all rows at version 0, so the command also renders the existing rows after it.
+"""
+import markdown
+import nh3
+from markdown.extensions.tables import TableExtension
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+from NebulaNotesApp.models import AstronomicalObject, Event, Galaxy, Observation
+
+
+VERSION = 2
+MARKUP_FIELDS = {
+    Galaxy: ("description",),
+    AstronomicalObject: ("description",),
+    Event: ("description",),
+    Observation: ("notes",),
+}
+# Column alignment as the align attribute, style attributes aren't allowed.
+EXTENSIONS = ["sane_lists", "nl2br", TableExtension(use_align_attribute=True)]
+ALLOWED_TAGS = {
+    "p", "br", "hr", "a", "strong", "em", "code", "pre", "blockquote",
+    "ul", "ol", "li", "h3", "h4", "h5", "h6", "table", "thead", "tbody", "tr", "th", "td",
+}
+ALLOWED_ATTRIBUTES = {"a": {"href", "title"}, "th": {"align"}, "td": {"align"}}
+RENDER_BATCH_SIZE = 500
+
+
+def render(text):
+    """ Returns the sanitized HTML of a Markdown text, links get rel="nofollow noopener" """
+    if not text:
+        return ""
+    return nh3.clean(
+        markdown.markdown(text, extensions=EXTENSIONS),
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        url_schemes={"http", "https", "mailto"},
+        link_rel="nofollow noopener",
+    )
+
+
+def render_instance(instance):
+    """ Renders the markup fields of an unsaved instance"""
+    for field in MARKUP_FIELDS[type(instance)]:
+        setattr(instance, f"{field}_html", render(getattr(instance, field)))
+    instance.markup_version = VERSION
+
+
+def html(instance, field):
+    """ Returns the HTML of a markup field, the stored one unless it was rendered by an older version"""
+    if instance.markup_version == VERSION:
+        return mark_safe(getattr(instance, f"{field}_html"))
+    return mark_safe(render(getattr(instance, field)))
+
+
+def stale(model):
+    return model.objects.exclude(markup_version=VERSION)
+
+
+def rerender(model, batch_size=RENDER_BATCH_SIZE):
+    """ Re-renders the rows of ``model`` rendered by another version, a batch per transaction, returns the number of rows"""
+    fields = MARKUP_FIELDS[model]
+    html_fields = [f"{field}_html" for field in fields]
+    rendered = 0
+    while True:
+        # Every batch leaves the stale rows, so the next one starts from the beginning again.
+        batch = list(stale(model).only("pk", *fields).order_by("pk")[:batch_size])
+        if not batch:
+            return rendered
+        for instance in batch:
+            render_instance(instance)
+        with transaction.atomic():
+            model.objects.bulk_update(batch, html_fields + ["markup_version"])
+        rendered += len(batch)
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, FileField
+
+from NebulaNotesApp.models import Blob
+from NebulaNotesApp.storage import ContentAddressedStorage
+
+
+def blob_fields():
+    """ Returns (model, field name) for every file field of the app stored by ContentAddressedStorage"""
+    return [
+        (model, field.name)
+        for model in apps.get_app_config("NebulaNotesApp").get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def add_reference(storage, name):
+    """ Counts one more row using the blob ``name``, files stored before deduplication are ignored"""
+    if not ContentAddressedStorage.is_blob(name):
+        return
+    blob, created = Blob.objects.get_or_create(
+        name=name, defaults={"refcount": 1, "size": storage.size(name) if storage.exists(name) else 0}
+    )
+    if not created:
+        Blob.objects.filter(pk=blob.pk).update(refcount=F("refcount") + 1)
+
+
+def remove_reference(name):
+    """ Counts one row less using the blob ``name``, the file itself is left for gc_media"""
+    if ContentAddressedStorage.is_blob(name):
+        Blob.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+
+
+def referenced_names():
+    """ Returns how many rows use every stored file name"""
+    references = Counter()
+    for model, field_name in blob_fields():
+        names = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+        references.update(names.values_list(field_name, flat=True).iterator())
+    return references
+
+
+@transaction.atomic
+def recount_blobs(storage):
+    """ Recomputes every Blob's reference count from the file fields, for repairs and bulk updates"""
+    references = {name: count for name, count in referenced_names().items() if ContentAddressedStorage.is_blob(name)}
+    existing = {blob.name: blob for blob in Blob.objects.all()}
+    changed = []
+    for name, blob in existing.items():
+        if blob.refcount != references.get(name, 0):
+            blob.refcount = references.get(name, 0)
+            changed.append(blob)
+    Blob.objects.bulk_update(changed, ["refcount"], batch_size=500)
+    Blob.objects.bulk_create(
+        [
+            Blob(name=name, refcount=count, size=storage.size(name) if storage.exists(name) else 0)
+            for name, count in references.items() if name not in existing
+        ],
+        batch_size=500,
+    )
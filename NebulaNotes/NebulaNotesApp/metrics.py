@@ -0,0 +1,217 @@
+"""
+Prometheus metrics of the requests, exported by MetricsView at /metrics.
+
+Every process keeps its values in memory. With several workers (gunicorn) a scrape reaches one
+of them, so with METRICS_DIR set every process also writes its values to its own file in that
+directory, at most every FLUSH_INTERVAL seconds, and /metrics exports the sum of all files (the
+other workers' values can be up to FLUSH_INTERVAL old).
+A file outlives its process so counters don't go back when a worker is restarted, the
+directory should be emptied when the application is (re)started, like prometheus_client's
+multiprocess directory. Without METRICS_DIR only the scraped process's own values are exported.
+"""
+import atexit
+import json
+import os
+import threading
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+from time import monotonic
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 1.0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+def metrics_dir():
+    return getattr(settings, "METRICS_DIR", "")
+
+
+class Metric:
+    """ Base class of the metrics, the values of this process are summed with the other workers' by Registry"""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _changed(self):
+        if self.registry is not None:
+            self.registry.flush()
+
+    def values(self):
+        """ Returns {label values: value} of this process"""
+        with self._lock:
+            return {key: self._snapshot(value) for key, value in self._values.items()}
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        values = self.values() if values is None else values
+        for key, value in sorted(values.items()):
+            lines.extend(self._render_samples(list(zip(self.labelnames, key)), value))
+        return "\n".join(lines)
+
+    def _snapshot(self, value):
+        return value
+
+    def merge(self, value, other):
+        return value + other
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._changed()
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, labels, value):
+        yield f"{self.name}_total{_format_labels(labels)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+        self._changed()
+
+    def _snapshot(self, value):
+        return list(value[0]), value[1]
+
+    def merge(self, value, other):
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def _render_samples(self, labels, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+        yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    """ The exported metrics, written to a file of METRICS_DIR per process and summed over the files when rendered"""
+
+    def __init__(self):
+        self._metrics = {}
+        # The pid alone could be reused by a later worker, whose values would replace the dead one's.
+        self.filename = f"{os.getpid()}-{uuid.uuid4().hex}.json"
+        self._flushed = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        metric = self._metrics.setdefault(metric.name, metric)
+        metric.registry = self
+        return metric
+
+    def flush(self, force=False):
+        """ Writes this process's values to its file in METRICS_DIR, at most every FLUSH_INTERVAL unless forced"""
+        directory = metrics_dir()
+        if not directory:
+            return
+        now = monotonic()
+        if not force and self._flushed is not None and now - self._flushed < FLUSH_INTERVAL:
+            return
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._flushed = now
+            state = {
+                name: [[list(key), value] for key, value in metric.values().items()]
+                for name, metric in self._metrics.items()
+            }
+            path = Path(directory) / self.filename
+            temporary = path.with_suffix(".tmp")
+            temporary.write_text(json.dumps(state))
+            os.replace(temporary, path)
+        finally:
+            self._flush_lock.release()
+
+    def _collect(self):
+        """ Returns {metric name: {label values: value}} summed over the files of all processes"""
+        self.flush(force=True)
+        collected = {name: {} for name in self._metrics}
+        for path in Path(metrics_dir()).glob("*.json"):
+            try:
+                state = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Removed or replaced while it was read.
+                continue
+            for name, samples in state.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                values = collected[name]
+                for key, value in samples:
+                    key = tuple(key)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+        return collected
+
+    def render(self):
+        if not metrics_dir():
+            return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+        collected = self._collect()
+        return "\n".join(metric.render(collected[name]) for name, metric in self._metrics.items()) + "\n"
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush, force=True)
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "nebulanotes_request_duration_seconds",
+    "Time spent handling requests, split into the total, view, database and template phases.",
+    ["view", "phase"],
+))
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    "nebulanotes_request_queries",
+    "Number of database queries run by a request.",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+))
+RATE_LIMITED = REGISTRY.register(Counter(
+    "nebulanotes_rate_limited_requests",
+    "Requests rejected with 429 by RateLimitMiddleware.",
+    ["view", "key"],
+))
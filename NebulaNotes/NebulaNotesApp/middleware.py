@@ -0,0 +1,221 @@
+import math
+import os
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+from django.utils._os import safe_join
+
+from NebulaNotesApp import apitokens, profiling, slow_queries
+from NebulaNotesApp.fileserving import serve_precompressed
+from NebulaNotesApp.metrics import RATE_LIMITED, REQUEST_DURATION, REQUEST_QUERIES
+from NebulaNotesApp.ratelimit import Rule
+
+
+class ApiTokenMiddleware:
+    """
+    Authenticates requests that send an API token, see NebulaNotesApp/apitokens.py.
+
+    It goes right after AuthenticationMiddleware. Bearer tokens without the API token prefix (the
+    /metrics scraper's) aren't looked up, an unknown token leaves the request as it is.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = apitokens.bearer_token(request)
+        user = apitokens.authenticate(key) if key else None
+        if user is not None:
+            request.user = user
+            request.api_token_user = True
+        return self.get_response(request)
+
+
+class RequestTiming:
+    """ Collects the timings of a single request"""
+
+    def __init__(self, slow_query_threshold=None):
+        self.start = perf_counter()
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_queries = []
+        self.db_time = 0.0
+        self.queries = 0
+        self.view_start = None
+        self.view_time = None
+        self.template_start = None
+        self.template_time = None
+        self.template_name = ""
+
+    def record_query(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.db_time += duration
+            self.queries += 1
+            if self.slow_query_threshold is not None and duration >= self.slow_query_threshold and not many:
+                self.slow_queries.append((sql, params, duration))
+
+    def template_rendered(self, response):
+        self.template_time = perf_counter() - self.template_start
+
+    def server_timing(self, total):
+        metrics = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        if self.view_time is not None:
+            metrics.append(f"view;dur={self.view_time * 1000:.1f}")
+        if self.template_time is not None:
+            metrics.append(f'tpl;dur={self.template_time * 1000:.1f};desc="{self.template_name}"')
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+class RequestTimingMiddleware:
+    """
+    Reports where a request spent its time in a ``Server-Timing`` header and in the ``/metrics`` histograms,
+    and stores queries slower than SLOW_QUERY_THRESHOLD_MS with their plans for ``manage.py index_advice``.
+
+    The view phase lasts until the view returns, the template phase covers the rendering of a
+    TemplateResponse (the page template together with the base templates it extends).
+    It should be the last entry of MIDDLEWARE so the view phase doesn't include other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = request.timing = RequestTiming(slow_queries.threshold())
+        with connection.execute_wrapper(timing.record_query):
+            response = self.get_response(request)
+        end = perf_counter()
+        total = end - timing.start
+        if timing.view_start is not None and timing.view_time is None:
+            timing.view_time = end - timing.view_start
+
+        response["Server-Timing"] = timing.server_timing(total)
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unresolved"
+        REQUEST_DURATION.observe(total, view=view, phase="total")
+        REQUEST_DURATION.observe(timing.db_time, view=view, phase="db")
+        if timing.view_time is not None:
+            REQUEST_DURATION.observe(timing.view_time, view=view, phase="view")
+        if timing.template_time is not None:
+            REQUEST_DURATION.observe(timing.template_time, view=view, phase="template")
+        REQUEST_QUERIES.observe(timing.queries, view=view)
+
+        if timing.slow_queries:
+            slow_queries.record(view if match else request.path, timing.slow_queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timing.view_start = perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = request.timing
+        timing.template_start = perf_counter()
+        if timing.view_start is not None:
+            timing.view_time = timing.template_start - timing.view_start
+        names = [response.template_name] if isinstance(response.template_name, str) else list(response.template_name or [])
+        timing.template_name = names[0] if names and isinstance(names[0], str) else ""
+        response.add_post_render_callback(timing.template_rendered)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the memory use of the requests picked by profiling.trigger(), see NebulaNotesApp/profiling.py.
+
+    Unused unless PROFILING_ENABLED. It goes after AuthenticationMiddleware, which the profiling
+    header needs, and right before RequestTimingMiddleware so the view phase is just the view.
+    """
+
+    def __init__(self, get_response):
+        if not profiling.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger, call_tree = profiling.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return profiling.profile_request(self.get_response, request, trigger, call_tree)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(request, "profile", None):
+            request.profile.start_phase("view")
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, "profile", None)
+        if profile:
+            profile.start_phase("template")
+            response.add_post_render_callback(lambda response: profile.end_phase())
+        return response
+
+
+class StaticAssetsMiddleware:
+    """
+    Serves the files collected into STATIC_ROOT when no front-end server does.
+
+    Content-hashed names are cached for a year as immutable, and the precompressed
+    variants written by StaticAssetsStorage are sent to clients that accept them.
+    The development server serves static files itself, so this is off with DEBUG.
+    """
+    immutable = "public, max-age=31536000, immutable"
+    revalidate = "public, max-age=0, must-revalidate"
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith("/") else "/" + settings.STATIC_URL
+        self.hashed_names = set(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix) or request.method not in ("GET", "HEAD"):
+            return self.get_response(request)
+        name = request.path_info[len(self.prefix):]
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return self.get_response(request)
+        if not os.path.isfile(path):
+            return self.get_response(request)
+        cache_control = self.immutable if name in self.hashed_names else self.revalidate
+        return serve_precompressed(request, path, cache_control)
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests over the RATE_LIMITS of their route with 429 and a Retry-After header.
+
+    Routes without a rule cost one dict lookup. The buckets live in this process
+    (LocalBuckets) or in the configured cache (CacheBuckets), see RATE_LIMIT_BACKEND.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = {route: Rule(route, **options) for route, options in getattr(settings, "RATE_LIMITS", {}).items()}
+        if not self.rules:
+            raise MiddlewareNotUsed
+        self.buckets = import_string(getattr(settings, "RATE_LIMIT_BACKEND", "NebulaNotesApp.ratelimit.LocalBuckets"))()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rule = self.rules.get(request.resolver_match.url_name)
+        if rule is None or (rule.methods and request.method not in rule.methods):
+            return None
+        wait = self.buckets.take(rule, rule.bucket(request))
+        if not wait:
+            return None
+        RATE_LIMITED.inc(view=rule.route, key=rule.key)
+        response = HttpResponse("Too many requests, please try again later.", status=429, content_type="text/plain")
+        response["Retry-After"] = max(1, math.ceil(wait))
+        return response
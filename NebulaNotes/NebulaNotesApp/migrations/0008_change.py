@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0007_astronomicalobject_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id'], name='NebulaNotes_model_7e7222_idx')],
+            },
+        ),
+    ]
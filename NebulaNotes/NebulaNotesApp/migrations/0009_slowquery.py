@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0008_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True)),
+                ('duration', models.FloatField(help_text='in milliseconds')),
+                ('plan', models.TextField(blank=True)),
+                ('view', models.CharField(blank=True, max_length=255)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+from NebulaNotesApp.partitions import partition_table, unpartition_table
+
+
+def partition_observations(apps, schema_editor):
+    # Only PostgreSQL supports declarative partitioning, the table stays as it is elsewhere.
+    partition_table(schema_editor.connection)
+
+
+def unpartition_observations(apps, schema_editor):
+    unpartition_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0010_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_observations, unpartition_observations),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(fields=['user', 'observation_date'], name='NebulaNotes_user_id_d329e2_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0011_observation_partitions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
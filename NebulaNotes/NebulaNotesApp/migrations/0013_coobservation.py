@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0012_event_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='NebulaNotesApp.astronomicalobject')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='NebulaNotesApp.astronomicalobject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['object', '-count'], name='NebulaNotes_object__6c2531_idx')],
+                'constraints': [models.UniqueConstraint(fields=('object', 'other'), name='unique_coobservation_pair')],
+            },
+        ),
+    ]
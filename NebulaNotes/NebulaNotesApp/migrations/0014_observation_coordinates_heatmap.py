@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:20
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0013_coobservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observation',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='observation',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.CreateModel(
+            name='HeatmapCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quadkey', models.CharField(max_length=16)),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('month', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('object_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='NebulaNotesApp.astronomicalobjecttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['zoom', 'quadkey'], name='NebulaNotes_zoom_121861_idx')],
+                'constraints': [models.UniqueConstraint(fields=('quadkey', 'object_type', 'month'), name='unique_heatmap_cell')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_self_links(apps, schema_editor):
+    # Every existing object is a root, its only closure row links it to itself.
+    AstronomicalObject = apps.get_model("NebulaNotesApp", "AstronomicalObject")
+    ObjectClosure = apps.get_model("NebulaNotesApp", "ObjectClosure")
+    ObjectClosure.objects.bulk_create(
+        (ObjectClosure(ancestor_id=pk, descendant_id=pk, depth=0) for pk in AstronomicalObject.objects.values_list("pk", flat=True).iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0014_observation_coordinates_heatmap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='astronomicalobject',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='NebulaNotesApp.astronomicalobject'),
+        ),
+        migrations.CreateModel(
+            name='ObjectClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='NebulaNotesApp.astronomicalobject')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='NebulaNotesApp.astronomicalobject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='NebulaNotes_descend_12a9d7_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_object_closure_pair')],
+            },
+        ),
+        migrations.RunPython(add_self_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0015_object_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=2000)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('trigger', models.CharField(help_text='header or sample', max_length=10)),
+                ('duration', models.FloatField(help_text='in milliseconds')),
+                ('peak_memory', models.BigIntegerField(help_text='traced bytes above the start of the request')),
+                ('phases', models.JSONField(default=dict)),
+                ('call_tree', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:46
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0017_rendered_markup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='repeat',
+            field=models.CharField(blank=True, choices=[('', 'Does not repeat'), ('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], db_index=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='repeat_interval',
+            field=models.PositiveSmallIntegerField(default=1, help_text='every how many days, weeks, months or years', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='repeat_until',
+            field=models.DateField(blank=True, help_text='the last day it can occur, empty for no end', null=True),
+        ),
+        migrations.CreateModel(
+            name='OccurrenceOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_date', models.DateField()),
+                ('cancelled', models.BooleanField(default=False)),
+                ('date', models.DateField(blank=True, help_text="the day it moved to, empty when it didn't move", null=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overrides', to='NebulaNotesApp.event')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('event', 'original_date'), name='unique_occurrence_override')],
+            },
+        ),
+    ]
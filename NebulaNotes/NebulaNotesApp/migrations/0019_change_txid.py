@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NebulaNotesApp', '0018_recurring_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='txid',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['txid', 'id'], name='NebulaNotes_txid_9b717c_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -15,6 +17,8 @@ class Galaxy(models.Model):
     name = models.CharField(max_length=100, unique=True)
     type = models.CharField(max_length=50, choices=TYPE_CHOICES)
     description = models.TextField(blank=True)
+    description_html = models.TextField(blank=True, editable=False)
+    markup_version = models.PositiveSmallIntegerField(default=0, editable=False)
     image = models.ImageField(upload_to="galaxy_images/", blank=True, null=True)
 
     def __str__(self):
@@ -34,31 +38,237 @@ class AstronomicalObject(models.Model):
     type = models.ForeignKey(AstronomicalObjectType, on_delete=models.CASCADE)
     distance_from_earth = models.FloatField(help_text="in light years")
     description = models.TextField(blank=True)
+    description_html = models.TextField(blank=True, editable=False)
+    markup_version = models.PositiveSmallIntegerField(default=0, editable=False)
     image = models.ImageField(upload_to="astronomy_images/", blank=True, null=True)
     discovery_year = models.IntegerField(null=True, blank=True)
     galaxy = models.ForeignKey(Galaxy, on_delete=models.SET_NULL, null=True, blank=True)
+    # The star system of a planet, the planet of a moon, the cluster of a star. See NebulaNotesApp/hierarchy.py.
+    parent = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True, related_name="children")
 
     def __str__(self):
         return f"{self.name} ({self.type})"
 
+    def clean(self):
+        # Every model form (the site's and the admin's) rejects a parent inside the object's own subtree.
+        if self.pk is not None and self.parent_id is not None and ObjectClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=self.parent_id,
+        ).exists():
+            raise ValidationError({"parent": "An object can't be placed inside itself or one of its members."})
+
 
 class Event(models.Model):
-    name = models.CharField(max_length=100)
+    REPEAT_CHOICES = [
+        ("", "Does not repeat"),
+        ("daily", "Daily"),
+        ("weekly", "Weekly"),
+        ("monthly", "Monthly"),
+        ("yearly", "Yearly"),
+    ]
+    name = models.CharField(max_length=100, db_index=True)
+    # The day of a one-off event, the first occurrence of a recurring one.
     date = models.DateField()
     description = models.TextField()
+    description_html = models.TextField(blank=True, editable=False)
+    markup_version = models.PositiveSmallIntegerField(default=0, editable=False)
     related_objects = models.ManyToManyField(AstronomicalObject, blank=True)
+    # Occurrences are expanded when listed (NebulaNotesApp/recurrence.py), only overrides are stored.
+    repeat = models.CharField(max_length=10, choices=REPEAT_CHOICES, blank=True, default="", db_index=True)
+    repeat_interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)], help_text="every how many days, weeks, months or years")
+    repeat_until = models.DateField(null=True, blank=True, help_text="the last day it can occur, empty for no end")
 
     def __str__(self):
         return f"{self.name} - {self.date}"
 
 
+class OccurrenceOverride(models.Model):
+    """ A cancelled, moved or renamed occurrence of a recurring event, the occurrence is the one on ``original_date``"""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="overrides")
+    original_date = models.DateField()
+    cancelled = models.BooleanField(default=False)
+    date = models.DateField(null=True, blank=True, help_text="the day it moved to, empty when it didn't move")
+    name = models.CharField(max_length=100, blank=True)
+    description = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "original_date"], name="unique_occurrence_override"),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} on {self.original_date}"
+
+
 class Observation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     astronomical_object = models.ForeignKey(AstronomicalObject, on_delete=models.CASCADE)
     event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True)
     observation_date = models.DateTimeField()
     location = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
     notes = models.TextField(blank=True)
+    notes_html = models.TextField(blank=True, editable=False)
+    markup_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Observations are read per user and date range, on PostgreSQL inside the pruned partitions.
+            models.Index(fields=["user", "observation_date"]),
+        ]
 
     def __str__(self):
         return f"Observation of  {self.astronomical_object.name} {self.event.name} made by {self.user.username}"
+
+
+class Change(models.Model):
+    """
+    An entry of the change log used by offline clients to sync, ordered by (txid, primary key).
+
+    Only the latest change of every row is kept, so the log grows with the number of rows and
+    tombstones rather than with the number of edits.
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    # Plain integer instead of a foreign key, tombstones must outlive the user they belonged to.
+    user_id = models.BigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    # PostgreSQL transaction id of the write, 0 elsewhere. See sync.changes_since.
+    txid = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["model", "object_id"]),
+            models.Index(fields=["txid", "id"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.model} {self.object_id}{' (deleted)' if self.deleted else ''}"
+
+
+class SlowQuery(models.Model):
+    """ A query that took longer than SLOW_QUERY_THRESHOLD_MS, together with its execution plan"""
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    duration = models.FloatField(help_text="in milliseconds")
+    plan = models.TextField(blank=True)
+    view = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.duration:.0f} ms in {self.view}"
+
+
+class Blob(models.Model):
+    """ An uploaded file stored once by ContentAddressedStorage, with the number of rows using it"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
+class CoObservation(models.Model):
+    """
+    The number of users who observed both ``object`` and ``other``, stored for both orders of every pair.
+
+    Kept up to date by NebulaNotesApp/recommendations.py as observations are saved and deleted,
+    ``manage.py rebuild_coobservations`` recomputes the whole table.
+    """
+    object = models.ForeignKey(AstronomicalObject, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(AstronomicalObject, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["object", "other"], name="unique_coobservation_pair"),
+        ]
+        indexes = [
+            # The top neighbours of an object are the first rows of this index.
+            models.Index(fields=["object", "-count"]),
+        ]
+
+    def __str__(self):
+        return f"{self.object_id} & {self.other_id}: {self.count}"
+
+
+class HeatmapCell(models.Model):
+    """
+    The number of observations of one object type in one month made inside a map cell.
+
+    Cells are Web Mercator tiles named by their quadkey, see NebulaNotesApp/heatmap.py.
+    """
+    quadkey = models.CharField(max_length=16)
+    zoom = models.PositiveSmallIntegerField()
+    object_type = models.ForeignKey(AstronomicalObjectType, on_delete=models.CASCADE, related_name="+")
+    month = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["quadkey", "object_type", "month"], name="unique_heatmap_cell"),
+        ]
+        indexes = [
+            # The cells of a tile are a quadkey range at one zoom level.
+            models.Index(fields=["zoom", "quadkey"]),
+        ]
+
+    def __str__(self):
+        return f"{self.quadkey} {self.month:%Y-%m}: {self.count}"
+
+
+class ObjectClosure(models.Model):
+    """
+    A pair of an astronomical object and one of its descendants ``depth`` levels below it, every object is its own descendant at depth 0.
+
+    Kept up to date by NebulaNotesApp/hierarchy.py as objects are saved and deleted,
+    ``manage.py rebuild_object_closure`` recomputes the whole table.
+    """
+    ancestor = models.ForeignKey(AstronomicalObject, on_delete=models.CASCADE, related_name="descendant_links")
+    descendant = models.ForeignKey(AstronomicalObject, on_delete=models.CASCADE, related_name="ancestor_links")
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            # The subtree of an object is a range of this index.
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="unique_object_closure_pair"),
+        ]
+        indexes = [
+            # The ancestors of an object, nearest first.
+            models.Index(fields=["descendant", "depth"]),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
+class ProfileReport(models.Model):
+    """ Memory allocations (and optionally the call tree) of one profiled request, see NebulaNotesApp/profiling.py"""
+    view = models.CharField(max_length=255)
+    path = models.CharField(max_length=2000)
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    trigger = models.CharField(max_length=10, help_text="header or sample")
+    duration = models.FloatField(help_text="in milliseconds")
+    peak_memory = models.BigIntegerField(help_text="traced bytes above the start of the request")
+    # {"view": {...}, "template": {...}, "orm": {...}}, the phases with their peaks and top allocation sites.
+    phases = models.JSONField(default=dict)
+    call_tree = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path}: {self.peak_memory / 1048576:.1f} MiB peak"
+
+
+class ApiToken(models.Model):
+    """ A key scripts and telescopes send instead of a session cookie, only its SHA-256 is stored, see NebulaNotesApp/apitokens.py"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="api_tokens")
+    name = models.CharField(max_length=100, help_text="what the token is for, e.g. the telescope using it")
+    key_hash = models.CharField(max_length=64, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.user})"
@@ -0,0 +1,227 @@
+"""
+PostgreSQL range partitioning of the observation table by observation_date.
+
+The table is converted by migration 0011 and stays a plain table on other databases, every
+function here returns without doing anything there. Partitions are yearly or monthly
+(OBSERVATION_PARTITION_INTERVAL) and named ``<table>_y2025`` or ``<table>_y2025m04``, rows
+outside of them land in ``<table>_default``. ``manage.py observation_partitions`` creates
+partitions ahead of time and detaches or archives old ones.
+
+PostgreSQL requires the partition key in the primary key, so the table's primary key is
+(id, observation_date). Ids still come from one sequence and stay unique, which is what
+Django relies on, but nothing can reference observations with a foreign key.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+
+OBSERVATION_TABLE = "NebulaNotesApp_observation"
+PARTITION_KEY = "observation_date"
+DEFAULT_INTERVAL = "year"
+
+
+def interval():
+    value = getattr(settings, "OBSERVATION_PARTITION_INTERVAL", DEFAULT_INTERVAL)
+    if value not in ("year", "month"):
+        raise ValueError(f"OBSERVATION_PARTITION_INTERVAL must be 'year' or 'month', not {value!r}")
+    return value
+
+
+def period_start(day, period):
+    return date(day.year, 1, 1) if period == "year" else date(day.year, day.month, 1)
+
+
+def next_period(start, period):
+    if period == "year":
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, period, table=OBSERVATION_TABLE):
+    return f"{table}_y{start.year}" if period == "year" else f"{table}_y{start.year}m{start.month:02d}"
+
+
+def _bound(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def date_range(since=None, until=None):
+    """
+    Returns observation_date lookups for the days from ``since`` to ``until``, both included.
+
+    Plain comparisons on the column (no ``__date`` cast) are what lets PostgreSQL skip the
+    partitions outside the range.
+    """
+    lookups = {}
+    if since:
+        lookups[f"{PARTITION_KEY}__gte"] = timezone.make_aware(datetime.combine(since, time.min))
+    if until:
+        lookups[f"{PARTITION_KEY}__lt"] = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min))
+    return lookups
+
+
+def _quote(connection, name):
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned(connection, table=OBSERVATION_TABLE):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(connection, table=OBSERVATION_TABLE):
+    """ Returns [(name, bound)] of the attached partitions, bound is e.g. "FOR VALUES FROM (...) TO (...)" """
+    if not is_partitioned(connection, table):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid) ORDER BY child.relname",
+            [table],
+        )
+        return cursor.fetchall()
+
+
+def _definitions(cursor, table):
+    """ Returns the CREATE INDEX statements and foreign key definitions of a table, without its primary key"""
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes i JOIN pg_class c ON c.relname = i.indexname "
+        "JOIN pg_index x ON x.indexrelid = c.oid WHERE i.tablename = %s AND NOT x.indisprimary",
+        [table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [f'"{table}"'],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _rebuild(connection, table, partition_by=None):
+    """
+    Recreates ``table`` with the same columns, indexes and foreign keys and copies its rows.
+
+    With ``partition_by`` the new table is partitioned and gets a default partition, without it
+    the table becomes a plain table again with ``id`` as its primary key.
+    """
+    old = f"{table}_old"
+    sequence = f"{table}_id_seq"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {_quote(connection, table)} RENAME TO {_quote(connection, old)}")
+        indexes, foreign_keys = _definitions(cursor, old)
+        cursor.execute(
+            f"CREATE TABLE {_quote(connection, table)} (LIKE {_quote(connection, old)} INCLUDING DEFAULTS)"
+            + (f" PARTITION BY {partition_by}" if partition_by else "")
+        )
+        if partition_by:
+            cursor.execute(
+                f"CREATE TABLE {_quote(connection, table + '_default')} PARTITION OF {_quote(connection, table)} DEFAULT"
+            )
+        cursor.execute(f"INSERT INTO {_quote(connection, table)} SELECT * FROM {_quote(connection, old)}")
+        # Dropping the old table first frees the names of its constraints, indexes and sequence.
+        cursor.execute(f"DROP TABLE {_quote(connection, old)} CASCADE")
+        primary_key = f"id, {_quote(connection, PARTITION_KEY)}" if partition_by else "id"
+        cursor.execute(f"ALTER TABLE {_quote(connection, table)} ADD PRIMARY KEY ({primary_key})")
+        for _, definition in indexes:
+            cursor.execute(definition.replace(f'"{old}"', f'"{table}"'))
+        for name, definition in foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {_quote(connection, table)} ADD CONSTRAINT {_quote(connection, name)} {definition}"
+            )
+        cursor.execute(f"CREATE SEQUENCE {_quote(connection, sequence)} OWNED BY {_quote(connection, table)}.id")
+        cursor.execute(
+            f"SELECT setval(%s, COALESCE((SELECT MAX(id) FROM {_quote(connection, table)}), 0) + 1, false)",
+            [f'"{sequence}"'],
+        )
+        cursor.execute(
+            f"ALTER TABLE {_quote(connection, table)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)",
+            [f'"{sequence}"'],
+        )
+
+
+def partition_table(connection, table=OBSERVATION_TABLE, ahead=1):
+    """ Converts the table to a range-partitioned one and creates partitions for its existing rows"""
+    if connection.vendor != "postgresql" or is_partitioned(connection, table):
+        return
+    _rebuild(connection, table, partition_by=f"RANGE ({_quote(connection, PARTITION_KEY)})")
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({_quote(connection, PARTITION_KEY)}) FROM {_quote(connection, table)}")
+        oldest = cursor.fetchone()[0]
+    ensure_partitions(connection, table, ahead=ahead, since=oldest.date() if oldest else None)
+
+
+def unpartition_table(connection, table=OBSERVATION_TABLE):
+    """ Turns the partitioned table back into a plain table, the reverse of partition_table()"""
+    if is_partitioned(connection, table):
+        _rebuild(connection, table)
+
+
+def ensure_partitions(connection, table=OBSERVATION_TABLE, ahead=1, since=None):
+    """
+    Creates the missing partitions from ``since`` (default: today) up to ``ahead`` periods from now.
+
+    Rows already stored in the default partition for a new range are moved into it, so this
+    can also be run after data arrived early. Returns the names of the created partitions.
+    """
+    if not is_partitioned(connection, table):
+        return []
+    period = interval()
+    existing = {name for name, _ in partitions(connection, table)}
+    today = timezone.now().date()
+    start = period_start(since or today, period)
+    last = period_start(today, period)
+    for _ in range(ahead):
+        last = next_period(last, period)
+
+    created = []
+    with connection.cursor() as cursor:
+        while start <= last:
+            end = next_period(start, period)
+            name = partition_name(start, period, table)
+            if name not in existing:
+                key = _quote(connection, PARTITION_KEY)
+                cursor.execute(
+                    f"CREATE TABLE {_quote(connection, name)} (LIKE {_quote(connection, table)} INCLUDING DEFAULTS)"
+                )
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {_quote(connection, table + '_default')} "
+                    f"WHERE {key} >= %s AND {key} < %s RETURNING *) "
+                    f"INSERT INTO {_quote(connection, name)} SELECT * FROM moved",
+                    [_bound(start), _bound(end)],
+                )
+                cursor.execute(
+                    f"ALTER TABLE {_quote(connection, table)} ATTACH PARTITION {_quote(connection, name)} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [_bound(start), _bound(end)],
+                )
+                created.append(name)
+            start = end
+    return created
+
+
+def detach_partitions(connection, before, table=OBSERVATION_TABLE):
+    """ Detaches the partitions that only hold rows older than ``before``, they stay as standalone tables"""
+    detached = []
+    with connection.cursor() as cursor:
+        for name, _ in partitions(connection, table):
+            if name == f"{table}_default":
+                continue
+            suffix = name[len(table) + 2:]
+            year, _, month = suffix.partition("m")
+            start = date(int(year), int(month or 1), 1)
+            if next_period(start, "month" if month else "year") > before:
+                continue
+            cursor.execute(f"ALTER TABLE {_quote(connection, table)} DETACH PARTITION {_quote(connection, name)}")
+            detached.append(name)
+    return detached
@@ -0,0 +1,208 @@
+"""
+Opt-in memory profiling of single requests, to find out what makes a page use a lot of memory.
+
+With PROFILING_ENABLED, ProfilingMiddleware profiles the requests of staff users that send the
+PROFILING_HEADER and a PROFILING_SAMPLE_RATE share of all requests. When it is off, Django drops
+the middleware at startup and requests don't pay anything.
+
+A profiled request runs with tracemalloc. Its report has the peak and retained traced memory of
+the view phase (until the view returns) and the template phase (rendering a TemplateResponse).
+It also has their top allocation sites. Every site is the most recent frame of the project's own
+code that led to the allocation. Sites are counted under "orm" when Django's database layer made
+the allocation (querysets, model instances, cursors), under "template" for the template engine,
+and otherwise under the phase they happened in. A header value containing "calls" adds a call
+tree, from pyinstrument when it is installed and from cProfile otherwise.
+
+tracemalloc sees the allocations of every thread of the process. One request per process is
+profiled at a time, but with a threaded server the reports can include other requests' memory.
+Staff can read the stored reports at /profiles/. Only the newest PROFILING_MAX_REPORTS are kept,
+and sampled requests, which can be anyone's, are stored without their query string.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import tracemalloc
+from time import perf_counter
+
+from django.conf import settings
+
+from NebulaNotesApp.models import ProfileReport
+
+try:
+    from pyinstrument import Profiler as CallTreeProfiler
+except ImportError:  # pragma: no cover - call trees come from cProfile
+    CallTreeProfiler = None
+
+
+DEFAULT_HEADER = "X-Profile"
+DEFAULT_TRACEBACK_FRAMES = 25
+DEFAULT_TOP_SITES = 20
+CALL_TREE_LINES = 60
+DEFAULT_MAX_REPORTS = 1000
+
+ORM_PATH = os.sep + os.path.join("django", "db") + os.sep
+TEMPLATE_PATH = os.sep + os.path.join("django", "template") + os.sep
+# Every request passes through these files, their frames don't tell where memory goes.
+PASS_THROUGH_FILES = (__file__, os.path.join(os.path.dirname(__file__), "middleware.py"))
+# Allocations of tracemalloc's own snapshots and of this module are left out of the reports.
+IGNORED = [tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True), tracemalloc.Filter(False, __file__)]
+
+_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, "PROFILING_ENABLED", False)
+
+
+def trigger(request):
+    """ Returns (trigger, with call tree) when the request should be profiled, else (None, False)"""
+    header = request.headers.get(getattr(settings, "PROFILING_HEADER", DEFAULT_HEADER))
+    if header and request.user.is_staff:
+        return "header", "calls" in header.lower()
+    rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+    if rate and random.random() < rate:
+        return "sample", False
+    return None, False
+
+
+def _site(traceback):
+    """ Returns "file:line" of the most recent frame of the project's own code, or of the most recent frame"""
+    base = str(settings.BASE_DIR) + os.sep
+    for frame in reversed(traceback):
+        if frame.filename.startswith(base) and "site-packages" not in frame.filename and frame.filename not in PASS_THROUGH_FILES:
+            return f"{frame.filename[len(base):]}:{frame.lineno}"
+    return f"{traceback[-1].filename}:{traceback[-1].lineno}"
+
+
+def _category(traceback, phase):
+    for frame in traceback:
+        if ORM_PATH in frame.filename:
+            return "orm"
+    for frame in traceback:
+        if TEMPLATE_PATH in frame.filename:
+            return "template"
+    return phase
+
+
+class RequestProfile:
+    """ The memory profile of a single request, the phases are started and ended by ProfilingMiddleware"""
+
+    def __init__(self, trigger, call_tree=False):
+        self.trigger = trigger
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start(getattr(settings, "PROFILING_TRACEBACK_FRAMES", DEFAULT_TRACEBACK_FRAMES))
+        tracemalloc.reset_peak()
+        self.start = perf_counter()
+        self.base_memory = tracemalloc.get_traced_memory()[0]
+        self.peak = self.base_memory
+        self.phases = {}
+        self.sites = {}
+        self._phase = None
+        self.profiler = None
+        self.call_tree = ""
+        if call_tree:
+            self.profiler = CallTreeProfiler() if CallTreeProfiler else cProfile.Profile()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+    def start_phase(self, name):
+        self.end_phase()
+        self._phase = (name, self._snapshot(), tracemalloc.get_traced_memory()[0])
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    def end_phase(self):
+        if self._phase is None:
+            return
+        name, before, start = self._phase
+        self._phase = None
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        self.phases[name] = {"peak": peak - start, "retained": current - start}
+        for difference in self._snapshot().compare_to(before, "traceback"):
+            if difference.size_diff <= 0:
+                continue
+            key = (_category(difference.traceback, name), _site(difference.traceback))
+            size, count = self.sites.get(key, (0, 0))
+            self.sites[key] = (size + difference.size_diff, count + max(difference.count_diff, 0))
+
+    def start_calls(self):
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.enable()
+        elif self.profiler:
+            self.profiler.start()
+
+    def stop_calls(self):
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(self.profiler, stream=output).sort_stats("cumulative").print_stats(CALL_TREE_LINES)
+            self.call_tree = output.getvalue()
+        elif self.profiler:
+            self.profiler.stop()
+            self.call_tree = self.profiler.output_text()
+
+    def finish(self):
+        """ Ends the last phase and tracing, returns the phases with their top sites"""
+        self.end_phase()
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if self.started_tracing:
+            tracemalloc.stop()
+        limit = getattr(settings, "PROFILING_TOP_SITES", DEFAULT_TOP_SITES)
+        phases = {name: dict(phase, sites=[]) for name, phase in self.phases.items()}
+        phases.setdefault("orm", {})["sites"] = []
+        for (category, site), (size, count) in sorted(self.sites.items(), key=lambda item: -item[1][0]):
+            sites = phases.setdefault(category, {"sites": []})["sites"]
+            if len(sites) < limit:
+                sites.append({"site": site, "size": size, "count": count})
+        phases["orm"]["allocated"] = sum(size for (category, _), (size, _) in self.sites.items() if category == "orm")
+        return phases
+
+
+def profile_request(get_response, request, trigger, call_tree=False):
+    """ Returns the response of a request and stores its ProfileReport, at most one request of a process at a time"""
+    if not _lock.acquire(blocking=False):
+        return get_response(request)
+    try:
+        profile = request.profile = RequestProfile(trigger, call_tree)
+        profile.start_calls()
+        try:
+            response = get_response(request)
+        finally:
+            profile.stop_calls()
+            phases = profile.finish()
+            request.profile = None
+        duration = perf_counter() - profile.start
+    finally:
+        _lock.release()
+
+    match = request.resolver_match
+    # The query string of a sampled request can hold search terms or tokens of any visitor.
+    path = request.get_full_path() if trigger == "header" else request.path
+    ProfileReport.objects.create(
+        view=match.url_name if match and match.url_name else "unresolved",
+        path=path[:2000],
+        method=request.method,
+        status_code=response.status_code,
+        trigger=trigger,
+        duration=duration * 1000,
+        peak_memory=profile.peak - profile.base_memory,
+        phases=phases,
+        call_tree=profile.call_tree,
+    )
+    prune(getattr(settings, "PROFILING_MAX_REPORTS", DEFAULT_MAX_REPORTS))
+    return response
+
+
+def prune(keep):
+    """ Deletes the reports older than the newest ``keep``, at least the latest one is kept, returns the number deleted"""
+    keep = max(keep, 1)
+    oldest_kept = ProfileReport.objects.order_by("-pk").values_list("pk", flat=True)[keep - 1:keep]
+    if not oldest_kept:
+        return 0
+    return ProfileReport.objects.filter(pk__lt=oldest_kept[0]).delete()[0]
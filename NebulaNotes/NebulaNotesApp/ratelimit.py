@@ -0,0 +1,112 @@
+import ipaddress
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+RATE = re.compile(r"^(\d+)/(\d*)([smhd])$")
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+CACHE_PREFIX = "nebulanotes.ratelimit"
+
+
+def _trusted(address, networks):
+    try:
+        return any(ipaddress.ip_address(address) in network for network in networks)
+    except ValueError:
+        return False
+
+
+def client_ip(request):
+    """
+    Returns the address of the client, read from X-Forwarded-For when the request comes from one of TRUSTED_PROXIES.
+
+    The header is read from the right, the first address that isn't a trusted proxy is the
+    client. Addresses left of it were sent by the client and can't be trusted. Requests from
+    anywhere else are keyed by REMOTE_ADDR, whatever headers they send.
+    """
+    remote = request.META.get("REMOTE_ADDR", "")
+    networks = [ipaddress.ip_network(proxy, strict=False) for proxy in getattr(settings, "TRUSTED_PROXIES", ())]
+    if not networks or not _trusted(remote, networks):
+        return remote
+    forwarded = [address.strip() for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if address.strip()]
+    for address in reversed(forwarded):
+        if not _trusted(address, networks):
+            return address
+    return forwarded[0] if forwarded else remote
+
+
+def parse_rate(rate):
+    """ Returns (requests, seconds) for a rate like "10/m" or "100/5m" """
+    match = RATE.match(rate.replace(" ", ""))
+    if not match:
+        raise ValueError(f"Invalid rate {rate!r}, use e.g. '10/m' or '100/5m'")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+class Rule:
+    """ A rate limit of one route, compiled from an entry of the RATE_LIMITS setting"""
+
+    def __init__(self, route, rate, key="ip", burst=None, methods=None):
+        if key not in ("ip", "user", "route"):
+            raise ValueError(f"Invalid rate limit key {key!r} for {route}, use 'ip', 'user' or 'route'")
+        count, period = parse_rate(rate)
+        self.route = route
+        self.key = key
+        self.interval = period / count
+        # A full bucket lets `burst` requests through at once, then one per interval.
+        self.tolerance = self.interval * ((burst or count) - 1)
+        self.methods = {method.upper() for method in methods} if methods else None
+
+    def bucket(self, request):
+        if self.key == "route":
+            return self.route
+        if self.key == "user" and request.user.is_authenticated:
+            return f"{self.route}:u{request.user.pk}"
+        return f"{self.route}:{client_ip(request)}"
+
+
+class LocalBuckets:
+    """
+    Token buckets in this process's memory, stored as one theoretical arrival time per bucket (GCRA).
+
+    Reads and writes are single dict operations, so there is no lock. Two threads taking the
+    same bucket at the same moment may both get through, which is fine for a limit.
+    """
+    max_buckets = 100_000
+
+    def __init__(self):
+        self.arrivals = {}
+
+    def take(self, rule, bucket):
+        """ Returns 0 when the request may proceed, otherwise the seconds until it would"""
+        now = time.monotonic()
+        arrival = max(self.arrivals.get(bucket, now), now)
+        if arrival - now > rule.tolerance:
+            return arrival - now - rule.tolerance
+        if len(self.arrivals) >= self.max_buckets:
+            self.arrivals = {key: value for key, value in self.arrivals.items() if value > now}
+        self.arrivals[bucket] = arrival + rule.interval
+        return 0
+
+
+class CacheBuckets:
+    """
+    Token buckets in the configured cache, shared by every worker using it.
+
+    The read and the write aren't one atomic operation, concurrent requests of the same client
+    on different workers can exceed the limit by a few requests.
+    """
+
+    def take(self, rule, bucket):
+        now = time.time()
+        key = f"{CACHE_PREFIX}:{bucket}"
+        arrival = max(cache.get(key, now), now)
+        if arrival - now > rule.tolerance:
+            return arrival - now - rule.tolerance
+        arrival += rule.interval
+        cache.set(key, arrival, math.ceil(arrival - now) + 1)
+        return 0
@@ -0,0 +1,183 @@
+"""
+"Observers who logged this object also observed" suggestions from co-observation counts.
+
+CoObservation is a sparse object-by-object matrix: the number of users who observed both
+objects, one row per ordered pair, so the neighbours of an object are a range of the
+(object, -count) index. A user observing an object for the first time adds one to its pairs
+with every other object they observed, removing their last observation of an object takes
+it away again. Counting happens per distinct (user, object), repeated observations of the
+same object don't change anything.
+
+Concurrent writes of the same user can let the counts drift, ``manage.py rebuild_coobservations``
+recomputes the matrix from the observations (with SciPy when it is installed) and should run
+every so often.
+"""
+from itertools import permutations
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
+
+from NebulaNotesApp.models import AstronomicalObject, CoObservation, Observation
+
+try:
+    from scipy import sparse
+except ImportError:  # pragma: no cover - the rebuild falls back to counting pairs in Python
+    sparse = None
+
+
+DEFAULT_SUGGESTIONS = 5
+# Suggestions for a user start from the objects of their latest observations.
+RECENT_OBJECTS = 20
+# Only the top unobserved neighbours of each recent object are scored, read along the (object, -count) index.
+NEIGHBOURS_PER_OBJECT = 50
+REBUILD_BATCH_SIZE = 5000
+
+
+def observed_objects(user_id):
+    return set(Observation.objects.filter(user_id=user_id).values_list("astronomical_object_id", flat=True).distinct())
+
+
+def _apply(changed, others, delta):
+    """ Adds ``delta`` to the pairs between the changed objects and the user's others, and among the changed ones"""
+    pairs = (
+        [(a, b) for a in changed for b in others]
+        + [(b, a) for a in changed for b in others]
+        + list(permutations(changed, 2))
+    )
+    if not pairs:
+        return
+    if delta > 0:
+        CoObservation.objects.bulk_create(
+            [CoObservation(object_id=a, other_id=b, count=0) for a, b in pairs], ignore_conflicts=True,
+        )
+    # Two statements cover all the pairs: changed -> (others and changed), others -> changed.
+    rows = (
+        CoObservation.objects.filter(object_id__in=changed, other_id__in=changed | others).exclude(object_id=F("other_id"))
+        | CoObservation.objects.filter(object_id__in=others, other_id__in=changed)
+    )
+    if delta < 0:
+        rows = rows.filter(count__gt=0)
+    rows.update(count=F("count") + delta)
+    if delta < 0:
+        CoObservation.objects.filter(object_id__in=changed | others, count__lte=0).delete()
+
+
+@transaction.atomic(savepoint=False)
+def add_observed(user_id, object_ids, others=None):
+    """
+    Counts ``object_ids`` as newly observed by the user, call after their observations were saved.
+
+    ``others`` are the objects the user observed before, they are looked up when not given.
+    """
+    changed = set(object_ids)
+    if changed:
+        _apply(changed, (observed_objects(user_id) if others is None else set(others)) - changed, 1)
+
+
+@transaction.atomic(savepoint=False)
+def remove_observed(user_id, object_ids, uncounted=()):
+    """
+    Stops counting ``object_ids`` for the user, call after their last observations of them were deleted.
+
+    ``uncounted`` are objects the user observes now whose pairs aren't counted yet, e.g. the
+    new object of an observation that was changed from one of ``object_ids`` to it.
+    """
+    changed = set(object_ids)
+    if changed:
+        _apply(changed, observed_objects(user_id) - changed - set(uncounted), -1)
+
+
+def first_observations(user_id, object_ids):
+    """ Returns the objects of ``object_ids`` the user has exactly one observation of"""
+    counts = {}
+    for object_id in Observation.objects.filter(user_id=user_id, astronomical_object_id__in=object_ids).values_list(
+        "astronomical_object_id", flat=True
+    ):
+        counts[object_id] = counts.get(object_id, 0) + 1
+    return {object_id for object_id, count in counts.items() if count == 1}
+
+
+def also_observed(object_id, limit=DEFAULT_SUGGESTIONS):
+    """ Returns [(object, count)] of the objects most often observed by the observers of ``object_id``"""
+    rows = (
+        CoObservation.objects.filter(object_id=object_id, count__gt=0)
+        .select_related("other")
+        .order_by("-count", "other_id")[:limit]
+    )
+    return [(row.other, row.count) for row in rows]
+
+
+def suggested_targets(user_id, limit=DEFAULT_SUGGESTIONS):
+    """
+    Returns [(object, score)] of objects the user hasn't observed, scored by co-observations with their recent ones.
+
+    A recent object adds the counts of its NEIGHBOURS_PER_OBJECT top neighbours the user hasn't
+    observed, so the work per request doesn't grow with the co-observation matrix.
+    """
+    recent = []
+    latest = (
+        Observation.objects.filter(user_id=user_id).order_by("-observation_date")
+        .values_list("astronomical_object_id", flat=True)[:RECENT_OBJECTS * 5]
+    )
+    for object_id in latest:
+        if object_id not in recent:
+            recent.append(object_id)
+        if len(recent) == RECENT_OBJECTS:
+            break
+    if not recent:
+        return []
+    # One query: the top unobserved neighbours of every recent object, ranked per object.
+    neighbours = (
+        CoObservation.objects.filter(object_id__in=recent, count__gt=0)
+        .filter(~Exists(Observation.objects.filter(user_id=user_id, astronomical_object_id=OuterRef("other_id"))))
+        .annotate(rank=Window(RowNumber(), partition_by=F("object_id"), order_by=[F("count").desc(), F("other_id")]))
+        .filter(rank__lte=NEIGHBOURS_PER_OBJECT)
+        .values_list("other_id", "count")
+    )
+    scores = {}
+    for other_id, count in neighbours:
+        scores[other_id] = scores.get(other_id, 0) + count
+    best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    objects = AstronomicalObject.objects.in_bulk([other_id for other_id, _ in best])
+    return [(objects[other_id], score) for other_id, score in best if other_id in objects]
+
+
+def count_pairs():
+    """ Returns {(object, other): count} computed from all observations"""
+    observed = Observation.objects.values_list("user_id", "astronomical_object_id").distinct().order_by()
+    if sparse is not None:
+        users, objects = [], []
+        for user_id, object_id in observed.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            users.append(user_id)
+            objects.append(object_id)
+        if not users:
+            return {}
+        # Users x objects incidence matrix, its Gram matrix counts the users shared by every two objects.
+        incidence = sparse.csr_matrix(([1] * len(users), (users, objects)), dtype="int32")
+        counts = (incidence.T @ incidence).tocoo()
+        return {
+            (int(a), int(b)): int(count)
+            for a, b, count in zip(counts.row, counts.col, counts.data) if a != b
+        }
+
+    by_user = {}
+    for user_id, object_id in observed.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        by_user.setdefault(user_id, []).append(object_id)
+    counts = {}
+    for object_ids in by_user.values():
+        for pair in permutations(object_ids, 2):
+            counts[pair] = counts.get(pair, 0) + 1
+    return counts
+
+
+@transaction.atomic
+def rebuild():
+    """ Replaces the co-observation counts with ones computed from all observations, returns the number of pairs"""
+    counts = count_pairs()
+    CoObservation.objects.all().delete()
+    CoObservation.objects.bulk_create(
+        (CoObservation(object_id=a, other_id=b, count=count) for (a, b), count in counts.items()),
+        batch_size=REBUILD_BATCH_SIZE,
+    )
+    return len(counts)
@@ -0,0 +1,217 @@
+"""
+Recurring events (annual meteor showers, periodic comets) expanded into occurrences when they are listed.
+
+An Event with ``repeat`` stores its rule instead of a row per occurrence: the first day in
+``date``, the unit in ``repeat``, every how many units in ``repeat_interval`` and an optional
+last day in ``repeat_until``. The n-th occurrence is computed directly from the rule, so the
+occurrences of any range come from a generator without walking the series from its start. A
+monthly or yearly series started on the 29th-31st skips the months without that day, like RRULE.
+
+Only the exceptions are stored, as OccurrenceOverride rows: a cancelled occurrence, or one that
+moved to another day or has its own name or description.
+
+Occurrences(since, until) is what the event list, its printable stream and the iCal feed iterate.
+It merges three streams sorted by day with heapq.merge: the one-off events (a queryset iterator),
+an occurrence generator per recurring event and the overridden occurrences. Nothing holds more
+than the rules of the recurring events in the range and one pending occurrence per stream.
+Without ``until`` recurring events are expanded up to HORIZON from today, one-off events have no limit.
+
+The event list is paged with page(): a page starts at a PageStart (a day and how many of its
+occurrences the previous pages showed), every stream is started at that day, so a page costs
+the same wherever it is in the list. It only knows whether a next page exists, there is no
+count of the whole range.
+"""
+import heapq
+from datetime import date, timedelta
+from typing import NamedTuple
+from itertools import islice
+from operator import attrgetter
+
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from NebulaNotesApp.models import Event, OccurrenceOverride
+
+
+HORIZON = timedelta(days=366)
+CHUNK_SIZE = 200
+
+
+class PageStart(NamedTuple):
+    """ Where a page of occurrences starts: its first day and how many occurrences of that day come before it"""
+    day: date
+    skip: int = 0
+
+    def __str__(self):
+        return f"{self.day.isoformat()}.{self.skip}"
+
+    @classmethod
+    def parse(cls, value):
+        """ Returns the PageStart written by str(), None when ``value`` is empty or invalid"""
+        day, _, skip = (value or "").partition(".")
+        try:
+            return cls(date.fromisoformat(day), int(skip or 0))
+        except ValueError:
+            return None
+
+
+class Occurrence:
+    """ One day of an event: a one-off event, an occurrence of a recurring one or an overridden occurrence"""
+    __slots__ = ("event", "date", "original_date", "name", "description")
+
+    def __init__(self, event, day, original_date=None, name="", description=""):
+        self.event = event
+        self.date = day
+        self.original_date = original_date or day
+        self.name = name or event.name
+        self.description = description or event.description
+
+    @property
+    def id(self):
+        return self.event.pk
+
+    @property
+    def recurring(self):
+        return bool(self.event.repeat)
+
+    def __repr__(self):
+        return f"<Occurrence {self.name} {self.date}>"
+
+
+def _nth(event, n):
+    """ Returns the n-th candidate day of a recurring event, None when the month doesn't have its day"""
+    start, step = event.date, n * event.repeat_interval
+    if event.repeat == "daily":
+        return start + timedelta(days=step)
+    if event.repeat == "weekly":
+        return start + timedelta(weeks=step)
+    months = start.month - 1 + (step if event.repeat == "monthly" else 12 * step)
+    try:
+        return date(start.year + months // 12, months % 12 + 1, start.day)
+    except ValueError:
+        return None
+
+
+def _periods(event, day):
+    """ Returns the index of the last candidate day of a recurring event in the unit (day, week, month, year) of ``day``"""
+    start = event.date
+    if event.repeat == "daily":
+        units = (day - start).days
+    elif event.repeat == "weekly":
+        units = (day - start).days // 7
+    elif event.repeat == "monthly":
+        units = (day.year - start.year) * 12 + day.month - start.month
+    else:
+        units = day.year - start.year
+    return units // event.repeat_interval
+
+
+def occurrences(event, since, until, reverse=False):
+    """ Yields the days an event occurs on from ``since`` to ``until``, both included, without its overrides"""
+    since = max(since, event.date)
+    if not event.repeat:
+        if since <= event.date <= until:
+            yield event.date
+        return
+    if event.repeat_until:
+        until = min(until, event.repeat_until)
+    if since > until:
+        return
+    # Only the candidates of the units between since and until are computed.
+    indexes = range(_periods(event, since), _periods(event, until) + 1)
+    for n in reversed(indexes) if reverse else indexes:
+        day = _nth(event, n)
+        if day is not None and since <= day <= until:
+            yield day
+
+
+def is_occurrence(event, day):
+    return next(occurrences(event, day, day), None) is not None
+
+
+class Occurrences:
+    """
+    The occurrences of all events from ``since`` to ``until`` ordered by day, newest first with ``reverse``.
+
+    Iterating it merges the streams again, page() reads one page of them from a PageStart.
+    """
+
+    def __init__(self, since=None, until=None, reverse=False):
+        self.since = since
+        self.until = until
+        self.reverse = reverse
+
+    def _bounds(self):
+        """ Returns the range recurring events are expanded in"""
+        return self.since or date.min, self.until or timezone.localdate() + HORIZON
+
+    def _one_off(self):
+        events = Event.objects.filter(repeat="").defer("description_html")
+        if self.since:
+            events = events.filter(date__gte=self.since)
+        if self.until:
+            events = events.filter(date__lte=self.until)
+        return events.order_by("-date", "-pk") if self.reverse else events.order_by("date", "pk")
+
+    def _recurring(self):
+        since, until = self._bounds()
+        # Ordered, so occurrences of the same day come in the same order on every page.
+        return Event.objects.exclude(repeat="").filter(
+            Q(repeat_until__isnull=True) | Q(repeat_until__gte=since), date__lte=until,
+        ).defer("description_html").order_by("pk")
+
+    def _overrides(self):
+        return OccurrenceOverride.objects.exclude(event__repeat="").annotate(day=Coalesce("date", "original_date"))
+
+    def _series(self, event, since, until, replaced):
+        for day in occurrences(event, since, until, self.reverse):
+            if day not in replaced:
+                yield Occurrence(event, day)
+
+    def _moved(self, overrides):
+        for override in overrides:
+            if is_occurrence(override.event, override.original_date):
+                yield Occurrence(override.event, override.day, override.original_date, override.name, override.description)
+
+    def _one_off_stream(self):
+        return (Occurrence(event, event.date) for event in self._one_off().iterator(chunk_size=CHUNK_SIZE))
+
+    def _streams(self):
+        since, until = self._bounds()
+        replaced = {}
+        overrides = self._overrides()
+        # Every overridden occurrence in the range leaves its series, the ones not cancelled come back as their own stream.
+        for event_id, original_date in overrides.filter(original_date__range=(since, until)).values_list("event_id", "original_date"):
+            replaced.setdefault(event_id, set()).add(original_date)
+        shown = overrides.filter(cancelled=False, day__range=(since, until)).select_related("event").defer("event__description_html")
+        streams = [self._one_off_stream(), self._moved(shown.order_by("-day", "-pk") if self.reverse else shown.order_by("day", "pk"))]
+        for event in self._recurring():
+            streams.append(self._series(event, since, until, replaced.get(event.pk, ())))
+        return streams
+
+    def __iter__(self):
+        return heapq.merge(*self._streams(), key=attrgetter("date"), reverse=self.reverse)
+
+    def iterator(self, chunk_size=None):
+        """ Lets StreamingListMixin stream the occurrences like a queryset"""
+        return iter(self)
+
+    def page(self, start=None, size=CHUNK_SIZE):
+        """ Returns (the occurrences of the page at PageStart ``start``, the PageStart of the next page or None)"""
+        window = self
+        if start is not None:
+            # Every stream starts at the page's day instead of the start of the range.
+            if self.reverse:
+                window = Occurrences(self.since, min(start.day, self.until or start.day), reverse=True)
+            else:
+                window = Occurrences(max(start.day, self.since or start.day), self.until)
+        skip = start.skip if start is not None else 0
+        shown = list(islice(iter(window), skip, skip + size + 1))
+        if len(shown) <= size:
+            return shown, None
+        shown, following = shown[:size], shown[size]
+        same_day = sum(1 for occurrence in shown if occurrence.date == following.date)
+        if start is not None and following.date == start.day:
+            same_day += skip
+        return shown, PageStart(following.date, same_day)
@@ -0,0 +1,84 @@
+"""
+Per-process snapshot of the small reference tables: object types and galaxies.
+
+Forms and filters read their choices and labels from ``snapshot()`` instead of querying the
+tables on every request. Every worker keeps its own copy together with the version it was
+loaded at; the version lives in the shared cache and is replaced after every committed write
+(``changed()``, called from signals.py and from bulk updates). A worker compares versions once
+per request, so a write is visible to all workers from their next request on. Until the write
+commits, the thread that made it reads the tables again on every call without keeping the result.
+"""
+import threading
+
+from django.core.signals import request_started
+from django.db import connection, transaction
+
+from NebulaNotesApp import versions
+from NebulaNotesApp.models import AstronomicalObjectType, Galaxy
+
+
+VERSION_KEY = "nebulanotes.reference-version"
+REFERENCE_MODELS = (AstronomicalObjectType, Galaxy)
+
+
+class ReferenceData:
+    """ The object types and galaxies, ordered by name"""
+
+    def __init__(self, version):
+        self.version = version
+        self.types = dict(AstronomicalObjectType.objects.order_by("name").values_list("pk", "name"))
+        self.galaxies = {
+            pk: {"name": name, "type": galaxy_type}
+            for pk, name, galaxy_type in Galaxy.objects.order_by("name").values_list("pk", "name", "type")
+        }
+
+    def type_choices(self):
+        return list(self.types.items())
+
+    def galaxy_choices(self):
+        return [(pk, galaxy["name"]) for pk, galaxy in self.galaxies.items()]
+
+
+_snapshot = None
+_checked = threading.local()
+# Set by changed() until the transaction commits or the next request starts, so the thread reads its own uncommitted writes without caching them.
+_pending = threading.local()
+
+
+def snapshot():
+    """ Returns the reference data, reloaded when another process changed it since the last check"""
+    global _snapshot
+    if getattr(_pending, "value", False):
+        if connection.in_atomic_block:
+            # Rows that may still roll back are never kept as the snapshot of a version.
+            return ReferenceData(None)
+        _pending.value = False
+    if _snapshot is None or not getattr(_checked, "value", False):
+        version = versions.current(VERSION_KEY)
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = ReferenceData(version)
+        _checked.value = True
+    return _snapshot
+
+
+def _bump():
+    global _snapshot
+    versions.replace(VERSION_KEY)
+    _snapshot = None
+    _pending.value = False
+
+
+def changed():
+    """ Marks the snapshots of all processes stale once the current transaction commits"""
+    if connection.in_atomic_block:
+        _pending.value = True
+    transaction.on_commit(_bump)
+
+
+def _start_request(**kwargs):
+    _checked.value = False
+    # A transaction that rolled back doesn't call _bump().
+    _pending.value = False
+
+
+request_started.connect(_start_request, dispatch_uid="nebulanotes.reference")
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.base import UpdateError
+
+
+def write_behind_window():
+    return getattr(settings, "SESSION_WRITE_BEHIND_SECONDS", 0)
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Cached sessions that write changes back to the database at most every SESSION_WRITE_BEHIND_SECONDS.
+
+    Reads come from the cache and only fall back to the database on a miss. New sessions, cycled
+    keys (login) and deletions (logout) are always written through. A later change of the same
+    session is written through too once the window since the last write has passed, inside the
+    window it only updates the cache and marks the session dirty. A dirty session is written by
+    the first save or load of it after the window, so it reaches the database on the user's next
+    request. If the cache loses a session before that, its unwritten changes are lost,
+    authentication is never one of them.
+
+    The database row expires a window later than the session, so the cached expiry, which is
+    ahead of the written one by less than a window, never outlives the row and
+    ``clear_expired_sessions`` doesn't delete sessions that are still in use.
+    """
+    cache_key_prefix = "nebulanotes.session"
+
+    @property
+    def persisted_key(self):
+        return f"{self.cache_key}:persisted"
+
+    @property
+    def dirty_key(self):
+        return f"{self.cache_key}:dirty"
+
+    def save(self, must_create=False):
+        window = write_behind_window()
+        if must_create or self.session_key is None or not window or not self._cache.get(self.persisted_key):
+            self._write(must_create)
+            return
+        self._cache.set(self.cache_key, self._get_session(), self.get_expiry_age())
+        self._cache.set(self.dirty_key, True, self.get_expiry_age())
+
+    def load(self):
+        data = super().load()
+        if data and write_behind_window() and self.session_key is not None:
+            state = self._cache.get_many([self.dirty_key, self.persisted_key])
+            if state.get(self.dirty_key) and not state.get(self.persisted_key):
+                self._session_cache = data
+                try:
+                    self._write()
+                except UpdateError:
+                    # The row is gone (logged out elsewhere), the session is dropped on the next save.
+                    pass
+        return data
+
+    def _write(self, must_create=False):
+        super().save(must_create)
+        window = write_behind_window()
+        if window and self.session_key is not None:
+            self._cache.set(self.persisted_key, True, window)
+            self._cache.delete(self.dirty_key)
+
+    def create_model_instance(self, data):
+        instance = super().create_model_instance(data)
+        instance.expire_date += timedelta(seconds=write_behind_window())
+        return instance
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key is not None:
+            self._cache.delete_many([f"{self.cache_key_prefix}{key}:persisted", f"{self.cache_key_prefix}{key}:dirty"])
@@ -0,0 +1,196 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from NebulaNotesApp import broadcast, catalog, heatmap, hierarchy, markup, recommendations, reference
+from NebulaNotesApp.backends import forget_user
+from NebulaNotesApp.media import add_reference, remove_reference
+from NebulaNotesApp.models import AstronomicalObject, Galaxy, Event, Observation
+from NebulaNotesApp.sync import SYNCED_MODELS, record_changes, record_save, record_delete
+
+
+LIVE_FEED_MODELS = broadcast.LIVE_FEED_MODELS
+IMAGE_MODELS = (Galaxy, AstronomicalObject)
+
+
+@receiver(pre_save)
+def render_markup(sender, instance, **kwargs):
+    # Also for raw saves, fixtures don't carry the rendered HTML.
+    if sender in markup.MARKUP_FIELDS:
+        markup.render_instance(instance)
+
+
+@receiver(pre_save)
+def remember_stored_image(sender, instance, raw=False, **kwargs):
+    if raw or sender not in IMAGE_MODELS:
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list("image", flat=True).first() if instance.pk else None
+    instance._stored_image = stored or ""
+
+
+@receiver(post_save)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw or sender not in IMAGE_MODELS:
+        return
+    stored, current = getattr(instance, "_stored_image", ""), instance.image.name or ""
+    if stored != current:
+        add_reference(instance.image.storage, current)
+        remove_reference(stored)
+    instance._stored_image = current
+
+
+@receiver(post_delete)
+def release_image_reference(sender, instance, **kwargs):
+    if sender in IMAGE_MODELS:
+        remove_reference(instance.image.name or "")
+
+
+@receiver(post_save)
+def log_saved_row(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if sender in SYNCED_MODELS.values():
+        record_save(instance)
+    if sender in LIVE_FEED_MODELS:
+        broadcast.notify(sender, instance.pk, "created" if created else "updated", instance.name)
+
+
+@receiver(post_delete)
+def log_deleted_row(sender, instance, **kwargs):
+    if sender in SYNCED_MODELS.values():
+        record_delete(instance)
+    if sender in LIVE_FEED_MODELS:
+        broadcast.notify(sender, instance.pk, "deleted", instance.name)
+
+
+@receiver(pre_delete, sender=Galaxy)
+def log_galaxy_objects(sender, instance, **kwargs):
+    # The objects' galaxy is set to NULL by an UPDATE that sends no signals.
+    record_changes(AstronomicalObject, list(instance.astronomicalobject_set.values_list("pk", flat=True)))
+
+
+@receiver(m2m_changed, sender=Event.related_objects.through)
+def log_related_objects_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        record_save(instance)
+    elif pk_set:
+        record_changes(Event, pk_set)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def forget_cached_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            forget_user(instance.pk)
+    elif action in ("post_add", "post_remove"):
+        for pk in pk_set:
+            forget_user(pk)
+    elif action == "pre_clear":
+        # The members of a group or permission are only known before they are cleared.
+        members = sender.objects.filter(**{f"{instance._meta.model_name}_id": instance.pk})
+        for pk in members.values_list("user_id", flat=True):
+            forget_user(pk)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def mark_reference_data_stale(sender, raw=False, **kwargs):
+    if not raw and sender in reference.REFERENCE_MODELS:
+        reference.changed()
+
+
+@receiver(post_save, sender=AstronomicalObject)
+@receiver(post_delete, sender=AstronomicalObject)
+@receiver(post_delete, sender=Galaxy)
+def mark_catalog_stale(sender, raw=False, **kwargs):
+    # Deleting a galaxy sets its objects' galaxy to NULL with an UPDATE that sends no signals.
+    if not raw:
+        catalog.changed()
+
+
+@receiver(pre_save, sender=Observation)
+def remember_observed_object(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list(
+        "astronomical_object_id", "astronomical_object__type_id", "latitude", "longitude", "observation_date",
+    ).first() if instance.pk else None
+    instance._stored_object_id = stored[0] if stored else None
+    instance._stored_heatmap_cells = heatmap.cell_keys(*stored[1:]) if stored else []
+
+
+@receiver(post_save, sender=Observation)
+def count_co_observations(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored, current = getattr(instance, "_stored_object_id", None), instance.astronomical_object_id
+    if stored == current:
+        return
+    added = recommendations.first_observations(instance.user_id, [current])
+    if stored is not None and not sender.objects.filter(user_id=instance.user_id, astronomical_object_id=stored).exists():
+        recommendations.remove_observed(instance.user_id, [stored], uncounted=added)
+    recommendations.add_observed(instance.user_id, added)
+    instance._stored_object_id = current
+
+
+@receiver(post_delete, sender=Observation)
+def uncount_co_observations(sender, instance, **kwargs):
+    if not sender.objects.filter(user_id=instance.user_id, astronomical_object_id=instance.astronomical_object_id).exists():
+        recommendations.remove_observed(instance.user_id, [instance.astronomical_object_id])
+
+
+@receiver(post_save, sender=Observation)
+def count_heatmap_cells(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    cells = heatmap.observation_keys(instance)
+    heatmap.apply(heatmap.difference(getattr(instance, "_stored_heatmap_cells", []), cells))
+    instance._stored_heatmap_cells = cells
+
+
+@receiver(post_delete, sender=Observation)
+def uncount_heatmap_cells(sender, instance, **kwargs):
+    if instance.latitude is not None and instance.longitude is not None:
+        heatmap.apply(heatmap.difference(heatmap.observation_keys(instance), []))
+
+
+@receiver(pre_save, sender=AstronomicalObject)
+def remember_object_type_and_parent(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list("type_id", "parent_id").first() if instance.pk else None
+    instance._stored_type_id, instance._stored_parent_id = stored or (None, None)
+    if stored and stored[1] != instance.parent_id:
+        hierarchy.check_parent(instance.pk, instance.parent_id)
+
+
+@receiver(post_save, sender=AstronomicalObject)
+def move_heatmap_cells(sender, instance, raw=False, **kwargs):
+    stored = getattr(instance, "_stored_type_id", None)
+    if not raw and stored is not None and stored != instance.type_id:
+        heatmap.retype_objects({instance.pk: stored}, instance.type_id)
+
+
+@receiver(post_save, sender=AstronomicalObject)
+def link_object_hierarchy(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        hierarchy.insert(instance.pk, instance.parent_id)
+    elif getattr(instance, "_stored_parent_id", None) != instance.parent_id:
+        hierarchy.move(instance.pk, instance.parent_id)
+    instance._stored_parent_id = instance.parent_id
+
+
+@receiver(pre_delete, sender=AstronomicalObject)
+def detach_object_children(sender, instance, **kwargs):
+    hierarchy.detach_children(instance)
@@ -0,0 +1,136 @@
+"""
+Slow queries stored with their execution plans, for ``manage.py index_advice``.
+
+RequestTimingMiddleware hands the slow queries of a request to record() once the response is
+built. Taking the plans runs the queries again (EXPLAIN ANALYZE), so it happens in a background
+thread fed by a bounded queue: the request doesn't wait for it, and when the queue is full the
+queries are dropped. Across all processes at most SLOW_QUERY_EXPLAINS_PER_MINUTE plans are taken
+per minute, the queries over it are stored without a plan. Bound parameters can hold passwords,
+tokens or personal data, only their types are stored.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections
+
+from NebulaNotesApp.models import SlowQuery
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD_MS = 200
+MAX_RECORDED_PER_REQUEST = 10
+DEFAULT_EXPLAINS_PER_MINUTE = 30
+QUEUE_SIZE = 100
+EXPLAINS_KEY = "slow-queries:explains"
+
+_queue = queue.Queue(QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def threshold():
+    """ Returns the slow query threshold in seconds, or None when the recorder is disabled"""
+    value = getattr(settings, "SLOW_QUERY_THRESHOLD_MS", DEFAULT_THRESHOLD_MS)
+    return None if value is None else value / 1000
+
+
+def explain(sql, params):
+    """ Returns the execution plan of a query, SELECTs are analyzed (executed again) on PostgreSQL"""
+    is_select = sql.lstrip().upper().startswith(("SELECT", "WITH"))
+    if connection.vendor == "postgresql":
+        analyze = is_select and getattr(settings, "SLOW_QUERY_EXPLAIN_ANALYZE", True)
+        prefix = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " if analyze else "EXPLAIN (FORMAT JSON) "
+    elif connection.vendor == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    if connection.vendor == "postgresql":
+        plan = rows[0][0]
+        return plan if isinstance(plan, str) else json.dumps(plan, indent=2)
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def param_types(params):
+    """ Returns the types of bound parameters, their values aren't stored"""
+    if isinstance(params, dict):
+        return {name: type(value).__name__ for name, value in params.items()}
+    return [type(value).__name__ for value in params or ()]
+
+
+def explain_allowed():
+    """ Counts a plan against SLOW_QUERY_EXPLAINS_PER_MINUTE, shared by all processes through the cache"""
+    limit = getattr(settings, "SLOW_QUERY_EXPLAINS_PER_MINUTE", DEFAULT_EXPLAINS_PER_MINUTE)
+    key = f"{EXPLAINS_KEY}:{int(time.time() // 60)}"
+    cache.add(key, 0, 120)
+    try:
+        return cache.incr(key) <= limit
+    except ValueError:
+        # The key expired between add() and incr().
+        return True
+
+
+def record(view, queries):
+    """ Queues the slow queries of one request to be stored with their plans, must run outside the query timing wrapper"""
+    queries = queries[:MAX_RECORDED_PER_REQUEST]
+    if not getattr(settings, "SLOW_QUERY_BACKGROUND", True):
+        store(view, queries)
+        return
+    try:
+        _queue.put_nowait((view, queries))
+    except queue.Full:
+        logger.warning("Slow query queue is full, dropped %d queries of %s", len(queries), view)
+        return
+    _start_worker()
+
+
+def store(view, queries):
+    """ Stores slow queries with their plans"""
+    slow_queries = []
+    for sql, params, duration in queries:
+        if not explain_allowed():
+            plan = ""
+        else:
+            try:
+                plan = explain(sql, params)
+            except DatabaseError as e:
+                plan = f"EXPLAIN failed: {e}"
+        slow_queries.append(SlowQuery(
+            sql=sql,
+            params=json.dumps(param_types(params)),
+            duration=duration * 1000,
+            plan=plan,
+            view=view,
+        ))
+    try:
+        SlowQuery.objects.bulk_create(slow_queries)
+    except DatabaseError:
+        logger.exception("Could not record slow queries of %s", view)
+
+
+def _start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="slow-queries", daemon=True)
+            _worker.start()
+
+
+def _work():
+    while True:
+        view, queries = _queue.get()
+        try:
+            store(view, queries)
+        except Exception:
+            logger.exception("Recording slow queries of %s failed", view)
+        finally:
+            connections.close_all()
+            _queue.task_done()
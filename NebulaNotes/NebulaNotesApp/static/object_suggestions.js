@@ -0,0 +1,21 @@
+// Fills the <datalist> of every object name input with the names starting with what was typed.
+document.querySelectorAll("input[data-suggest-url]").forEach((input) => {
+    const datalist = document.getElementById(input.getAttribute("list"));
+    let timer = null;
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        const prefix = input.value.trim();
+        if (!prefix) {
+            datalist.replaceChildren();
+            return;
+        }
+        timer = setTimeout(async () => {
+            const response = await fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(prefix)}`);
+            if (!response.ok) {
+                return;
+            }
+            const {names} = await response.json();
+            datalist.replaceChildren(...names.map((name) => new Option(name)));
+        }, 200);
+    });
+});
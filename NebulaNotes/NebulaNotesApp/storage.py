@@ -0,0 +1,226 @@
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional, gzip variants are always written
+    brotli = None
+
+
+# Classes Bootstrap's JavaScript adds at runtime, they never appear in the templates.
+DEFAULT_PURGE_SAFELIST = {
+    "active", "collapse", "collapsing", "collapse-horizontal", "disabled", "fade", "hiding", "modal-backdrop",
+    "modal-open", "modal-static", "offcanvas-backdrop", "show", "showing", "tooltip", "tooltip-inner",
+    "tooltip-arrow", "popover", "popover-arrow", "popover-header", "popover-body", "dropdown-menu-end",
+    "was-validated", "is-valid", "is-invalid", "visually-hidden",
+}
+
+CLASS_ATTRIBUTE = re.compile(r"""class\s*=\s*(["'])(.*?)\1""", re.DOTALL)
+TEMPLATE_TAG = re.compile(r"{[{%#].*?[}%#]}", re.DOTALL)
+SELECTOR_CLASS = re.compile(r"\.(-?[_a-zA-Z][\w-]*)")
+NEGATION = re.compile(r":not\([^()]*\)")
+
+
+def template_classes():
+    """ Returns every class name used in a class attribute of the project's templates"""
+    directories = [Path(directory) for engine in settings.TEMPLATES for directory in engine.get("DIRS", [])]
+    directories += [Path(app.path) / "templates" for app in apps.get_app_configs()]
+    classes = set()
+    for directory in directories:
+        for template in directory.glob("**/*.html"):
+            source = template.read_text(encoding="utf-8", errors="ignore")
+            for _, value in CLASS_ATTRIBUTE.findall(source):
+                classes.update(TEMPLATE_TAG.sub(" ", value).split())
+    return classes
+
+
+def _split_top_level(text, separator):
+    """ Splits text on separator characters that are not nested in brackets or quotes"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote and text[i - 1] != "\\":
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _blocks(css):
+    """ Yields (prelude, body) for every top-level rule, body is None for statements like @charset"""
+    i, start, length = 0, 0, len(css)
+    while i < length:
+        char = css[i]
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            end = length if end == -1 else end + 2
+            if css.startswith("/*!", i):
+                # License comments are kept.
+                yield css[i:end], None
+            start = i = end
+            continue
+        if char in "\"'":
+            end = i + 1
+            while end < length and (css[end] != char or css[end - 1] == "\\"):
+                end += 1
+            i = end + 1
+            continue
+        if char == ";" and css[start:i].lstrip().startswith("@"):
+            yield css[start:i + 1].strip(), None
+            start = i = i + 1
+            continue
+        if char == "{":
+            depth, end = 1, i + 1
+            while end < length and depth:
+                if css[end] in "\"'":
+                    quote = css[end]
+                    end += 1
+                    while end < length and (css[end] != quote or css[end - 1] == "\\"):
+                        end += 1
+                elif css[end] == "{":
+                    depth += 1
+                elif css[end] == "}":
+                    depth -= 1
+                end += 1
+            yield css[start:i].strip(), css[i + 1:end - 1]
+            start = i = end
+            continue
+        i += 1
+
+
+def _selector_is_used(selector, used):
+    return all(name in used for name in SELECTOR_CLASS.findall(NEGATION.sub("", selector)))
+
+
+def purge_css(css, used):
+    """ Removes the rules whose selectors only match classes that aren't in ``used``"""
+    output = []
+    for prelude, body in _blocks(css):
+        if body is None:
+            output.append(prelude)
+        elif prelude.startswith(("@media", "@supports", "@layer", "@container")):
+            inner = purge_css(body, used)
+            if inner:
+                output.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            output.append(f"{prelude}{{{body}}}")
+        else:
+            selectors = [s for s in _split_top_level(prelude, ",") if _selector_is_used(s, used)]
+            if selectors:
+                output.append(f"{','.join(selectors)}{{{body}}}")
+    return "".join(output)
+
+
+class StaticAssetsStorage(ManifestStaticFilesStorage):
+    """
+    Content-hashed static files with precompressed variants, written by ``collectstatic``.
+
+    Stylesheets listed in STATIC_PURGE_CSS are stripped of the rules no template uses before
+    they are hashed, and every hashed text asset gets ``.gz`` and ``.br`` siblings that
+    StaticAssetsMiddleware (or the front-end server) can send as they are.
+    """
+    compressible_extensions = (".css", ".js", ".svg", ".json", ".txt", ".html", ".xml", ".map")
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self._purge(paths)
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                if name.endswith(self.compressible_extensions):
+                    self._compress(name)
+
+    def _purge(self, paths):
+        targets = [path for path in getattr(settings, "STATIC_PURGE_CSS", ()) if path in paths]
+        if not targets:
+            return
+        used = template_classes() | DEFAULT_PURGE_SAFELIST | set(getattr(settings, "STATIC_PURGE_SAFELIST", ()))
+        for path in targets:
+            storage, source = paths[path]
+            with storage.open(source) as original:
+                css = original.read().decode("utf-8")
+            self.delete(path)
+            self._save(path, ContentFile(purge_css(css, used).encode("utf-8")))
+            paths[path] = (self, path)
+
+    def _compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(content):
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload once, under the SHA-256 digest of its content.
+
+    Uploads are hashed while they are streamed to a temporary file next to the blobs, the
+    upload_to directory is dropped and only the extension is kept, so the same image uploaded
+    for several rows ends up as one ``blobs/ab/cd/<digest>.jpg`` file. Blob rows count the
+    references, see NebulaNotesApp/media.py.
+    """
+    blob_directory = "blobs"
+    chunk_size = 64 * 2 ** 10
+
+    @classmethod
+    def blob_name(cls, digest, extension=""):
+        return f"{cls.blob_directory}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}"
+
+    @classmethod
+    def is_blob(cls, name):
+        return bool(name) and name.startswith(cls.blob_directory + "/")
+
+    def get_available_name(self, name, max_length=None):
+        # The name is chosen from the content in _save(), identical files share it on purpose.
+        return name
+
+    def _save(self, name, content):
+        directory = self.path(self.blob_directory)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as temporary:
+                for chunk in content.chunks(self.chunk_size):
+                    digest.update(chunk)
+                    temporary.write(chunk)
+            blob_name = self.blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            path = self.path(blob_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.unlink(temporary_path)
+                # Fresh mtime keeps gc_media from collecting a blob that was just uploaded again.
+                os.utime(path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary_path, self.file_permissions_mode)
+                os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+        return blob_name
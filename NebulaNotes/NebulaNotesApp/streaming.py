@@ -0,0 +1,110 @@
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.safestring import mark_safe
+from django.utils.text import compress_sequence
+
+from NebulaNotesApp.fileserving import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional, gzip is always available
+    brotli = None
+
+
+ROWS_MARKER = "<!--nebulanotes:rows-->"
+ROWS_PER_CHUNK = 200
+_DONE = object()
+
+
+async def async_chunks(chunks):
+    """
+    Iterates a sync iterator of chunks from the event loop, one chunk per call in the sync thread.
+
+    Under ASGI a StreamingHttpResponse of a sync iterator is consumed whole with a warning
+    before the first byte is sent, so the memory and time to first byte of a list page would
+    be those of the whole page. The iterators run queries, hence thread_sensitive.
+    """
+    iterator = iter(chunks)
+    pull = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await pull(iterator, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """ Returns a StreamingHttpResponse of ``chunks`` that streams under both WSGI and ASGI"""
+    if isinstance(request, ASGIRequest):
+        chunks = async_chunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+def brotli_sequence(chunks):
+    compressor = brotli.Compressor(quality=5)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compressed_streaming_response(request, chunks, content_type):
+    """
+    Returns a streaming response of ``chunks`` (bytes), brotli or gzip compressed when the client accepts it.
+
+    Every chunk is flushed through the compressor as soon as it is produced, so the client gets
+    the first bytes before the last ones are rendered.
+    """
+    accepted = accepted_encodings(request)
+    if brotli is not None and "br" in accepted:
+        # Random padding in a comment, like GZipMiddleware's, against BREACH.
+        padding = f"<!--{'x' * secrets.randbelow(100)}-->".encode()
+        response = streaming_response(request, brotli_sequence(_prepend(padding, chunks)), content_type=content_type)
+        response["Content-Encoding"] = "br"
+    elif "gzip" in accepted:
+        response = streaming_response(request, compress_sequence(chunks, max_random_bytes=100), content_type=content_type)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = streaming_response(request, chunks, content_type=content_type)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
+
+
+def stream_rows(request, template_name, context, rows, row_template, row_name):
+    """
+    Streams a list page: the page around the rows, then the rows rendered in batches.
+
+    ``template_name`` is rendered once with ``{{ stream_rows }}`` standing in for the rows, the
+    rows come from ``rows`` (a queryset iterator) one batch at a time, so memory doesn't grow
+    with the number of rows.
+    """
+    page = render_to_string(template_name, {**context, "stream_rows": mark_safe(ROWS_MARKER)}, request)
+    head, _, tail = page.partition(ROWS_MARKER)
+    row = get_template(row_template)
+
+    def chunks():
+        yield head.encode()
+        batch = []
+        for item in rows:
+            batch.append(row.render({row_name: item}))
+            if len(batch) == ROWS_PER_CHUNK:
+                yield "".join(batch).encode()
+                batch = []
+        if batch:
+            yield "".join(batch).encode()
+        yield tail.encode()
+
+    return compressed_streaming_response(request, chunks(), "text/html; charset=utf-8")
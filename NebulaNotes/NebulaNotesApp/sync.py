@@ -0,0 +1,171 @@
+from django.db import connection
+from django.db.models import F, Q
+
+from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Galaxy, Event, Observation, Change
+
+
+SYNCED_MODELS = {
+    model._meta.model_name: model
+    for model in (AstronomicalObjectType, Galaxy, AstronomicalObject, Event, Observation)
+}
+
+DEFAULT_SYNC_LIMIT = 500
+MAX_SYNC_LIMIT = 5000
+
+
+def current_txid():
+    """ Returns the id of the running PostgreSQL transaction (assigning one), 0 on other databases"""
+    if connection.vendor != "postgresql":
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_current_xact_id()::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def visible_horizon():
+    """
+    Returns the oldest transaction id that may still be running, None when every write is visible.
+
+    Changes of transactions below it are committed (or rolled back) and no later commit can
+    sort before them. SQLite has a single writer whose changes commit in primary key order.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def record_changes(model, pks, user_id=None, deleted=False):
+    """
+    Appends the given rows to the change log, replacing their previous entries.
+
+    Call this for writes that bypass model signals (``bulk_create``, ``QuerySet.update``).
+    """
+    label = model._meta.model_name
+    pks = list(pks)
+    if not pks:
+        return
+    txid = current_txid()
+    Change.objects.filter(model=label, object_id__in=pks).delete()
+    Change.objects.bulk_create(
+        [Change(model=label, object_id=pk, user_id=user_id, deleted=deleted, txid=txid) for pk in pks]
+    )
+
+
+def record_queryset(queryset):
+    """
+    Appends the rows of ``queryset`` to the change log in two statements, without reading them into Python.
+
+    Call this before a ``QuerySet.update()``. Observations are logged with their owner.
+    """
+    model = queryset.model
+    label = model._meta.model_name
+    selected = queryset.order_by().annotate(change_object_id=F("pk"))
+    if model is Observation:
+        selected = selected.annotate(change_owner=F("user_id")).values_list("change_object_id", "change_owner")
+    else:
+        selected = selected.values_list("change_object_id")
+    Change.objects.filter(model=label, object_id__in=queryset.order_by().values("pk")).delete()
+    sql, params = selected.query.sql_with_params()
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(Change._meta.get_field(name).column) for name in ("object_id", "user_id", "model", "deleted", "txid"))
+    owner = "selected.change_owner" if model is Observation else "NULL"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(Change._meta.db_table)} ({columns}) "
+            f"SELECT selected.change_object_id, {owner}, %s, %s, %s FROM ({sql}) selected",
+            [label, False, current_txid(), *params],
+        )
+
+
+def _owner_id(instance):
+    return instance.user_id if isinstance(instance, Observation) else None
+
+
+def record_save(instance):
+    record_changes(type(instance), [instance.pk], user_id=_owner_id(instance))
+
+
+def record_delete(instance):
+    record_changes(type(instance), [instance.pk], user_id=_owner_id(instance), deleted=True)
+
+
+def _rows(label, pks):
+    """ Fetches the current state of the given rows of one synced model as plain dicts keyed by pk"""
+    model = SYNCED_MODELS[label]
+    fields = [field.attname for field in model._meta.concrete_fields]
+    rows = {row["id"]: row for row in model.objects.filter(pk__in=pks).values(*fields)}
+    if model is Event:
+        for row in rows.values():
+            row["related_objects"] = []
+        through = Event.related_objects.through.objects.filter(event_id__in=rows)
+        for event_id, object_id in through.values_list("event_id", "astronomicalobject_id"):
+            rows[event_id]["related_objects"].append(object_id)
+    return rows
+
+
+def parse_cursor(value):
+    """
+    Returns the (txid, pk) position of a sync cursor, raises ValueError for a malformed one.
+
+    Cursors are "<txid>.<pk>". A bare number is a cursor of the old primary key sequence, it
+    stays exact on SQLite and starts over on PostgreSQL, where it may have skipped changes.
+    """
+    txid, _, pk = str(value or 0).partition(".")
+    if not pk:
+        txid, pk = 0, txid
+    txid, pk = int(txid), int(pk)
+    if txid < 0 or pk < 0:
+        raise ValueError(value)
+    return txid, pk
+
+
+def changes_since(user, cursor="0", limit=DEFAULT_SYNC_LIMIT):
+    """
+    Returns the changes visible to ``user`` after ``cursor`` as a sync batch.
+
+    A batch costs one query for the log plus one query per model that appears in it,
+    regardless of how many rows the client already has.
+
+    Primary keys are assigned at insert time, not at commit time: a transaction holding an
+    older key can commit after the client has read a newer one. So the log is read in the order
+    of the writing transactions' ids, and only up to the oldest transaction still running. Every
+    later commit has a higher transaction id, so it comes after the cursor.
+    """
+    limit = max(1, min(limit, MAX_SYNC_LIMIT))
+    txid, pk = parse_cursor(cursor)
+    log = Change.objects.filter(Q(txid__gt=txid) | Q(txid=txid, pk__gt=pk))
+    horizon = visible_horizon()
+    if horizon is not None:
+        log = log.filter(txid__lt=horizon)
+    log = list(
+        log.filter(Q(user_id__isnull=True) | Q(user_id=user.pk))
+        .order_by("txid", "pk")[:limit + 1]
+    )
+    more = len(log) > limit
+    log = log[:limit]
+
+    pks_by_model = {}
+    for change in log:
+        if not change.deleted:
+            pks_by_model.setdefault(change.model, []).append(change.object_id)
+    rows = {label: _rows(label, pks) for label, pks in pks_by_model.items()}
+
+    changes = []
+    for change in log:
+        data = None if change.deleted else rows[change.model].get(change.object_id)
+        # A row deleted after the log was read is sent as a tombstone now, its own entry comes in a later batch.
+        changes.append({
+            "seq": change.pk,
+            "model": change.model,
+            "id": change.object_id,
+            "deleted": data is None,
+            "data": data,
+        })
+
+    return {
+        "cursor": f"{log[-1].txid}.{log[-1].pk}" if log else f"{txid}.{pk}",
+        "more": more,
+        "changes": changes,
+    }
@@ -0,0 +1,12 @@
+from django import template
+
+from NebulaNotesApp import markup as renderer
+
+
+register = template.Library()
+
+
+@register.filter
+def markup(instance, field):
+    """ Shows the rendered HTML of a Markdown field: {{ object|markup:"description" }}"""
+    return renderer.html(instance, field)
@@ -0,0 +1,18 @@
+import uuid
+
+from django.core.cache import cache
+
+
+def current(key):
+    """ Returns the version stored under ``key`` in the shared cache, a new one if it was lost"""
+    version = cache.get(key)
+    if version is None:
+        # After an eviction or a cache flush nobody can tell which copies are stale, a new
+        # version makes every process reload.
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def replace(key):
+    cache.set(key, uuid.uuid4().hex, None)
@@ -1,19 +1,52 @@
+import hashlib
+import json
+import mimetypes
+import os
+from datetime import date, timedelta
+from urllib.parse import quote
+
 from django.contrib.auth import get_user_model, authenticate, login, logout
 from django.contrib import messages
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.paginator import Paginator
+from django.db.models import Count, F
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.views import View
 from django.views.generic import CreateView, DetailView, ListView, DeleteView, UpdateView
 from django.shortcuts import render
-
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+
+from NebulaNotesApp import catalog, heatmap, hierarchy, ical, recommendations, recurrence, reference
+from NebulaNotesApp.apitokens import token_or_csrf
+from NebulaNotesApp.broadcast import get_broker, event_stream
+from NebulaNotesApp.facets import facet_counts, filter_objects, order_objects, parse_filters, parse_sort
+from NebulaNotesApp.fileserving import serve_file
 from NebulaNotesApp.forms import UserLoginForm, ObjectForm, ObjectTypeForm, GalaxyForm, EventForm, UserCreateForm, ObservationForm
+from NebulaNotesApp.ingest import ingest_observations
+from NebulaNotesApp.metrics import REGISTRY
+from NebulaNotesApp.partitions import date_range
+from NebulaNotesApp.recurrence import Occurrences, PageStart
+from NebulaNotesApp.storage import ContentAddressedStorage
+from NebulaNotesApp.streaming import ROWS_PER_CHUNK, compressed_streaming_response, stream_rows
+from NebulaNotesApp.sync import changes_since, parse_cursor, DEFAULT_SYNC_LIMIT
 
-from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Galaxy, Event, Observation
+from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Galaxy, Event, Observation, ProfileReport
 
 
 User = get_user_model()
 
+# How far back the iCalendar feed starts when no ?since= is given.
+CALENDAR_FEED_HISTORY = timedelta(days=31)
+
 class Custom404View(View):
     """ A view that handles 404 errors"""
     def get(self, request, *args, **kwargs):
@@ -79,24 +112,76 @@ class ObjectCreateView(CreateView):
     success_url = reverse_lazy("list-objects")
 
 
-class ObjectsListView(ListView):
-    """ A view that displays a filtered list of astronomical objects """
+class ObjectSuggestView(View):
+    """ A view that returns the names of the objects starting with ?q=, for the object name inputs of the forms"""
+    limit = 20
+
+    def get(self, request, *args, **kwargs):
+        prefix = request.GET.get("q", "").strip()
+        names = []
+        if prefix:
+            # Case-sensitive prefix, so the unique index on name answers it.
+            names = list(AstronomicalObject.objects.filter(name__startswith=prefix).order_by("name").values_list("name", flat=True)[:self.limit])
+        return JsonResponse({"names": names})
+
+
+class StreamingListMixin:
+    """ A mixin that pages a ListView and streams the whole list, compressed, for ?all=1 (printable lists)"""
+    paginate_by = 100
+    row_template = None
+    row_name = None
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("all") != "1":
+            return super().get(request, *args, **kwargs)
+        self.object_list = self.get_queryset()
+        rows = self.object_list.iterator(chunk_size=ROWS_PER_CHUNK)
+        self.paginate_by = None
+        context = self.get_context_data(object_list=[])
+        return stream_rows(request, self.get_template_names()[0], context, rows, self.row_template, self.row_name)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["streamable"] = True
+        return context
+
+
+class ObjectsListView(StreamingListMixin, ListView):
+    """ A view that displays a list of astronomical objects filtered by type, galaxy, distance and discovery year """
     model = AstronomicalObject
     template_name = 'nebulanotes_app/astronomicalobject_list.html'
     context_object_name = 'objects'
+    row_template = 'nebulanotes_app/object_row.html'
+    row_name = 'item'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        type_id = self.request.GET.get('type', '')
-
-        if type_id:
-            queryset = queryset.filter(type__id=type_id)
-
-        return queryset
+        self.filters = parse_filters(self.request.GET)
+        self.sort = parse_sort(self.request.GET)
+        self.catalog = catalog.snapshot()
+        return order_objects(filter_objects(super().get_queryset(), self.filters), self.sort)
+
+    def get_paginator(self, *args, **kwargs):
+        paginator = super().get_paginator(*args, **kwargs)
+        # The facet query already counted the matching objects, the paginator doesn't need its own COUNT query.
+        paginator.count = self.facets["total"]
+        return paginator
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.catalog is None:
+            return super().paginate_queryset(queryset, page_size)
+        # Filtering, sorting and paging happen on the mapped catalog, only the shown rows are loaded.
+        paginator = self.get_paginator(self.catalog.ids(self.filters, self.sort), page_size)
+        page = paginator.get_page(self.request.GET.get(self.page_kwarg))
+        objects = AstronomicalObject.objects.in_bulk([int(pk) for pk in page.object_list])
+        page.object_list = [objects[int(pk)] for pk in page.object_list if int(pk) in objects]
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
+        self.facets = self.catalog.facet_counts(self.filters) if self.catalog else facet_counts(self.filters)
         context = super().get_context_data(**kwargs)
-        context["types"] = AstronomicalObjectType.objects.all()
+        context["filters"] = self.filters
+        context["sort"] = self.sort
+        context["facets"] = self.facets
         return context
 
 
@@ -108,6 +193,14 @@ class ObjectDetailView(DetailView):
     def get_object(self):
         return get_object_or_404(AstronomicalObject, pk=self.kwargs['pk'])
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["also_observed"] = recommendations.also_observed(self.object.pk)
+        context["ancestors"] = list(hierarchy.ancestors(self.object).only("pk", "name"))
+        context["children"] = list(self.object.children.only("pk", "name").order_by("name"))
+        context["member_count"] = hierarchy.descendants(self.object).count() if context["children"] else 0
+        return context
+
 
 class ObjectUpdateView(UpdateView):
     """ A view that displays a single astronomical object and lets the user update information about it"""
@@ -147,17 +240,44 @@ class ObjectTypeCreateView(CreateView):
 
 
 class ObjectTypesListView(ListView):
-    """ A view that displays a list of astronomical object types"""
+    """ A view that displays a list of astronomical object types with their number of objects"""
     model = AstronomicalObjectType
     template_name = 'nebulanotes_app/object_type_list.html'
     context_object_name = 'object_types'
 
+    def get_queryset(self):
+        return AstronomicalObjectType.objects.annotate(object_count=Count("astronomicalobject")).order_by("pk")
+
+
+class MemberObjectsMixin:
+    """ A mixin that adds one page of the objects of a galaxy or type and their counts grouped by ``breakdown_field``"""
+    member_field = None
+    breakdown_field = None
+    members_per_page = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        members = AstronomicalObject.objects.filter(**{self.member_field: self.object})
+        breakdown = list(
+            members.values(label=F(f"{self.breakdown_field}__name"))
+            .annotate(count=Count("id"))
+            .order_by("label")
+        )
+        paginator = Paginator(members.select_related("type", "galaxy").order_by("name"), self.members_per_page)
+        # The grouped counts already add up to the total, the paginator doesn't need its own COUNT query.
+        paginator.count = sum(row["count"] for row in breakdown)
+        context["breakdown"] = breakdown
+        context["members"] = paginator.get_page(self.request.GET.get("page"))
+        return context
+
 
-class ObjectTypesDetailView(DetailView):
+class ObjectTypesDetailView(MemberObjectsMixin, DetailView):
     """ A view that displays a single astronomical object type and its objects"""
     model = AstronomicalObjectType
     template_name = 'nebulanotes_app/object_type_detail.html'
     context_object_name = 'object_type'
+    member_field = "type"
+    breakdown_field = "galaxy"
 
     def get_object_or_404(self):
         return get_object_or_404(AstronomicalObjectType, pk=self.kwargs['pk'])
@@ -200,17 +320,22 @@ class GalaxyCreateView(CreateView):
 
 
 class GalaxiesListView(ListView):
-    """ A view that displays a list of galaxies"""
+    """ A view that displays a list of galaxies with their number of objects"""
     model = Galaxy
     template_name = 'nebulanotes_app/galaxy_list.html'
     context_object_name = 'galaxies'
 
+    def get_queryset(self):
+        return Galaxy.objects.annotate(object_count=Count("astronomicalobject")).order_by("pk")
+
 
-class GalaxyDetailView(DetailView):
+class GalaxyDetailView(MemberObjectsMixin, DetailView):
     """ A view that displays a single galaxy and its objects"""
     model = Galaxy
     template_name = 'nebulanotes_app/galaxy_detail.html'
     context_object_name = 'galaxy'
+    member_field = "galaxy"
+    breakdown_field = "type"
 
     def get_object_or_404(self):
         return get_object_or_404(Galaxy, pk=self.kwargs['pk'])
@@ -240,6 +365,18 @@ class GalaxyDeleteView(DeleteView):
     def get_object_or_404(self):
         return get_object_or_404(Galaxy, pk=self.kwargs['pk'])
 
+def requested_days(request):
+    """ Returns the days given by ?on= or ?since=/&until=, None for the missing or invalid ones"""
+    days = {}
+    for key in ("since", "until"):
+        value = request.GET.get("on") or request.GET.get(key)
+        try:
+            days[key] = date.fromisoformat(value) if value else None
+        except ValueError:
+            days[key] = None
+    return days
+
+
 class EventCreateView(CreateView):
     """ A view that displays the form for creating a new event"""
     model = Event
@@ -249,22 +386,46 @@ class EventCreateView(CreateView):
     success_url = reverse_lazy("list-events")
 
 
-class EventsListView(ListView):
+class EventsListView(StreamingListMixin, ListView):
     """ A view that displays a list of events"""
     model = Event
     template_name = 'nebulanotes_app/event_list.html'
     context_object_name = 'events'
+    row_template = 'nebulanotes_app/event_row.html'
+    row_name = 'event'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # One-off events merged with the expanded occurrences of recurring ones, see recurrence.py.
         sort_order = self.request.GET.get("sort", "asc")  # oldest first
+        return Occurrences(**requested_days(self.request), reverse=sort_order == "desc")
 
-        if sort_order == "desc":
-            queryset = queryset.order_by("-date")  # newest first
-        else:
-            queryset = queryset.order_by("date")  # oldest first
+    def paginate_queryset(self, queryset, page_size):
+        # Keyset pages: ?start= is where the page starts, the range isn't counted.
+        start = PageStart.parse(self.request.GET.get("start"))
+        events, following = queryset.page(start, page_size)
+        page = {"object_list": events, "start": start, "next_start": str(following) if following else ""}
+        return None, page, events, start is not None or following is not None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(requested_days(self.request))
+        return context
+
+
+class EventsCalendarFeedView(View):
+    """ A view that streams the events from ?since= (default a month ago) to ?until= (default a year ahead) as an iCalendar feed"""
+
+    def get(self, request, *args, **kwargs):
+        days = requested_days(request)
+        today = timezone.localdate()
+        occurrences = Occurrences(
+            since=days["since"] or today - CALENDAR_FEED_HISTORY,
+            until=days["until"] or today + recurrence.HORIZON,
+        )
+        response = compressed_streaming_response(request, ical.feed(occurrences, request.get_host()), "text/calendar; charset=utf-8")
+        response["Content-Disposition"] = 'inline; filename="nebulanotes-events.ics"'
+        return response
 
-        return queryset
 
 class EventDetailView(DetailView):
     """ A view that displays a single event and its objects"""
@@ -303,6 +464,16 @@ class EventDeleteView(DeleteView):
         return reverse_lazy("list-events")
 
 
+class ObservationDateRangeMixin:
+    """ A mixin that limits observations to the days given by ?on= or ?since=/&until=, so only their partitions are read"""
+
+    def get_date_range(self):
+        return requested_days(self.request)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**date_range(**self.get_date_range()))
+
+
 class ObservationCreateView(LoginRequiredMixin, CreateView):
     """ A view that displays the form for creating a new observation"""
     model = Observation
@@ -311,23 +482,50 @@ class ObservationCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy("list-observations")
 
     def form_valid(self, form):
-        observation = form.save(commit=False)
-        observation.user = self.request.user
-        observation.save()
+        form.instance.user = self.request.user
         return super().form_valid(form)
 
 
-class ObservationsListView(LoginRequiredMixin, ListView):
+@method_decorator(token_or_csrf, name="dispatch")
+class ObservationIngestView(LoginRequiredMixin, View):
+    """ A view that bulk-creates the user's observations from an NDJSON request body, one observation per line, for API tokens too"""
+    raise_exception = True
+
+    def post(self, request, *args, **kwargs):
+        result = ingest_observations(request, request.user)
+        status = 400 if result["errors"] and not result["created"] else 200
+        return JsonResponse(result, status=status)
+
+
+class ObservationsListView(LoginRequiredMixin, ObservationDateRangeMixin, StreamingListMixin, ListView):
     """ A view that displays a list of observations"""
     model = Observation
     template_name = 'nebulanotes_app/observation_list.html'
     context_object_name = 'observations'
+    row_template = 'nebulanotes_app/observation_row.html'
+    row_name = 'observation'
+
+    def get_within(self):
+        """ Returns the object given by ?within=, its observations and those of everything inside it are listed"""
+        value = self.request.GET.get("within", "")
+        return AstronomicalObject.objects.filter(pk=value).only("pk", "name").first() if value.isdigit() else None
 
     def get_queryset(self):
-        return Observation.objects.filter(user=self.request.user).order_by("observation_date")
+        observations = super().get_queryset().filter(user=self.request.user)
+        self.within = self.get_within()
+        if self.within:
+            observations = observations.filter(astronomical_object__ancestor_links__ancestor=self.within)
+        return observations.select_related("user", "astronomical_object", "event").order_by("observation_date")
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_date_range())
+        context["within"] = self.within
+        context["suggested_targets"] = recommendations.suggested_targets(self.request.user.pk)
+        return context
 
-class ObservationDetailView(LoginRequiredMixin, DetailView):
+
+class ObservationDetailView(LoginRequiredMixin, ObservationDateRangeMixin, DetailView):
     """ A view that displays a single observation and its objects"""
     model = Observation
     template_name = 'nebulanotes_app/observation_detail.html'
@@ -336,7 +534,7 @@ class ObservationDetailView(LoginRequiredMixin, DetailView):
     def get_object_or_404(self):
         return get_object_or_404(Observation, pk=self.kwargs['pk'])
 
-class ObservationUpdateView(LoginRequiredMixin, UpdateView):
+class ObservationUpdateView(LoginRequiredMixin, ObservationDateRangeMixin, UpdateView):
     """ A view that displays a single observation and lets the user update it"""
     model = Observation
     template_name = 'nebulanotes_app/observation_update.html'
@@ -350,7 +548,7 @@ class ObservationUpdateView(LoginRequiredMixin, UpdateView):
         return get_object_or_404(Observation, pk=self.kwargs['pk'])
 
 
-class ObservationDeleteView(LoginRequiredMixin, DeleteView):
+class ObservationDeleteView(LoginRequiredMixin, ObservationDateRangeMixin, DeleteView):
     """ A view that displays a single observation and lets the user delete it"""
     model = Observation
     template_name = 'nebulanotes_app/observation_delete.html'
@@ -359,3 +557,140 @@ class ObservationDeleteView(LoginRequiredMixin, DeleteView):
 
     def get_object_or_404(self):
         return get_object_or_404(Observation, pk=self.kwargs['pk'])
+
+
+class SyncView(LoginRequiredMixin, View):
+    """ A view that returns the catalog and observation changes made after the client's cursor"""
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.GET.get("cursor", "0")
+        try:
+            parse_cursor(cursor)
+            limit = int(request.GET.get("limit", DEFAULT_SYNC_LIMIT))
+        except ValueError:
+            return JsonResponse({"error": "cursor must be a cursor returned by sync and limit an integer"}, status=400)
+        return JsonResponse(changes_since(request.user, cursor, limit))
+
+
+class LiveFeedView(View):
+    """ A view that streams event, object and galaxy changes as Server-Sent Events, it needs the ASGI server"""
+
+    async def get(self, request, *args, **kwargs):
+        return StreamingHttpResponse(
+            event_stream(get_broker()),
+            content_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+
+class MetricsView(View):
+    """ A view that exports the request metrics of this worker in the Prometheus text format, to scrapers sending METRICS_TOKEN"""
+
+    def get(self, request, *args, **kwargs):
+        token = getattr(settings, "METRICS_TOKEN", "")
+        scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+        if not token or scheme.lower() != "bearer" or not constant_time_compare(credentials.strip(), token):
+            return HttpResponseForbidden()
+        return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _months(values):
+    months = []
+    for value in values:
+        try:
+            year, month = value.split("-")
+            months.append(date(int(year), int(month), 1))
+        except ValueError:
+            continue
+    return months
+
+
+class HeatmapView(View):
+    """ A view that displays the map of where observations are made"""
+    def get(self, request, *args, **kwargs):
+        return render(request, 'nebulanotes_app/heatmap.html', {
+            "object_types": reference.snapshot().type_choices(),
+            "grid": heatmap.GRID,
+            "max_zoom": heatmap.MAX_TILE_ZOOM,
+        })
+
+
+class HeatmapTileView(View):
+    """ A view that returns the observation counts of one map tile as JSON, filtered by ?type= and ?month=YYYY-MM"""
+
+    def get(self, request, zoom, x, y, *args, **kwargs):
+        if zoom > heatmap.MAX_TILE_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+            raise Http404
+        object_types = [int(value) for value in request.GET.getlist("type") if value.isdigit()]
+        cells = heatmap.tile(zoom, x, y, object_types, _months(request.GET.getlist("month")))
+        body = json.dumps({"zoom": zoom, "x": x, "y": y, "grid": heatmap.GRID, "cells": cells}, separators=(",", ":"))
+        etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        # Tiles are aggregates, caches may keep them a while and revalidate cheaply with the ETag.
+        max_age = getattr(settings, "HEATMAP_TILE_MAX_AGE", 86400)
+        patch_cache_control(response, public=True, max_age=max_age, stale_while_revalidate=max_age)
+        return response
+
+
+class MediaFileView(View):
+    """ A view that serves uploaded files, the transfer is handed to the front-end server when it is configured"""
+
+    def get(self, request, path, *args, **kwargs):
+        if getattr(settings, "MEDIA_LOGIN_REQUIRED", False) and not request.user.is_authenticated:
+            return HttpResponseForbidden()
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if any(part.startswith(".") for part in path.split("/")) or not os.path.isfile(full_path):
+            raise Http404
+
+        cache_control = "private" if getattr(settings, "MEDIA_LOGIN_REQUIRED", False) else "public"
+        # Blobs are named after their content, so they never change.
+        cache_control += ", max-age=31536000, immutable" if ContentAddressedStorage.is_blob(path) else ", max-age=86400"
+        accel_prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", None)
+        sendfile_header = getattr(settings, "MEDIA_SENDFILE_HEADER", None)
+        if accel_prefix or sendfile_header:
+            # The front-end server sends the body and answers Range and conditional requests itself.
+            response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or "application/octet-stream")
+            if accel_prefix:
+                response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(path)
+            else:
+                response[sendfile_header] = full_path
+            response["Cache-Control"] = cache_control
+            return response
+        return serve_file(request, full_path, cache_control=cache_control)
+
+
+class StaffRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
+    """ A mixin that only lets staff users in"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class ProfileReportsListView(StaffRequiredMixin, ListView):
+    """ A view that displays the stored request memory profiles, newest first"""
+    template_name = 'nebulanotes_app/profile_report_list.html'
+    context_object_name = 'reports'
+    paginate_by = 50
+
+    def get_queryset(self):
+        return ProfileReport.objects.defer("phases", "call_tree").order_by("-created")
+
+
+class ProfileReportDetailView(StaffRequiredMixin, DetailView):
+    """ A view that displays the phases, allocation sites and call tree of one request memory profile"""
+    model = ProfileReport
+    template_name = 'nebulanotes_app/profile_report_detail.html'
+    context_object_name = 'report'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        phases = self.object.phases
+        context["phases"] = [(name, phases[name]) for name in ("view", "orm", "template") if name in phases]
+        return context
@@ -1,5 +1,6 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client
 from django.contrib.auth.models import User
 from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Galaxy, Event, Observation
@@ -9,6 +10,36 @@ from django.utils.timezone import make_aware
 User = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def plain_static_files(settings):
+    """Serves static files by their source names, tests don't run collectstatic."""
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+
+
+@pytest.fixture(autouse=True)
+def catalog_snapshot_path(settings, tmp_path):
+    """Writes the catalog snapshot of every test to its own directory, rebuilt in the test's thread and transaction."""
+    settings.CATALOG_SNAPSHOT_PATH = tmp_path / "catalog.snapshot"
+    settings.CATALOG_SNAPSHOT_BACKGROUND_REBUILD = False
+
+
+@pytest.fixture(autouse=True)
+def slow_queries_inline(settings):
+    """Stores slow queries in the test's thread and transaction."""
+    settings.SLOW_QUERY_BACKGROUND = False
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Clears cached sessions and users, primary keys are reused between tests."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def test_user(db):
     """Creates a test user."""
@@ -0,0 +1,109 @@
+import pytest
+from django.contrib.admin import helpers
+from django.urls import reverse
+from conftest import test_user, astronomical_objects, galaxies, events, observations
+from NebulaNotesApp.models import AstronomicalObject, Change, Galaxy, Observation
+
+
+@pytest.fixture
+def admin_user_client(client, django_user_model):
+    django_user_model.objects.create_superuser(username="curator", password="curatorpass")
+    client.login(username="curator", password="curatorpass")
+    return client
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("model_name", ["galaxy", "astronomicalobjecttype", "astronomicalobject", "event", "observation"])
+def test_changelists_load(admin_user_client, test_user, observations, galaxies, model_name):
+    """Checks that every catalog model is registered and its changelist loads."""
+    response = admin_user_client.get(reverse(f"admin:NebulaNotesApp_{model_name}_changelist"))
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_observation_changelist_query_count(admin_user_client, test_user, observations, django_assert_max_num_queries):
+    """Checks that the related rows are joined instead of fetched per row."""
+    url = reverse("admin:NebulaNotesApp_observation_changelist")
+    admin_user_client.get(url)
+    with django_assert_max_num_queries(8):
+        admin_user_client.get(url)
+
+
+@pytest.mark.django_db
+def test_search_uses_name_prefix(admin_user_client, galaxies):
+    """Checks that the admin search matches name prefixes and ids."""
+    url = reverse("admin:NebulaNotesApp_galaxy_changelist")
+    response = admin_user_client.get(url, {"q": "Andro"})
+    assert [galaxy.name for galaxy in response.context["cl"].result_list] == ["Andromeda"]
+    response = admin_user_client.get(url, {"q": str(galaxies[2].pk)})
+    assert [galaxy.name for galaxy in response.context["cl"].result_list] == ["Triangulum"]
+
+
+@pytest.mark.django_db
+def test_bulk_action_updates_and_records_changes(admin_user_client, astronomical_objects, galaxies):
+    """Checks that the move action updates the selected objects and logs them for sync."""
+    Change.objects.all().delete()
+    response = admin_user_client.post(reverse("admin:NebulaNotesApp_astronomicalobject_changelist"), {
+        "action": "move_to_galaxy",
+        "galaxy": galaxies[1].pk,
+        helpers.ACTION_CHECKBOX_NAME: [obj.pk for obj in astronomical_objects[:2]],
+    })
+    assert response.status_code == 302
+    assert set(AstronomicalObject.objects.filter(galaxy=galaxies[1]).values_list("name", flat=True)) == {"Mars", "Sirius"}
+    assert set(Change.objects.values_list("object_id", flat=True)) == {obj.pk for obj in astronomical_objects[:2]}
+
+
+@pytest.mark.django_db
+def test_observation_bulk_action_logs_owner(admin_user_client, test_user, observations):
+    """Checks that observation changes are logged for their owner."""
+    Change.objects.all().delete()
+    admin_user_client.post(reverse("admin:NebulaNotesApp_observation_changelist"), {
+        "action": "clear_event",
+        "select_across": 1,
+        helpers.ACTION_CHECKBOX_NAME: [observations[0].pk],
+    })
+    assert not Observation.objects.filter(event__isnull=False).exists()
+    assert set(Change.objects.values_list("user_id", flat=True)) == {test_user.pk}
+
+
+@pytest.mark.django_db
+def test_csv_export_is_streamed(admin_user_client, galaxies):
+    """Checks that the export action streams a CSV file with a header row."""
+    response = admin_user_client.post(reverse("admin:NebulaNotesApp_galaxy_changelist"), {
+        "action": "export_csv",
+        helpers.ACTION_CHECKBOX_NAME: [galaxy.pk for galaxy in galaxies],
+    })
+    assert response.streaming
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert lines[0] == "id,name,type,description,image"
+    assert len(lines) == 4
+
+
+@pytest.mark.django_db
+def test_merge_galaxies_in_admin(admin_user_client, astronomical_objects, galaxies):
+    """Checks that the admin merges the selected galaxies into the chosen one."""
+    milky_way, andromeda, triangulum = galaxies
+    AstronomicalObject.objects.filter(name="Mars").update(galaxy=andromeda)
+    AstronomicalObject.objects.filter(name="Sirius").update(galaxy=triangulum)
+    response = admin_user_client.post(reverse("admin:NebulaNotesApp_galaxy_changelist"), {
+        "action": "merge_into",
+        "target": milky_way.pk,
+        helpers.ACTION_CHECKBOX_NAME: [andromeda.pk, triangulum.pk, milky_way.pk],
+    })
+    assert response.status_code == 302
+    assert list(Galaxy.objects.values_list("name", flat=True)) == ["Milky Way"]
+    assert AstronomicalObject.objects.filter(galaxy=milky_way).count() == 2
+
+
+@pytest.mark.django_db
+def test_set_measurements_in_admin(admin_user_client, astronomical_objects):
+    """Checks that the discovery year of the selected objects is set and their distance kept."""
+    response = admin_user_client.post(reverse("admin:NebulaNotesApp_astronomicalobject_changelist"), {
+        "action": "set_measurements",
+        "discovery_year": "1610",
+        "distance_from_earth": "",
+        helpers.ACTION_CHECKBOX_NAME: [obj.pk for obj in astronomical_objects[::2]],
+    })
+    assert response.status_code == 302
+    assert dict(AstronomicalObject.objects.values_list("name", "discovery_year")) == {"Mars": 1610, "Sirius": None, "Jupiter": 1610}
+    assert AstronomicalObject.objects.get(name="Mars").distance_from_earth == 0.0000158
@@ -0,0 +1,66 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from conftest import test_user, astronomical_objects, events, galaxies, observations
+from NebulaNotesApp import backup
+from NebulaNotesApp.models import (
+    AstronomicalObject, AstronomicalObjectType, Change, Event, Galaxy, Observation,
+)
+
+
+def test_tables_in_foreign_key_order():
+    """Checks that every table comes after the tables it references."""
+    position = {model: index for index, level in enumerate(backup.levels()) for model in level}
+    assert position[AstronomicalObjectType] < position[AstronomicalObject] < position[Observation]
+    assert position[Galaxy] < position[AstronomicalObject]
+    assert position[Event.related_objects.through] > position[Event]
+
+
+@pytest.mark.django_db
+def test_snapshot_and_restore(tmp_path, test_user, galaxies, observations):
+    """Checks that a restore brings back every row and column of the snapshot."""
+    mars = AstronomicalObject.objects.get(name="Mars")
+    mars.galaxy = galaxies[0]
+    mars.discovery_year = 1610
+    mars.save()
+    observations[0].event.related_objects.add(mars)
+    Change.objects.create(model="object", object_id=mars.pk, deleted=True)
+
+    def rows():
+        return {
+            model: list(model.objects.order_by("pk").values())
+            for model in (Galaxy, AstronomicalObject, Observation, Event.related_objects.through, Change)
+        }
+
+    before = rows()
+    call_command("snapshot", str(tmp_path), stdout=StringIO())
+    manifest = json.loads((tmp_path / backup.MANIFEST).read_text())
+    assert manifest["format"] == "csv"
+    assert {table["table"]: table["rows"] for table in manifest["tables"]}[AstronomicalObject._meta.db_table] == 3
+
+    AstronomicalObject.objects.filter(name="Sirius").delete()
+    Galaxy.objects.create(name="Sombrero", type="Spiral")
+    call_command("restore", str(tmp_path), stdout=StringIO())
+    assert rows() == before
+
+    created = Galaxy.objects.create(name="Sombrero", type="Spiral")
+    assert created.pk > max(galaxy.pk for galaxy in galaxies)
+
+
+@pytest.mark.django_db
+def test_restore_checks_the_snapshot(tmp_path, astronomical_objects):
+    """Checks that snapshots of other migrations or formats are refused before anything is deleted."""
+    with pytest.raises(CommandError):
+        call_command("snapshot", str(tmp_path), format="binary", stdout=StringIO())
+    with pytest.raises(CommandError):
+        call_command("restore", str(tmp_path), stdout=StringIO())
+
+    call_command("snapshot", str(tmp_path), stdout=StringIO())
+    manifest = json.loads((tmp_path / backup.MANIFEST).read_text())
+    manifest["migrations"].append("9999_later")
+    (tmp_path / backup.MANIFEST).write_text(json.dumps(manifest))
+    with pytest.raises(CommandError):
+        call_command("restore", str(tmp_path), stdout=StringIO())
+    assert AstronomicalObject.objects.count() == 3
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+from conftest import galaxies
+from NebulaNotesApp.broadcast import InMemoryBroker, event_stream, get_broker
+from NebulaNotesApp.models import Galaxy
+
+
+def test_broker_fans_out_to_all_subscribers():
+    """Checks that one publish from another thread reaches every subscriber."""
+    broker = InMemoryBroker()
+
+    async def main():
+        queues = [broker.subscribe() for _ in range(3)]
+        publisher = threading.Thread(target=broker.publish, args=({"id": 1},))
+        publisher.start()
+        publisher.join()
+        return [await asyncio.wait_for(queue.get(), 1) for queue in queues]
+
+    assert asyncio.run(main()) == [{"id": 1}] * 3
+
+
+def test_broker_drops_oldest_message_for_slow_subscribers():
+    """Checks that a full queue keeps the newest messages."""
+    broker = InMemoryBroker(queue_size=2)
+
+    async def main():
+        queue = broker.subscribe()
+        for i in range(3):
+            broker.publish({"id": i})
+        await asyncio.sleep(0)
+        return [queue.get_nowait(), queue.get_nowait()]
+
+    assert asyncio.run(main()) == [{"id": 1}, {"id": 2}]
+
+
+def test_event_stream_formats_messages():
+    """Checks that published messages are sent as Server-Sent Events and the client is unsubscribed on close."""
+    broker = InMemoryBroker()
+
+    async def main():
+        stream = event_stream(broker)
+        assert await anext(stream) == "retry: 5000\n\n"
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        broker.publish({"model": "galaxy", "id": 1, "action": "created", "name": "Milky Way"})
+        event = await asyncio.wait_for(pending, 1)
+        await stream.aclose()
+        return event
+
+    event = asyncio.run(main())
+    assert event.startswith("event: created\ndata: ")
+    assert json.loads(event.split("data: ")[1])["name"] == "Milky Way"
+    assert broker._subscribers == {}
+
+
+@pytest.mark.django_db
+def test_changes_are_published_after_commit(monkeypatch, django_capture_on_commit_callbacks, galaxies):
+    """Checks that saving and deleting a galaxy publishes live feed messages once the transaction commits."""
+    published = []
+    monkeypatch.setattr(get_broker(), "publish", published.append)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        galaxy = Galaxy.objects.create(name="Sombrero", type="Spiral")
+        galaxy.delete()
+
+    assert [(message["model"], message["action"]) for message in published] == [("galaxy", "created"), ("galaxy", "deleted")]
+
+
+def test_live_feed_view_streams_events():
+    """Checks that the live feed responds with an event stream."""
+    async def main():
+        response = await AsyncClient().get(reverse("live-feed"))
+        first = await anext(aiter(response.streaming_content))
+        return response, first
+
+    response, first = asyncio.run(main())
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/event-stream"
+    assert first == b"retry: 5000\n\n"
@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import make_aware
+from conftest import astronomical_objects, galaxies, test_user
+from NebulaNotesApp import broadcast, bulk, heatmap
+from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, Change, HeatmapCell, Observation
+
+
+def _observe(user, obj):
+    return Observation.objects.create(
+        user=user, astronomical_object=obj, latitude=50.06, longitude=19.94,
+        observation_date=make_aware(datetime.datetime(2024, 4, 15, 21)),
+    )
+
+
+@pytest.mark.django_db
+def test_reassign_runs_the_same_statements_for_any_number_of_rows(astronomical_objects, galaxies):
+    """Checks that reassigning objects doesn't issue a statement per object."""
+    planet = astronomical_objects[0].type
+    with CaptureQueriesContext(connection) as few:
+        assert bulk.reassign(AstronomicalObject.objects.all(), galaxy=galaxies[1]) == 3
+    AstronomicalObject.objects.bulk_create(
+        AstronomicalObject(name=f"Minor planet {number}", type=planet, distance_from_earth=0.0003) for number in range(30)
+    )
+    with CaptureQueriesContext(connection) as many:
+        assert bulk.reassign(AstronomicalObject.objects.all(), galaxy=galaxies[2]) == 33
+    assert len(many) == len(few)
+    assert AstronomicalObject.objects.filter(galaxy=galaxies[2]).count() == 33
+    assert Change.objects.filter(model="astronomicalobject").count() == 33
+
+
+@pytest.mark.django_db
+def test_bulk_operations_publish_to_the_live_feed(astronomical_objects, galaxies, test_user, django_capture_on_commit_callbacks, monkeypatch):
+    """Checks that a bulk reassignment publishes one message for the whole set and logs observations with their owner."""
+    AstronomicalObject.objects.filter(pk__in=[astronomical_objects[0].pk, astronomical_objects[1].pk]).update(galaxy=galaxies[0])
+    published = []
+    monkeypatch.setattr(broadcast, "get_broker", lambda: type("Broker", (), {"publish": staticmethod(published.append)}))
+    with django_capture_on_commit_callbacks(execute=True):
+        bulk.merge_galaxies(galaxies[0], galaxies[1])
+    assert {"model": "astronomicalobject", "id": None, "action": "updated", "name": "", "count": 2} in published
+
+    observation = _observe(test_user, astronomical_objects[0])
+    Change.objects.all().delete()
+    bulk.update(Observation.objects.all(), location="Kraków")
+    assert list(Change.objects.values_list("model", "object_id", "user_id")) == [("observation", observation.pk, test_user.pk)]
+
+
+@pytest.mark.django_db
+def test_merge_types_moves_objects_and_heatmap_counts(test_user, astronomical_objects):
+    """Checks that merging types repoints the objects, adds up heatmap counts and deletes the source."""
+    mars, sirius, jupiter = astronomical_objects
+    planet, star = mars.type, sirius.type
+    star_id = star.pk
+    _observe(test_user, mars)
+    _observe(test_user, sirius)
+    _observe(test_user, jupiter)
+    Change.objects.all().delete()
+
+    assert bulk.merge_types(star, planet) == 1
+    assert not AstronomicalObjectType.objects.filter(pk=star_id).exists()
+    assert set(AstronomicalObject.objects.values_list("type_id", flat=True)) == {planet.pk}
+    assert set(HeatmapCell.objects.values_list("object_type_id", "count")) == {(planet.pk, 3)}
+    assert Change.objects.filter(model="astronomicalobject", object_id=sirius.pk).exists()
+    assert Change.objects.filter(model="astronomicalobjecttype", object_id=star_id, deleted=True).exists()
+
+    counts = set(HeatmapCell.objects.values_list("quadkey", "object_type_id", "month", "count"))
+    heatmap.rebuild()
+    assert counts == set(HeatmapCell.objects.values_list("quadkey", "object_type_id", "month", "count"))
@@ -0,0 +1,113 @@
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.http import QueryDict
+from django.urls import reverse
+from conftest import astronomical_objects, galaxies
+from NebulaNotesApp import catalog, facets
+from NebulaNotesApp.models import AstronomicalObject
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def objects(astronomical_objects, galaxies):
+    AstronomicalObject.objects.filter(name="Mars").update(galaxy=galaxies[0], discovery_year=1600)
+    AstronomicalObject.objects.filter(name="Sirius").update(galaxy=galaxies[0], discovery_year=1844)
+    AstronomicalObject.objects.create(name="Andromeda Nebula", type=astronomical_objects[1].type, galaxy=galaxies[1], distance_from_earth=2.5e6, discovery_year=1900)
+    catalog.changed()
+    return AstronomicalObject.objects.order_by("pk")
+
+
+def _new_request():
+    request_started.send(sender=None)
+
+
+FILTERS = ["", "type={planet}", "galaxy=none", "galaxy={milky_way}&galaxy=none", "distance_min=1&year_max=1899", "year_min=1844&year_max=1900", "type={star}&distance_max=100"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", FILTERS)
+def test_catalog_agrees_with_the_database(objects, galaxies, query):
+    """Checks that facet counts and matching ids from the snapshot equal the database queries."""
+    query = query.format(planet=objects[0].type_id, star=objects[1].type_id, milky_way=galaxies[0].pk)
+    filters = facets.parse_filters(QueryDict(query))
+    snapshot = catalog.snapshot()
+
+    assert snapshot.facet_counts(filters) == facets.facet_counts(filters)
+    for sort in (None, "name", "-distance", "year"):
+        expected = facets.order_objects(facets.filter_objects(AstronomicalObject.objects.all(), filters), sort)
+        if sort == "year":
+            expected = expected.exclude(discovery_year=None)
+            assert list(snapshot.ids(filters, sort))[:expected.count()] == list(expected.values_list("pk", flat=True))
+        else:
+            assert list(snapshot.ids(filters, sort)) == list(expected.values_list("pk", flat=True))
+
+
+@pytest.mark.django_db
+def test_object_list_pages_from_the_snapshot(client, objects, django_assert_num_queries):
+    """Checks that a warm object list only loads the objects of the shown page."""
+    client.get(reverse("list-objects"))
+    with django_assert_num_queries(1):
+        response = client.get(reverse("list-objects"), {"sort": "-distance"})
+        names = [obj.name for obj in response.context["objects"]]
+    assert names == ["Andromeda Nebula", "Sirius", "Jupiter", "Mars"]
+    assert response.context["facets"]["total"] == 4
+
+
+@pytest.mark.django_db
+def test_snapshot_is_rebuilt_when_the_catalog_changes(objects, django_capture_on_commit_callbacks):
+    """Checks that a committed save or a version bump by another worker replaces the mapped file."""
+    _new_request()
+    first = catalog.snapshot()
+    assert first.count == 4
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        AstronomicalObject.objects.create(name="Halley's Comet", type=objects[0].type, distance_from_earth=0.0005)
+    assert catalog.snapshot() is first  # not committed yet
+    for callback in callbacks:
+        callback()
+    second = catalog.snapshot()
+    assert second.count == 5
+    assert second.name(4) == "Halley's Comet"
+    assert first.count == 4  # the old mapping stays readable
+
+    _new_request()
+    assert catalog.snapshot() is second
+    cache.set(catalog.VERSION_KEY, "bumped-by-another-worker")
+    _new_request()
+    assert catalog.snapshot().version == "bumped-by-another-worker"
+
+
+@pytest.mark.django_db
+def test_build_catalog_snapshot_command(objects, settings):
+    """Checks that the snapshot can be written ahead of the first request."""
+    out = StringIO()
+    call_command("build_catalog_snapshot", stdout=out)
+    assert "Wrote 4 objects" in out.getvalue()
+    assert catalog.CatalogSnapshot(settings.CATALOG_SNAPSHOT_PATH).name(3) == "Andromeda Nebula"
+
+
+@pytest.mark.django_db
+def test_stale_snapshot_is_served_while_rebuilt_in_the_background(objects, settings, monkeypatch):
+    """Checks that a worker keeps its old mapping and leaves the rebuild to a background thread."""
+    _new_request()
+    first = catalog.snapshot()
+    settings.CATALOG_SNAPSHOT_BACKGROUND_REBUILD = True
+    started = []
+    monkeypatch.setattr(catalog, "_rebuild_in_background", started.append)
+    cache.set(catalog.VERSION_KEY, "bumped-after-a-commit")
+    _new_request()
+    assert catalog.snapshot() is first
+    assert started == ["bumped-after-a-commit"]
+
+    # The thread's build, another worker holding the version's build lock makes it a no-op.
+    cache.add(f"{catalog.BUILDING_KEY}:bumped-after-a-commit", True)
+    assert catalog.rebuild("bumped-after-a-commit") is None
+    cache.delete(f"{catalog.BUILDING_KEY}:bumped-after-a-commit")
+    assert catalog.rebuild("bumped-after-a-commit") == 4
+    _new_request()
+    assert catalog.snapshot().version == "bumped-after-a-commit"
@@ -0,0 +1,62 @@
+import pytest
+from django.core.signals import request_started
+from django.urls import reverse
+from conftest import astronomical_objects, galaxies
+from NebulaNotesApp import reference
+from NebulaNotesApp.models import AstronomicalObject
+
+
+@pytest.fixture
+def catalog(astronomical_objects, galaxies):
+    AstronomicalObject.objects.filter(name="Mars").update(galaxy=galaxies[0], discovery_year=1600)
+    AstronomicalObject.objects.filter(name="Sirius").update(galaxy=galaxies[0], discovery_year=1844)
+    return astronomical_objects
+
+
+def _counts(facets):
+    return {facet["label"]: facet["count"] for facet in facets}
+
+
+@pytest.mark.django_db
+def test_object_list_combines_filters(client, catalog, galaxies):
+    """Checks that type, galaxy, distance and year filters can be combined."""
+    planet = catalog[0].type
+    response = client.get(reverse("list-objects"), {"type": planet.id, "galaxy": galaxies[0].id})
+    assert [obj.name for obj in response.context["objects"]] == ["Mars"]
+
+    response = client.get(reverse("list-objects"), {"distance_min": "1", "year_max": "1900"})
+    assert [obj.name for obj in response.context["objects"]] == ["Sirius"]
+
+    response = client.get(reverse("list-objects"), {"galaxy": "none", "year_min": "oops"})
+    assert [obj.name for obj in response.context["objects"]] == ["Jupiter"]
+
+
+@pytest.mark.django_db
+def test_facet_counts_leave_out_their_own_filter(client, catalog, django_assert_num_queries):
+    """Checks that every facet is counted with the other filters applied, in one grouped query."""
+    planet = catalog[0].type
+    # The fixture's writes aren't committed, a request loads the snapshot of the reference tables.
+    request_started.send(sender=None)
+    reference.snapshot()
+    with django_assert_num_queries(2):
+        response = client.get(reverse("list-objects"), {"type": planet.id})
+        list(response.context["objects"])
+    facets = response.context["facets"]
+
+    assert facets["total"] == 2
+    assert _counts(facets["type"]) == {"Planet": 2, "Star": 1}
+    assert _counts(facets["galaxy"]) == {"Milky Way": 1, "No galaxy": 1}
+    assert _counts(facets["distance"]) == {
+        "Solar System": 2, "Nearby stars": 0, "Milky Way": 0, "Local Group": 0, "Beyond": 0,
+    }
+    assert _counts(facets["year"])["Before 1800"] == 1
+    assert _counts(facets["year"])["Unknown"] == 1
+    assert [facet["selected"] for facet in facets["type"]] == [True, False]
+
+
+@pytest.mark.django_db
+def test_facet_links_keep_the_other_filters(client, catalog):
+    """Checks that range links replace their own parameters and keep the rest."""
+    planet = catalog[0].type
+    response = client.get(reverse("list-objects"), {"type": planet.id, "distance_min": "5"})
+    assert f'href="?type={planet.id}&amp;distance_max=0.001"'.encode() in response.content
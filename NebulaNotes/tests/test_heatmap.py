@@ -0,0 +1,107 @@
+import datetime
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils.timezone import make_aware
+from conftest import astronomical_objects, test_user
+from NebulaNotesApp import heatmap
+from NebulaNotesApp.ingest import ingest_observations
+from NebulaNotesApp.models import HeatmapCell, Observation
+
+KRAKOW = (50.06, 19.94)
+SYDNEY = (-33.87, 151.21)
+
+
+def _observe(user, obj, coordinates, month=4):
+    return Observation.objects.create(
+        user=user, astronomical_object=obj, latitude=coordinates[0], longitude=coordinates[1],
+        observation_date=make_aware(datetime.datetime(2024, month, 15, 21)),
+    )
+
+
+def _world(client, **params):
+    return json.loads(client.get(reverse("heatmap-tile", args=[0, 0, 0]), params).content)["cells"]
+
+
+def test_quadkeys_round_trip():
+    """Checks that tile coordinates and quadkeys convert both ways."""
+    x, y = heatmap.tile_xy(*KRAKOW, 3)
+    assert (x, y) == (4, 2)
+    assert heatmap.quadkey(x, y, 3) == "120"
+    assert heatmap.tile_of("120") == (3, 4, 2)
+
+
+@pytest.mark.django_db
+def test_counts_follow_observations(client, test_user, astronomical_objects):
+    """Checks that saving, moving and deleting observations updates the tile counts."""
+    mars, sirius, _ = astronomical_objects
+    first = _observe(test_user, mars, KRAKOW)
+    _observe(test_user, sirius, KRAKOW, month=5)
+    _observe(test_user, mars, SYDNEY)
+    Observation.objects.create(user=test_user, astronomical_object=mars, observation_date=first.observation_date)
+
+    assert sorted(cell[2] for cell in _world(client)) == [1, 2]
+    assert len(_world(client, type=mars.type_id)) == 2
+    assert _world(client, month="2024-05") == [[heatmap.tile_xy(*KRAKOW, 4)[0], heatmap.tile_xy(*KRAKOW, 4)[1], 1]]
+
+    first.latitude, first.longitude = SYDNEY
+    first.save()
+    assert sorted(cell[2] for cell in _world(client, type=mars.type_id)) == [2]
+    first.delete()
+    assert sorted(cell[2] for cell in _world(client, type=mars.type_id)) == [1]
+
+    mars.type = sirius.type
+    mars.save()
+    assert _world(client, type=astronomical_objects[2].type_id) == []
+
+    counts = {(cell.quadkey, cell.object_type_id, cell.month): cell.count for cell in HeatmapCell.objects.all()}
+    heatmap.rebuild()
+    assert counts == {(cell.quadkey, cell.object_type_id, cell.month): cell.count for cell in HeatmapCell.objects.all()}
+
+
+@pytest.mark.django_db
+def test_drifted_counts_stop_at_zero(test_user, astronomical_objects):
+    """Checks that a delta larger than a cell's count empties the cell instead of making it negative."""
+    mars, _, _ = astronomical_objects
+    observation = _observe(test_user, mars, KRAKOW)
+    keys = heatmap.cell_keys(mars.type_id, *KRAKOW, observation.observation_date)
+    _observe(test_user, mars, SYDNEY)
+    heatmap.apply({key: -3 for key in keys})
+    assert not HeatmapCell.objects.filter(quadkey__in=[key for _, _, key in keys]).exists()
+    assert set(HeatmapCell.objects.values_list("count", flat=True)) == {1}
+
+
+@pytest.mark.django_db
+def test_tile_is_served_with_cache_headers(client, test_user, astronomical_objects):
+    """Checks that tiles are cacheable, revalidate with their ETag and only exist up to the deepest zoom."""
+    _observe(test_user, astronomical_objects[0], KRAKOW)
+    x, y = heatmap.tile_xy(*KRAKOW, 2)
+    response = client.get(reverse("heatmap-tile", args=[2, x, y]))
+    assert response["Content-Type"] == "application/json"
+    assert "public" in response["Cache-Control"] and "max-age=86400" in response["Cache-Control"]
+    assert json.loads(response.content)["cells"][0][2] == 1
+    assert client.get(reverse("heatmap-tile", args=[2, x, y]), HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 304
+
+    assert client.get(reverse("heatmap-tile", args=[1, 2, 0])).status_code == 404
+    assert client.get(reverse("heatmap-tile", args=[heatmap.MAX_TILE_ZOOM + 1, 0, 0])).status_code == 404
+    assert client.get(reverse("heatmap")).status_code == 200
+
+
+@pytest.mark.django_db
+def test_ingest_and_rebuild(test_user, astronomical_objects):
+    """Checks that bulk-loaded coordinates are counted and the rebuild command gives the same counts."""
+    lines = [
+        json.dumps({"astronomical_object": obj.pk, "observation_date": "2024-04-15T20:00:00", "latitude": KRAKOW[0], "longitude": KRAKOW[1]})
+        for obj in astronomical_objects
+    ]
+    ingest_observations(lines, test_user)
+    counts = dict(HeatmapCell.objects.filter(zoom=heatmap.MAX_ZOOM).values_list("object_type__name", "count"))
+    assert counts == {"Planet": 2, "Star": 1}
+
+    HeatmapCell.objects.all().delete()
+    out = StringIO()
+    call_command("rebuild_heatmap", stdout=out)
+    assert f"Stored {2 * (heatmap.MAX_ZOOM - heatmap.DETAIL + 1)} heatmap cells." in out.getvalue()
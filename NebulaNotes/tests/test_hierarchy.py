@@ -0,0 +1,120 @@
+import datetime
+
+import pytest
+from django.urls import reverse
+from django.utils.timezone import make_aware
+from conftest import test_user, astronomical_objects
+from NebulaNotesApp import hierarchy
+from NebulaNotesApp.forms import ObjectForm
+from NebulaNotesApp.models import AstronomicalObject, AstronomicalObjectType, ObjectClosure, Observation
+
+
+def _links():
+    return set(ObjectClosure.objects.values_list("ancestor_id", "descendant_id", "depth"))
+
+
+def _consistent():
+    """Returns whether the maintained closure rows equal the ones rebuilt from the parents."""
+    maintained = _links()
+    hierarchy.rebuild()
+    return maintained == _links()
+
+
+@pytest.fixture
+def solar_system(astronomical_objects):
+    """Puts Mars and Jupiter into the Solar System and gives Jupiter a moon."""
+    mars, _, jupiter = astronomical_objects
+    system = AstronomicalObject.objects.create(
+        name="Solar System", type=AstronomicalObjectType.objects.create(name="Planetary system"), distance_from_earth=0,
+    )
+    for planet in (mars, jupiter):
+        planet.parent = system
+        planet.save()
+    io = AstronomicalObject.objects.create(name="Io", type=mars.type, distance_from_earth=0.000082, parent=jupiter)
+    return system, mars, jupiter, io
+
+
+@pytest.mark.django_db
+def test_subtree_and_ancestors(solar_system):
+    """Checks that subtree and ancestor queries follow the parents at any depth."""
+    system, mars, jupiter, io = solar_system
+    assert sorted(hierarchy.descendants(system), key=str) == [io, jupiter, mars]
+    assert hierarchy.descendants(system, include_self=True).count() == 4
+    assert list(hierarchy.ancestors(io)) == [system, jupiter]
+    assert hierarchy.is_within(io.pk, system.pk)
+    assert not hierarchy.is_within(system.pk, io.pk)
+    assert _consistent()
+
+
+@pytest.mark.django_db
+def test_moving_and_deleting_keep_the_closure(solar_system, astronomical_objects):
+    """Checks that moving a subtree and deleting its root leave the same rows as a rebuild."""
+    system, mars, jupiter, io = solar_system
+    sirius = astronomical_objects[1]
+    jupiter.parent = sirius
+    jupiter.save()
+    assert set(hierarchy.descendants(sirius)) == {jupiter, io}
+    assert set(hierarchy.descendants(system)) == {mars}
+    assert _consistent()
+
+    jupiter.delete()
+    io.refresh_from_db()
+    assert io.parent is None
+    assert list(hierarchy.ancestors(io)) == []
+    assert list(hierarchy.descendants(sirius)) == []
+    assert _consistent()
+
+
+@pytest.mark.django_db
+def test_objects_cannot_contain_themselves(client, django_user_model, solar_system):
+    """Checks that an object can't be moved inside its own subtree."""
+    system, _, _, io = solar_system
+    form = ObjectForm(
+        {"name": system.name, "type": system.type_id, "distance_from_earth": 0, "parent": io.name}, instance=system,
+    )
+    assert not form.is_valid()
+    assert "parent" in form.errors
+    assert ObjectForm(instance=io).initial["parent"] == "Jupiter"
+
+    django_user_model.objects.create_superuser(username="curator", password="curatorpass")
+    client.login(username="curator", password="curatorpass")
+    response = client.post(reverse("admin:NebulaNotesApp_astronomicalobject_change", args=[system.pk]), {
+        "name": system.name, "type": system.type_id, "distance_from_earth": 0, "parent": io.pk, "description": "",
+    })
+    assert response.status_code == 200
+    assert "inside itself" in response.content.decode()
+
+    system.parent = io
+    with pytest.raises(ValueError):
+        system.save()
+
+
+@pytest.mark.django_db
+def test_object_suggestions(client, astronomical_objects):
+    """Checks that the object name input gets suggestions by name prefix instead of a dropdown of the catalog."""
+    assert client.get(reverse("suggest-objects"), {"q": "Ma"}).json() == {"names": ["Mars"]}
+    assert client.get(reverse("suggest-objects")).json() == {"names": []}
+    html = ObjectForm()["parent"].as_widget()
+    assert 'list="id_parent-suggestions"' in html and "<option" not in html
+
+
+@pytest.mark.django_db
+def test_observations_within_an_object(client, test_user, solar_system, astronomical_objects, django_assert_num_queries):
+    """Checks that the observation list can show everything observed inside an object with one query."""
+    system, _, _, io = solar_system
+    for obj in (io, astronomical_objects[1]):
+        Observation.objects.create(
+            user=test_user, astronomical_object=obj, observation_date=make_aware(datetime.datetime(2024, 4, 15, 21)),
+        )
+    with django_assert_num_queries(1):
+        assert [o.astronomical_object for o in Observation.objects.filter(
+            astronomical_object__ancestor_links__ancestor=system,
+        ).select_related("astronomical_object")] == [io]
+
+    client.login(username="testuser", password="testpass")
+    response = client.get(reverse("list-observations"), {"within": system.pk})
+    assert [observation.astronomical_object for observation in response.context["observations"]] == [io]
+
+    response = client.get(reverse("object-detail", args=[system.pk]))
+    assert response.context["member_count"] == 3
+    assert "Io" not in [child.name for child in response.context["children"]]
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from conftest import test_user, astronomical_objects, events
+from NebulaNotesApp.models import ApiToken, Observation
+
+
+def _ndjson(*rows):
+    return "\n".join(row if isinstance(row, str) else json.dumps(row) for row in rows)
+
+
+@pytest.mark.django_db
+def test_ingest_requires_login(client):
+    """Checks that anonymous users can't ingest observations."""
+    response = client.post(reverse("ingest-observations"), "", content_type="application/x-ndjson")
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_ingest_creates_observations(client, test_user, astronomical_objects, events, django_assert_max_num_queries):
+    """Checks that valid rows are created for the logged-in user with a fixed number of queries."""
+    client.login(username=test_user.username, password="testpass")
+    rows = [
+        {"astronomical_object": obj.id, "event": events[0].id, "observation_date": "2024-04-15T20:00:00", "notes": f"frame {i}"}
+        for i, obj in enumerate(astronomical_objects * 10)
+    ]
+    # Includes reading the user's observed objects and updating the co-observation counts.
+    with django_assert_max_num_queries(11):
+        response = client.post(reverse("ingest-observations"), _ndjson(*rows), content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    assert response.json() == {"created": 30, "errors": []}
+    assert Observation.objects.filter(user=test_user).count() == 30
+
+
+@pytest.mark.django_db
+def test_ingest_reports_row_errors(client, test_user, astronomical_objects):
+    """Checks that invalid rows are reported per line without aborting the valid ones."""
+    client.login(username=test_user.username, password="testpass")
+    body = _ndjson(
+        {"astronomical_object": astronomical_objects[0].id, "observation_date": "2024-04-15T20:00:00"},
+        {"astronomical_object": 999, "observation_date": "2024-04-15T20:00:00"},
+        "not json",
+        {"astronomical_object": astronomical_objects[1].id, "observation_date": "2999-01-01T00:00:00"},
+    )
+    response = client.post(reverse("ingest-observations"), body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["created"] == 1
+    assert [error["line"] for error in result["errors"]] == [2, 3, 4]
+    assert "astronomical_object" in result["errors"][0]["errors"]
+    assert "observation_date" in result["errors"][2]["errors"]
+    assert Observation.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_ingest_accepts_api_tokens_without_csrf(test_user, astronomical_objects, capsys):
+    """Checks that a telescope can post with an API token alone, while cookie sessions still need the CSRF token."""
+    call_command("create_api_token", test_user.username, name="Backyard dome")
+    key = capsys.readouterr().out.strip()
+    assert ApiToken.objects.get(user=test_user).key_hash != key
+    client = Client(enforce_csrf_checks=True)
+    row = _ndjson({"astronomical_object": astronomical_objects[0].id, "observation_date": "2024-04-15T20:00:00"})
+
+    response = client.post(reverse("ingest-observations"), row, content_type="application/x-ndjson", HTTP_AUTHORIZATION=f"Bearer {key}")
+    assert response.status_code == 200
+    assert Observation.objects.filter(user=test_user).count() == 1
+    assert ApiToken.objects.get(user=test_user).last_used is not None
+
+    assert client.post(reverse("ingest-observations"), row, content_type="application/x-ndjson", HTTP_AUTHORIZATION="Bearer nn_wrong").status_code == 403
+    client.login(username=test_user.username, password="testpass")
+    assert client.post(reverse("ingest-observations"), row, content_type="application/x-ndjson").status_code == 403
+    assert Observation.objects.filter(user=test_user).count() == 1
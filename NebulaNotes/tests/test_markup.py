@@ -0,0 +1,66 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from conftest import test_user, astronomical_objects, galaxies
+from NebulaNotesApp import markup
+from NebulaNotesApp.models import AstronomicalObject, Galaxy, Observation
+
+
+def test_markdown_is_sanitized():
+    """Checks that Markdown becomes HTML without scripts, event handlers or javascript: links."""
+    html = markup.render("* [NASA](https://nasa.gov)\n* <script>alert(1)</script>**bold**\n\n[x](javascript:alert(1))")
+    assert "<li><a href=\"https://nasa.gov\" rel=\"nofollow noopener\">NASA</a></li>" in html
+    assert "<strong>bold</strong>" in html
+    assert "<script" not in html and "javascript:" not in html
+    assert 'onerror' not in markup.render('<img src="x" onerror="alert(1)">')
+    assert markup.render("") == ""
+
+
+def test_markdown_tables_keep_their_alignment():
+    """Checks that Markdown tables are rendered with the alignment of their columns."""
+    html = markup.render("| Object | Magnitude |\n|:--|--:|\n| Sirius | -1.46 |")
+    assert '<th align="left">Object</th>' in html and '<td align="right">-1.46</td>' in html
+    assert "<table>" in html and "<tbody>" in html and "style=" not in html
+
+
+@pytest.mark.django_db
+def test_html_is_rendered_on_save_and_shown(client, astronomical_objects):
+    """Checks that saving stores the rendered HTML which the detail and list pages show."""
+    mars = astronomical_objects[0]
+    mars.description = "The *red* planet"
+    mars.save()
+    mars.refresh_from_db()
+    assert mars.description_html == "<p>The <em>red</em> planet</p>"
+    assert mars.markup_version == markup.VERSION
+
+    assert "<p>The <em>red</em> planet</p>" in client.get(reverse("object-detail", args=[mars.pk])).content.decode()
+    assert "<p>The <em>red</em> planet</p>" in client.get(reverse("list-objects")).content.decode()
+
+
+@pytest.mark.django_db
+def test_stale_html_is_rerendered(client, galaxies):
+    """Checks that rows of an older renderer are rendered when shown and in bulk by the command."""
+    Galaxy.objects.filter(pk=galaxies[0].pk).update(
+        description="Our **home**", description_html="<p>old</p>", markup_version=0,
+    )
+    content = client.get(reverse("galaxy-detail", args=[galaxies[0].pk])).content.decode()
+    assert "<strong>home</strong>" in content and "<p>old</p>" not in content
+    assert Galaxy.objects.get(pk=galaxies[0].pk).description_html == "<p>old</p>"
+
+    call_command("render_markup", batch_size=1, stdout=StringIO())
+    assert not markup.stale(Galaxy).exists()
+    assert Galaxy.objects.get(pk=galaxies[0].pk).description_html == "<p>Our <strong>home</strong></p>"
+
+
+@pytest.mark.django_db
+def test_ingested_notes_are_rendered(client, test_user, astronomical_objects):
+    """Checks that bulk-created observations get their notes rendered too."""
+    client.login(username="testuser", password="testpass")
+    row = {"astronomical_object": astronomical_objects[0].pk, "observation_date": "2024-04-15T20:00:00Z", "notes": "Seen with `f/5`"}
+    client.post(reverse("ingest-observations"), json.dumps(row), content_type="application/x-ndjson")
+    observation = Observation.objects.get()
+    assert observation.notes_html == "<p>Seen with <code>f/5</code></p>"
+    assert observation.markup_version == markup.VERSION
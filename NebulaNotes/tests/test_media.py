@@ -0,0 +1,145 @@
+import hashlib
+from io import StringIO
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from conftest import astronomical_objects, galaxies
+from NebulaNotesApp.models import Blob, Galaxy
+
+
+@pytest.fixture
+def media_file(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / "galaxy_images").mkdir()
+    (tmp_path / "galaxy_images" / "m31.jpg").write_bytes(bytes(range(256)) * 4)
+    return reverse("media", args=["galaxy_images/m31.jpg"])
+
+
+def test_media_file_is_served_with_validators(client, media_file):
+    """Checks that uploaded files are served with ETag, Accept-Ranges and cache headers."""
+    response = client.get(media_file)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "image/jpeg"
+    assert response["Content-Length"] == "1024"
+    assert response["Accept-Ranges"] == "bytes"
+    assert response["Cache-Control"] == "public, max-age=86400"
+    assert len(b"".join(response.streaming_content)) == 1024
+
+    response = client.get(media_file, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 304
+
+
+def test_media_range_requests(client, media_file):
+    """Checks that byte ranges are answered with 206 and unsatisfiable ones with 416."""
+    response = client.get(media_file, HTTP_RANGE="bytes=10-19")
+    assert response.status_code == 206
+    assert response["Content-Range"] == "bytes 10-19/1024"
+    assert response["Content-Length"] == "10"
+    assert b"".join(response.streaming_content) == bytes(range(10, 20))
+
+    response = client.get(media_file, HTTP_RANGE="bytes=-4")
+    assert response["Content-Range"] == "bytes 1020-1023/1024"
+    assert b"".join(response.streaming_content) == bytes(range(252, 256))
+
+    response = client.get(media_file, HTTP_RANGE="bytes=2000-")
+    assert response.status_code == 416
+    assert response["Content-Range"] == "bytes */1024"
+
+
+def test_media_range_ignored_for_stale_if_range(client, media_file):
+    """Checks that the whole file is sent when the If-Range validator doesn't match."""
+    response = client.get(media_file, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+    assert response.status_code == 200
+    assert response["Content-Length"] == "1024"
+
+
+def test_media_transfer_is_handed_to_nginx(client, settings, media_file):
+    """Checks that X-Accel-Redirect is used when the front-end server is configured."""
+    settings.MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+    response = client.get(media_file)
+    assert response["X-Accel-Redirect"] == "/protected-media/galaxy_images/m31.jpg"
+    assert response.content == b""
+
+
+def test_media_paths_outside_media_root(client, media_file):
+    """Checks that traversal, hidden and missing files are not served."""
+    assert client.get("/media/../settings.py").status_code == 404
+    assert client.get(reverse("media", args=[".hidden"])).status_code == 404
+    assert client.get(reverse("media", args=["galaxy_images/missing.jpg"])).status_code == 404
+
+
+def test_media_login_required(client, settings, media_file):
+    """Checks that anonymous users are refused when media requires a login."""
+    settings.MEDIA_LOGIN_REQUIRED = True
+    assert client.get(media_file).status_code == 403
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def _image(content=b"hubble"):
+    return SimpleUploadedFile("pillars.jpg", content, content_type="image/jpeg")
+
+
+@pytest.mark.django_db
+def test_identical_uploads_share_one_blob(media_root, galaxies, astronomical_objects):
+    """Checks that the same image uploaded for two rows is stored once and counted twice."""
+    galaxy, obj = galaxies[0], astronomical_objects[0]
+    galaxy.image = _image()
+    galaxy.save()
+    obj.image = _image()
+    obj.save()
+
+    digest = hashlib.sha256(b"hubble").hexdigest()
+    assert galaxy.image.name == obj.image.name == f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+    assert len([path for path in media_root.rglob("*") if path.is_file()]) == 1
+    assert Blob.objects.get(name=galaxy.image.name).refcount == 2
+
+    obj.delete()
+    galaxy.image = _image(b"webb")
+    galaxy.save()
+    assert Blob.objects.get(name=f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg").refcount == 0
+    assert Blob.objects.get(name=galaxy.image.name).refcount == 1
+
+
+@pytest.mark.django_db
+def test_gc_media_deletes_unreferenced_blobs(media_root, galaxies):
+    """Checks that only unreferenced blobs older than the grace period are deleted."""
+    galaxy = galaxies[0]
+    galaxy.image = _image()
+    galaxy.save()
+    galaxy.image = _image(b"webb")
+    galaxy.save()
+    orphan = media_root / Blob.objects.get(refcount=0).name
+
+    call_command("gc_media", stdout=StringIO())
+    assert orphan.exists()
+
+    call_command("gc_media", grace_hours=0, stdout=StringIO())
+    assert not orphan.exists()
+    assert (media_root / galaxy.image.name).exists()
+    assert list(Blob.objects.values_list("name", flat=True)) == [galaxy.image.name]
+
+
+@pytest.mark.django_db
+def test_dedupe_media_moves_existing_files(media_root, galaxies):
+    """Checks that files stored before deduplication are moved into shared blobs."""
+    for galaxy in galaxies[:2]:
+        path = media_root / "galaxy_images" / f"{galaxy.pk}.jpg"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"hubble")
+        Galaxy.objects.filter(pk=galaxy.pk).update(image=f"galaxy_images/{galaxy.pk}.jpg")
+
+    out = StringIO()
+    call_command("dedupe_media", stdout=out)
+    assert "Moved 2 files into 1 blobs, saved 6 bytes." in out.getvalue()
+
+    names = set(Galaxy.objects.exclude(image="").values_list("image", flat=True))
+    assert len(names) == 1
+    assert Blob.objects.get(name=names.pop()).refcount == 2
+    assert not list((media_root / "galaxy_images").iterdir())
@@ -0,0 +1,90 @@
+import pytest
+from django.urls import reverse
+from conftest import galaxies
+from NebulaNotesApp.metrics import Counter, Histogram, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Checks that histograms are exported in the Prometheus text format."""
+    histogram = Histogram("test_seconds", "Test histogram.", ["view"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, view="home")
+    histogram.observe(0.5, view="home")
+    histogram.observe(5, view="home")
+    assert histogram.render().splitlines() == [
+        "# HELP test_seconds Test histogram.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{view="home",le="0.1"} 1',
+        'test_seconds_bucket{view="home",le="1.0"} 2',
+        'test_seconds_bucket{view="home",le="+Inf"} 3',
+        'test_seconds_sum{view="home"} 5.55',
+        'test_seconds_count{view="home"} 3',
+    ]
+
+
+def test_counter_escapes_labels():
+    """Checks that label values are escaped."""
+    counter = Counter("test_events", "Test counter.", ["route"])
+    counter.inc(route='a"b')
+    assert 'test_events_total{route="a\\"b"} 1.0' in counter.render()
+
+
+def test_metrics_are_summed_over_worker_processes(settings, tmp_path):
+    """Checks that with METRICS_DIR every process exports the sum of all workers' values, also of exited ones."""
+    settings.METRICS_DIR = str(tmp_path)
+    workers = []
+    for _ in range(2):
+        registry = Registry()
+        workers.append((
+            registry,
+            registry.register(Counter("test_events", "Test counter.", ["route"])),
+            registry.register(Histogram("test_seconds", "Test histogram.", buckets=(1.0,))),
+        ))
+    (first, first_counter, first_histogram), (second, second_counter, second_histogram) = workers
+    first_counter.inc(route="home")
+    first_histogram.observe(0.5)
+    first.flush(force=True)
+    second_counter.inc(2, route="home")
+    second_counter.inc(route="list")
+    second_histogram.observe(2)
+
+    # Rendering writes the scraped process's own values first, the other one's file can be FLUSH_INTERVAL behind.
+    for registry in (second, first):
+        lines = registry.render().splitlines()
+        assert 'test_events_total{route="home"} 3.0' in lines
+        assert 'test_events_total{route="list"} 1.0' in lines
+        assert 'test_seconds_bucket{le="1.0"} 1' in lines and 'test_seconds_count 2' in lines
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+
+@pytest.mark.django_db
+def test_server_timing_header(client, galaxies):
+    """Checks that responses report database, view and template timings."""
+    response = client.get(reverse("list-galaxies"))
+    server_timing = response["Server-Timing"]
+    assert 'db;dur=' in server_timing
+    assert 'queries"' in server_timing
+    assert "view;dur=" in server_timing
+    assert 'tpl;dur=' in server_timing and 'desc="nebulanotes_app/galaxy_list.html"' in server_timing
+    assert "total;dur=" in server_timing
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, galaxies, settings):
+    """Checks that per-view histograms are exported on /metrics."""
+    settings.METRICS_TOKEN = "scrape-token"
+    client.get(reverse("list-galaxies"))
+    response = client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-token")
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert 'nebulanotes_request_duration_seconds_count{view="list-galaxies",phase="template"}' in content
+    assert 'nebulanotes_request_queries_count{view="list-galaxies"}' in content
+
+
+def test_metrics_endpoint_is_restricted(client, settings):
+    """Checks that only scrapers with the token can read the metrics, whatever their address."""
+    settings.METRICS_TOKEN = ""
+    assert client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ").status_code == 403
+    settings.METRICS_TOKEN = "scrape-token"
+    assert client.get(reverse("metrics")).status_code == 403
+    assert client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong").status_code == 403
+    assert client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-token").status_code == 200
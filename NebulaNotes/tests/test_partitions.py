@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.urls import reverse
+from conftest import test_user, astronomical_objects, events, observations
+from NebulaNotesApp.partitions import is_partitioned, next_period, partition_name, period_start
+
+
+def test_partition_periods():
+    """Checks that yearly and monthly partition ranges and names line up."""
+    assert period_start(date(2025, 4, 17), "year") == date(2025, 1, 1)
+    assert period_start(date(2025, 4, 17), "month") == date(2025, 4, 1)
+    assert next_period(date(2025, 12, 1), "month") == date(2026, 1, 1)
+    assert next_period(date(2025, 1, 1), "year") == date(2026, 1, 1)
+    assert partition_name(date(2025, 4, 1), "month") == "NebulaNotesApp_observation_y2025m04"
+    assert partition_name(date(2025, 1, 1), "year") == "NebulaNotesApp_observation_y2025"
+
+
+@pytest.mark.django_db
+def test_observation_table_stays_plain_outside_postgresql():
+    """Checks that the partitioning migration leaves the table alone on other databases."""
+    if connection.vendor != "postgresql":
+        assert not is_partitioned(connection)
+        with pytest.raises(CommandError):
+            call_command("observation_partitions")
+
+
+@pytest.mark.django_db
+def test_observation_list_date_range(client, test_user, observations):
+    """Checks that the list can be limited to a range of days."""
+    client.login(username="testuser", password="testpass")
+    response = client.get(reverse("list-observations"), {"since": "2024-04-16", "until": "2024-04-30"})
+    assert [observation.notes for observation in response.context["observations"]] == ["A beautiful star"]
+
+    response = client.get(reverse("list-observations"), {"since": "not-a-date"})
+    assert len(response.context["observations"]) == 2
+
+
+@pytest.mark.django_db
+def test_observation_detail_on_day(client, test_user, observations):
+    """Checks that the detail view only looks on the day given by the list link."""
+    client.login(username="testuser", password="testpass")
+    url = reverse("observation-detail", args=[observations[0].id])
+    assert client.get(url, {"on": "2024-04-15"}).status_code == 200
+    assert client.get(url, {"on": "2024-04-16"}).status_code == 404
@@ -0,0 +1,97 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+from conftest import test_user, galaxies
+from NebulaNotesApp.middleware import ProfilingMiddleware
+from NebulaNotesApp.models import ProfileReport
+
+User = get_user_model()
+
+
+@pytest.fixture
+def staff_client(client, db):
+    """Logs in a staff user."""
+    User.objects.create_user(username="curator", password="curatorpass", is_staff=True)
+    client.login(username="curator", password="curatorpass")
+    return client
+
+
+@pytest.fixture
+def profiling(settings):
+    """Turns the profiling middleware on."""
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_SAMPLE_RATE = 0
+
+
+def test_profiling_is_dropped_when_off(settings):
+    """Checks that requests don't go through the middleware unless profiling is enabled."""
+    settings.PROFILING_ENABLED = False
+    with pytest.raises(MiddlewareNotUsed):
+        ProfilingMiddleware(lambda request: None)
+
+
+@pytest.mark.django_db
+def test_header_profiles_staff_requests(staff_client, profiling, galaxies):
+    """Checks that a staff request with the header stores its phases, allocation sites and call tree."""
+    response = staff_client.get(reverse("list-galaxies"), headers={"X-Profile": "calls"})
+    assert response.status_code == 200
+
+    report = ProfileReport.objects.get()
+    assert report.view == "list-galaxies"
+    assert report.trigger == "header"
+    assert report.peak_memory > 0
+    assert report.phases["view"]["peak"] >= 0
+    assert report.phases["template"]["sites"]
+    assert report.phases["orm"]["allocated"] > 0
+    assert report.call_tree
+
+    staff_client.get(reverse("list-galaxies"))
+    assert ProfileReport.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_header_is_ignored_for_other_users(client, test_user, profiling, settings):
+    """Checks that only staff can ask for a profile, sampled requests are profiled for everyone."""
+    client.login(username="testuser", password="testpass")
+    client.get(reverse("list-galaxies"), headers={"X-Profile": "1"})
+    assert not ProfileReport.objects.exists()
+
+    settings.PROFILING_SAMPLE_RATE = 1
+    client.get(reverse("list-galaxies"))
+    report = ProfileReport.objects.get()
+    assert report.trigger == "sample"
+    assert report.call_tree == ""
+
+
+@pytest.mark.django_db
+def test_sampled_reports_are_stripped_and_pruned(client, profiling, settings):
+    """Checks that sampled requests are stored without their query string and only the newest reports are kept."""
+    settings.PROFILING_SAMPLE_RATE = 1
+    settings.PROFILING_MAX_REPORTS = 2
+    client.get(reverse("list-galaxies"), {"q": "secret"})
+    first = ProfileReport.objects.get()
+    assert first.path == reverse("list-galaxies")
+    client.get(reverse("list-galaxies"))
+    client.get(reverse("list-galaxies"))
+    assert ProfileReport.objects.count() == 2
+    assert not ProfileReport.objects.filter(pk=first.pk).exists()
+
+    settings.PROFILING_MAX_REPORTS = 0
+    client.get(reverse("list-galaxies"))
+    assert ProfileReport.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_profile_pages_are_for_staff(client, test_user, staff_client, profiling):
+    """Checks that staff can read the reports and other users can't."""
+    staff_client.get(reverse("list-galaxies"), headers={"X-Profile": "1"})
+    report = ProfileReport.objects.get()
+    response = staff_client.get(reverse("list-profiles"))
+    assert list(response.context["reports"]) == [report]
+    response = staff_client.get(reverse("profile-detail", args=[report.pk]))
+    assert [name for name, _ in response.context["phases"]] == ["view", "orm", "template"]
+
+    staff_client.logout()
+    client.login(username="testuser", password="testpass")
+    assert client.get(reverse("list-profiles")).status_code == 403
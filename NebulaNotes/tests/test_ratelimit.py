@@ -0,0 +1,76 @@
+import pytest
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from NebulaNotesApp.metrics import RATE_LIMITED
+from NebulaNotesApp.ratelimit import LocalBuckets, Rule, client_ip, parse_rate
+
+
+def test_parse_rate():
+    """Checks that rates are read as requests per number of seconds."""
+    assert parse_rate("10/m") == (10, 60)
+    assert parse_rate("100/5m") == (100, 300)
+    with pytest.raises(ValueError):
+        parse_rate("ten per minute")
+
+
+def test_local_buckets_allow_bursts_then_refill(monkeypatch):
+    """Checks that a full bucket lets the burst through and then one request per interval."""
+    now = [1000.0]
+    monkeypatch.setattr("NebulaNotesApp.ratelimit.time.monotonic", lambda: now[0])
+    rule, buckets = Rule("login", "2/m", burst=3), LocalBuckets()
+    assert [buckets.take(rule, "a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take(rule, "a") == pytest.approx(30)
+    assert buckets.take(rule, "b") == 0
+
+    now[0] += 30
+    assert buckets.take(rule, "a") == 0
+    assert buckets.take(rule, "a") > 0
+
+
+def test_client_ip_is_forwarded_only_by_trusted_proxies(settings):
+    """Checks that X-Forwarded-For gives the client behind a trusted proxy and is ignored from anyone else."""
+    settings.TRUSTED_PROXIES = ["127.0.0.1", "10.0.0.0/8"]
+    factory = RequestFactory()
+    forwarded = {"HTTP_X_FORWARDED_FOR": "1.1.1.1, 203.0.113.7, 10.0.0.5"}
+    assert client_ip(factory.get("/", REMOTE_ADDR="127.0.0.1", **forwarded)) == "203.0.113.7"
+    assert client_ip(factory.get("/", REMOTE_ADDR="198.51.100.1", **forwarded)) == "198.51.100.1"
+    assert client_ip(factory.get("/", REMOTE_ADDR="127.0.0.1")) == "127.0.0.1"
+
+    settings.TRUSTED_PROXIES = []
+    assert client_ip(factory.get("/", REMOTE_ADDR="127.0.0.1", **forwarded)) == "127.0.0.1"
+
+
+@pytest.mark.django_db
+def test_requests_over_the_limit_get_429(settings):
+    """Checks that over-limit requests are rejected with Retry-After and counted."""
+    settings.RATE_LIMITS = {"list-galaxies": {"rate": "2/m", "key": "ip"}}
+    client = Client()
+    before = RATE_LIMITED.value(view="list-galaxies", key="ip")
+    assert [client.get(reverse("list-galaxies")).status_code for _ in range(2)] == [200, 200]
+
+    response = client.get(reverse("list-galaxies"))
+    assert response.status_code == 429
+    assert int(response["Retry-After"]) == 30
+    assert RATE_LIMITED.value(view="list-galaxies", key="ip") == before + 1
+
+    assert client.get(reverse("list-galaxies"), REMOTE_ADDR="10.0.0.2").status_code == 200
+    assert client.get(reverse("list-events")).status_code == 200
+
+
+@pytest.mark.django_db
+def test_rate_limit_only_applies_to_its_methods(settings):
+    """Checks that a POST-only rule leaves GET requests alone."""
+    settings.RATE_LIMITS = {"login": {"rate": "1/h", "key": "ip", "methods": ["POST"]}}
+    client = Client()
+    assert [client.get(reverse("login")).status_code for _ in range(3)] == [200, 200, 200]
+    client.post(reverse("login"), {"username": "x", "password": "y"})
+    assert client.post(reverse("login"), {"username": "x", "password": "y"}).status_code == 429
+
+
+@pytest.mark.django_db
+def test_cache_buckets_are_shared_between_workers(settings):
+    """Checks that with the cache backend separate middleware instances share the buckets."""
+    settings.RATE_LIMITS = {"list-galaxies": {"rate": "1/m", "key": "route"}}
+    settings.RATE_LIMIT_BACKEND = "NebulaNotesApp.ratelimit.CacheBuckets"
+    assert Client().get(reverse("list-galaxies")).status_code == 200
+    assert Client().get(reverse("list-galaxies")).status_code == 429
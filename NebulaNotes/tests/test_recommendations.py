@@ -0,0 +1,116 @@
+import datetime
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils.timezone import make_aware
+from conftest import astronomical_objects, test_user
+from NebulaNotesApp import recommendations
+from NebulaNotesApp.ingest import ingest_observations
+from NebulaNotesApp.models import CoObservation, Observation, User
+
+
+def _observe(user, obj, day=1):
+    return Observation.objects.create(user=user, astronomical_object=obj, observation_date=make_aware(datetime.datetime(2024, 4, day, 21)))
+
+
+def _counts():
+    return {(row.object.name, row.other.name): row.count for row in CoObservation.objects.select_related("object", "other")}
+
+
+@pytest.fixture
+def observers(test_user, astronomical_objects):
+    mars, sirius, jupiter = astronomical_objects
+    other = User.objects.create_user(username="otheruser", password="otherpass")
+    _observe(test_user, mars)
+    _observe(test_user, sirius, day=2)
+    _observe(other, mars)
+    _observe(other, jupiter, day=2)
+    _observe(other, mars, day=3)
+    return test_user, other
+
+
+@pytest.mark.django_db
+def test_counts_follow_saves_and_deletes(observers, astronomical_objects):
+    """Checks that pairs are counted once per observer and removed with their last observation."""
+    mars, sirius, jupiter = astronomical_objects
+    _, other = observers
+    assert _counts() == {
+        ("Mars", "Sirius"): 1, ("Sirius", "Mars"): 1, ("Mars", "Jupiter"): 1, ("Jupiter", "Mars"): 1,
+    }
+    names = {obj.pk: obj.name for obj in astronomical_objects}
+    assert _counts() == {(names[a], names[b]): count for (a, b), count in recommendations.count_pairs().items()}
+
+    Observation.objects.filter(user=other, astronomical_object=mars).first().delete()
+    assert _counts()[("Mars", "Jupiter")] == 1
+    observation = Observation.objects.get(user=other, astronomical_object=mars)
+    observation.astronomical_object = sirius
+    observation.save()
+    assert _counts() == {
+        ("Mars", "Sirius"): 1, ("Sirius", "Mars"): 1, ("Sirius", "Jupiter"): 1, ("Jupiter", "Sirius"): 1,
+    }
+
+
+@pytest.mark.django_db
+def test_suggestions_on_pages(client, observers, astronomical_objects):
+    """Checks that the object page lists co-observed objects and the observation list suggests new targets."""
+    mars, sirius, jupiter = astronomical_objects
+    user, _ = observers
+    response = client.get(reverse("object-detail", args=[mars.pk]))
+    assert [(obj.name, count) for obj, count in response.context["also_observed"]] == [("Sirius", 1), ("Jupiter", 1)]
+
+    client.force_login(user)
+    response = client.get(reverse("list-observations"))
+    assert [(obj.name, score) for obj, score in response.context["suggested_targets"]] == [("Jupiter", 1)]
+    assert "Suggested next targets" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_suggestions_score_only_top_neighbours(observers, astronomical_objects, monkeypatch, django_assert_num_queries):
+    """Checks that a recent object only adds its top unobserved neighbours, ranked by count, in one query."""
+    mars, sirius, jupiter = astronomical_objects
+    user, _ = observers
+    CoObservation.objects.filter(object=sirius, other=mars).update(count=5)
+    CoObservation.objects.filter(object=mars, other=jupiter).update(count=3)
+    CoObservation.objects.create(object=sirius, other=jupiter, count=2)
+    assert [(obj.name, score) for obj, score in recommendations.suggested_targets(user.pk)] == [("Jupiter", 5)]
+
+    monkeypatch.setattr(recommendations, "NEIGHBOURS_PER_OBJECT", 1)
+    # Mars, Sirius's top neighbour, is observed and left out before ranking, so Jupiter comes from both.
+    with django_assert_num_queries(3):
+        assert [(obj.name, score) for obj, score in recommendations.suggested_targets(user.pk)] == [("Jupiter", 5)]
+
+
+@pytest.mark.django_db
+def test_ingest_counts_new_objects(test_user, astronomical_objects):
+    """Checks that bulk-loaded observations update the counts like saved ones."""
+    mars, sirius, jupiter = astronomical_objects
+    _observe(test_user, mars)
+    lines = [
+        json.dumps({"astronomical_object": obj.pk, "observation_date": "2024-04-15T20:00:00"})
+        for obj in (sirius, jupiter, mars)
+    ]
+    ingest_observations(lines, test_user)
+    counts = _counts()
+    assert len(counts) == 6
+    assert set(counts.values()) == {1}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("with_scipy", [True, False])
+def test_rebuild_repairs_drifted_counts(observers, monkeypatch, with_scipy):
+    """Checks that the rebuild recomputes the counts from the observations, with and without SciPy."""
+    if with_scipy:
+        pytest.importorskip("scipy")
+    else:
+        monkeypatch.setattr(recommendations, "sparse", None)
+    expected = _counts()
+    CoObservation.objects.update(count=7)
+    CoObservation.objects.filter(pk=CoObservation.objects.first().pk).delete()
+
+    out = StringIO()
+    call_command("rebuild_coobservations", stdout=out)
+    assert "Stored 4 object pairs" in out.getvalue()
+    assert _counts() == expected
@@ -0,0 +1,119 @@
+from datetime import date
+
+import pytest
+from django.urls import reverse
+from conftest import events
+from NebulaNotesApp import ical
+from NebulaNotesApp.models import Event, OccurrenceOverride
+from NebulaNotesApp.recurrence import Occurrences, PageStart, occurrences
+from NebulaNotesApp.views import EventsListView
+
+
+def _event(**fields):
+    return Event(name="test", description="", **fields)
+
+
+def test_occurrences_are_computed_for_the_range():
+    """Checks that only the occurrences between the two days are generated, in either direction."""
+    perseids = _event(date=date(1990, 8, 12), repeat="yearly")
+    assert list(occurrences(perseids, date(2023, 1, 1), date(2025, 12, 31))) == [
+        date(2023, 8, 12), date(2024, 8, 12), date(2025, 8, 12),
+    ]
+    assert list(occurrences(perseids, date(2023, 1, 1), date(2025, 8, 11), reverse=True)) == [
+        date(2024, 8, 12), date(2023, 8, 12),
+    ]
+    halley = _event(date=date(1910, 4, 20), repeat="yearly", repeat_interval=76)
+    assert list(occurrences(halley, date(1900, 1, 1), date(2100, 1, 1))) == [date(1910, 4, 20), date(1986, 4, 20), date(2062, 4, 20)]
+
+
+def test_occurrences_skip_missing_days_and_stop_at_the_end():
+    """Checks that monthly series skip months without their day and end on their last day."""
+    monthly = _event(date=date(2024, 1, 31), repeat="monthly", repeat_until=date(2024, 6, 1))
+    assert list(occurrences(monthly, date.min, date.max)) == [date(2024, 1, 31), date(2024, 3, 31), date(2024, 5, 31)]
+    weekly = _event(date=date(2024, 1, 1), repeat="weekly", repeat_interval=2)
+    assert list(occurrences(weekly, date(2024, 1, 10), date(2024, 2, 1))) == [date(2024, 1, 15), date(2024, 1, 29)]
+    assert list(occurrences(_event(date=date(2024, 1, 1), repeat=""), date(2024, 1, 1), date(2024, 1, 1))) == [date(2024, 1, 1)]
+
+
+@pytest.mark.django_db
+def test_occurrences_merge_one_off_events_and_overrides(events):
+    """Checks that expanded occurrences, overrides and one-off events come out in one sorted stream."""
+    geminids = Event.objects.create(name="Geminids", date=date(2019, 12, 14), description="Meteor shower", repeat="yearly")
+    OccurrenceOverride.objects.create(event=geminids, original_date=date(2020, 12, 14), cancelled=True)
+    OccurrenceOverride.objects.create(event=geminids, original_date=date(2021, 12, 14), date=date(2021, 12, 28), name="Late Geminids")
+
+    listed = Occurrences(since=date(2019, 1, 1), until=date(2022, 1, 1))
+    assert [(o.name, o.date) for o in listed] == [
+        ("Geminids", date(2019, 12, 14)),
+        ("Christmas", date(2021, 12, 25)),
+        ("Late Geminids", date(2021, 12, 28)),
+        ("Lunar Eclipse", date(2021, 12, 31)),
+    ]
+    first, following = listed.page(size=2)
+    assert [o.name for o in first] == ["Geminids", "Christmas"]
+    second, following = listed.page(following, size=2)
+    assert [o.name for o in second] == ["Late Geminids", "Lunar Eclipse"] and following is None
+    newest_first = Occurrences(since=date(2019, 1, 1), until=date(2022, 1, 1), reverse=True)
+    assert [o.date for o in newest_first] == sorted((o.date for o in listed), reverse=True)
+
+
+@pytest.mark.django_db
+def test_event_list_pages_and_streams_occurrences(client, events):
+    """Checks that the event list pages through the occurrences of a range and streams them with ?all=1."""
+    Event.objects.create(name="Full Moon", date=date(2021, 1, 28), description="", repeat="monthly")
+    response = client.get(reverse("list-events"), {"since": "2021-12-01", "until": "2022-01-31"})
+    assert [event.name for event in response.context["events"]] == ["Christmas", "Full Moon", "Lunar Eclipse", "Full Moon"]
+
+    response = client.get(reverse("list-events"), {"since": "2021-01-01", "until": "2021-12-31", "sort": "desc", "all": 1})
+    html = b"".join(response.streaming_content).decode()
+    assert html.count("Full Moon") == 12
+    assert html.index("Lunar Eclipse") < html.index("Christmas")
+
+
+@pytest.mark.django_db
+def test_event_list_pages_start_where_the_previous_one_ended(client, events, monkeypatch):
+    """Checks that the event list pages by where the next page starts, across occurrences of the same day."""
+    monkeypatch.setattr(EventsListView, "paginate_by", 2)
+    Event.objects.create(name="Daily", date=date(2021, 12, 24), description="", repeat="daily", repeat_until=date(2021, 12, 26))
+    Event.objects.create(name="Also daily", date=date(2021, 12, 25), description="", repeat="daily", repeat_until=date(2021, 12, 25))
+    listed, start = [], ""
+    for _ in range(5):
+        response = client.get(reverse("list-events"), {"since": "2021-12-01", "start": start})
+        listed += [(event.name, event.date.day) for event in response.context["events"]]
+        start = response.context["page_obj"]["next_start"]
+        if not start:
+            break
+        assert f"start={start}" in response.content.decode()
+    assert listed == [
+        ("Daily", 24), ("Christmas", 25), ("Daily", 25), ("Also daily", 25), ("Daily", 26), ("Lunar Eclipse", 31),
+    ]
+    assert PageStart.parse(str(PageStart(date(2021, 12, 25), 2))) == (date(2021, 12, 25), 2)
+    assert PageStart.parse("tomorrow") is None
+
+
+@pytest.mark.django_db
+def test_calendar_feed(client, events, monkeypatch):
+    """Checks that the iCalendar feed has a VEVENT per occurrence, escaped and folded."""
+    monkeypatch.setattr(ical, "EVENTS_PER_CHUNK", 2)
+    comet = Event.objects.create(name="Comet; returns", date=date(2021, 12, 1), description="x" * 100, repeat="daily", repeat_interval=10)
+    response = client.get(reverse("events-calendar"), {"since": "2021-12-01", "until": "2021-12-31"})
+    assert response["Content-Type"] == "text/calendar; charset=utf-8"
+    body = b"".join(response.streaming_content).decode()
+    assert body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n")
+    assert body.count("BEGIN:VEVENT") == 6
+    assert f"UID:event-{comet.pk}-20211211@" in body
+    assert "SUMMARY:Comet\\; returns" in body
+    assert all(len(line.encode()) <= ical.LINE_LIMIT for line in body.split("\r\n"))
+
+
+@pytest.mark.django_db
+def test_event_form_validates_the_rule(client):
+    """Checks that a recurring event can't end before it starts."""
+    response = client.post(reverse("create-event"), {
+        "name": "Perseids", "description": "Meteor shower", "date": "2001-08-12",
+        "repeat": "yearly", "repeat_until": "2000-01-01",
+    })
+    assert response.status_code == 200
+    assert not Event.objects.filter(name="Perseids").exists()
+    client.post(reverse("create-event"), {"name": "Perseids", "description": "Meteor shower", "date": "2001-08-12", "repeat": "yearly"})
+    assert Event.objects.get(name="Perseids").repeat_interval == 1
@@ -0,0 +1,78 @@
+import pytest
+from django.core.cache import cache
+from django.core.signals import request_started
+from conftest import astronomical_objects, galaxies
+from NebulaNotesApp import reference
+from NebulaNotesApp.forms import ObjectForm
+from NebulaNotesApp.models import AstronomicalObjectType
+
+
+def _new_request():
+    request_started.send(sender=None)
+
+
+@pytest.mark.django_db
+def test_snapshot_is_loaded_once(astronomical_objects, galaxies, django_assert_num_queries):
+    """Checks that the reference tables are read once and later requests only check the version."""
+    _new_request()
+    data = reference.snapshot()
+    assert list(data.types.values()) == ["Planet", "Star"]
+    assert data.galaxy_choices()[0] == (galaxies[1].pk, "Andromeda")
+
+    _new_request()
+    with django_assert_num_queries(0):
+        assert reference.snapshot() is data
+        ObjectForm().as_p()
+
+
+@pytest.mark.django_db
+def test_snapshot_follows_writes_of_other_processes(astronomical_objects):
+    """Checks that a new version in the shared cache makes the next request reload the tables."""
+    _new_request()
+    data = reference.snapshot()
+    # Another worker renamed a type and bumped the version, this process has no signal of it.
+    AstronomicalObjectType.objects.filter(name="Star").update(name="Sun-like star")
+    assert reference.snapshot() is data
+    cache.set(reference.VERSION_KEY, "from another worker")
+
+    assert reference.snapshot() is data  # checked once per request
+    _new_request()
+    assert "Sun-like star" in reference.snapshot().types.values()
+
+
+@pytest.mark.django_db
+def test_snapshot_reloads_after_local_write(astronomical_objects):
+    """Checks that saving a type is visible in the form choices right away."""
+    _new_request()
+    reference.snapshot()
+    comet = AstronomicalObjectType.objects.create(name="Comet")
+    assert (comet.pk, "Comet") in ObjectForm().fields["type"].choices
+
+
+@pytest.mark.django_db
+def test_snapshot_reloads_after_cache_flush(astronomical_objects):
+    """Checks that a lost version key makes every process reload instead of trusting its copy."""
+    _new_request()
+    data = reference.snapshot()
+    cache.clear()
+    _new_request()
+    assert reference.snapshot() is not data
+
+
+@pytest.mark.django_db
+def test_uncommitted_write_is_not_cached(astronomical_objects, django_capture_on_commit_callbacks):
+    """Checks that a write is read back inside its transaction without becoming the snapshot, which changes on commit."""
+    _new_request()
+    data = reference.snapshot()
+    with django_capture_on_commit_callbacks() as callbacks:
+        AstronomicalObjectType.objects.create(name="Comet")
+        assert "Comet" in reference.snapshot().types.values()
+        assert reference._snapshot is data
+    # As if the transaction rolled back: the old snapshot is served again.
+    reference._pending.value = False
+    assert reference.snapshot() is data
+
+    for callback in callbacks:
+        callback()
+    _new_request()
+    assert "Comet" in reference.snapshot().types.values()
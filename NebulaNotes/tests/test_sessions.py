@@ -0,0 +1,94 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from conftest import test_user
+from NebulaNotesApp.sessions import SessionStore
+
+
+@pytest.mark.django_db
+def test_logged_in_page_needs_no_session_or_user_query(client, test_user):
+    """Checks that the session and the user come from the cache."""
+    client.login(username="testuser", password="testpass")
+    client.get(reverse("home"))
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse("home"))
+    assert response.context["user"] == test_user
+    assert not [query for query in queries if "django_session" in query["sql"] or "auth_user" in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_session_changes_are_written_behind(settings):
+    """Checks that changes of an existing session only reach the database once per window."""
+    settings.SESSION_WRITE_BEHIND_SECONDS = 60
+    session = SessionStore()
+    session["step"] = 1
+    session.create()
+    session["step"] = 2
+    session.save()
+
+    assert SessionStore().decode(Session.objects.get(pk=session.session_key).session_data) == {"step": 1}
+    assert SessionStore(session.session_key)["step"] == 2
+
+
+@pytest.mark.django_db
+def test_session_change_is_written_once_the_window_passes(settings):
+    """Checks that a single change inside the window reaches the database on the next load after it, with a later expiry."""
+    settings.SESSION_WRITE_BEHIND_SECONDS = 60
+    session = SessionStore()
+    session["step"] = 1
+    session.create()
+    created = Session.objects.get(pk=session.session_key)
+    assert created.expire_date >= now() + timedelta(seconds=settings.SESSION_COOKIE_AGE + 59)
+    session["step"] = 2
+    session.save()
+
+    SessionStore(session.session_key)["step"]
+    assert SessionStore().decode(Session.objects.get(pk=session.session_key).session_data) == {"step": 1}
+    # The window passes.
+    session._cache.delete(session.persisted_key)
+    assert SessionStore(session.session_key)["step"] == 2
+    row = Session.objects.get(pk=session.session_key)
+    assert SessionStore().decode(row.session_data) == {"step": 2}
+    assert row.expire_date >= created.expire_date
+
+
+@pytest.mark.django_db
+def test_session_changes_are_written_through_without_window(settings):
+    """Checks that every change is saved when write-behind is disabled."""
+    settings.SESSION_WRITE_BEHIND_SECONDS = 0
+    session = SessionStore()
+    session.create()
+    session["step"] = 2
+    session.save()
+    assert SessionStore().decode(Session.objects.get(pk=session.session_key).session_data) == {"step": 2}
+
+
+@pytest.mark.django_db
+def test_password_change_invalidates_cached_user(client, test_user):
+    """Checks that a password change logs the other sessions out instead of using the cached user."""
+    client.login(username="testuser", password="testpass")
+    assert client.get(reverse("home")).context["user"].is_authenticated
+
+    test_user.set_password("changed")
+    test_user.save()
+    assert not client.get(reverse("home")).context["user"].is_authenticated
+
+
+@pytest.mark.django_db
+def test_clear_expired_sessions_in_batches():
+    """Checks that only expired sessions are deleted, batch by batch."""
+    Session.objects.bulk_create(
+        [Session(session_key=f"expired{i}", session_data="", expire_date=now() - timedelta(days=1)) for i in range(5)]
+        + [Session(session_key="active", session_data="", expire_date=now() + timedelta(days=1))]
+    )
+    out = StringIO()
+    call_command("clear_expired_sessions", batch_size=2, stdout=out)
+    assert "Deleted 5 expired sessions in 3 batches." in out.getvalue()
+    assert list(Session.objects.values_list("session_key", flat=True)) == ["active"]
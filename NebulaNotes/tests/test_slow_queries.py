@@ -0,0 +1,91 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from conftest import galaxies
+from NebulaNotesApp import slow_queries
+from NebulaNotesApp.models import SlowQuery
+
+
+@pytest.mark.django_db
+def test_slow_queries_are_recorded_with_plans(client, settings, galaxies):
+    """Checks that queries over the threshold are stored with their plan and view."""
+    settings.SLOW_QUERY_THRESHOLD_MS = 0
+    client.get(reverse("list-galaxies"))
+    slow_query = SlowQuery.objects.get(view="list-galaxies", sql__contains="NebulaNotesApp_galaxy")
+    assert slow_query.plan
+    assert slow_query.duration >= 0
+
+
+@pytest.mark.django_db
+def test_slow_queries_keep_only_parameter_types(client, settings, galaxies):
+    """Checks that bound parameters are stored as their types and plans stop at the per-minute cap."""
+    settings.SLOW_QUERY_THRESHOLD_MS = 0
+    settings.SLOW_QUERY_EXPLAINS_PER_MINUTE = 1
+    slow_queries.record("login", [("SELECT %s, %s", ["hunter2", 42], 0.5), ("SELECT %s", ["secret-token"], 0.3)])
+    first, second = SlowQuery.objects.filter(view="login").order_by("pk")
+    assert json.loads(first.params) == ["str", "int"]
+    assert "hunter2" not in first.params and "secret-token" not in second.params
+    assert first.plan and not second.plan
+
+
+@pytest.mark.django_db
+def test_slow_query_recorder_can_be_disabled(client, settings, galaxies):
+    """Checks that nothing is recorded without a threshold."""
+    settings.SLOW_QUERY_THRESHOLD_MS = None
+    client.get(reverse("list-galaxies"))
+    assert not SlowQuery.objects.exists()
+
+
+@pytest.mark.django_db
+def test_index_advice_proposes_composite_index():
+    """Checks that the advisor proposes filter columns followed by sort columns and skips existing indexes."""
+    SlowQuery.objects.create(
+        sql='SELECT "NebulaNotesApp_observation"."id" FROM "NebulaNotesApp_observation" '
+            'WHERE "NebulaNotesApp_observation"."astronomical_object_id" = %s '
+            'ORDER BY "NebulaNotesApp_observation"."observation_date" ASC',
+        duration=250,
+        plan="SEARCH NebulaNotesApp_observation USING INDEX NebulaNotesApp_observation_astronomical_object_id "
+             "(astronomical_object_id=?)\nUSE TEMP B-TREE FOR ORDER BY",
+        view="list-observations",
+    )
+    SlowQuery.objects.create(
+        sql='SELECT "NebulaNotesApp_event"."id" FROM "NebulaNotesApp_event" ORDER BY "NebulaNotesApp_event"."date" ASC',
+        duration=300,
+        plan='[{"Plan": {"Node Type": "Sort", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "NebulaNotesApp_event"}]}}]',
+        view="list-events",
+    )
+    SlowQuery.objects.create(
+        sql='SELECT "NebulaNotesApp_observation"."id" FROM "NebulaNotesApp_observation" '
+            'WHERE "NebulaNotesApp_observation"."user_id" = %s ORDER BY "NebulaNotesApp_observation"."observation_date" ASC',
+        duration=250,
+        plan="SEARCH NebulaNotesApp_observation USING INDEX NebulaNotesApp_observation_user_id (user_id=?)\n"
+             "USE TEMP B-TREE FOR ORDER BY",
+        view="list-observations",
+    )
+    SlowQuery.objects.create(
+        sql='SELECT "NebulaNotesApp_galaxy"."id" FROM "NebulaNotesApp_galaxy" WHERE "NebulaNotesApp_galaxy"."name" = %s',
+        duration=400,
+        plan="SCAN NebulaNotesApp_galaxy",
+        view="galaxy-detail",
+    )
+    out = StringIO()
+    call_command("index_advice", stdout=out)
+    output = out.getvalue()
+
+    assert "observation (astronomical_object, observation_date): 1 queries" in output
+    assert "(user, observation_date)" not in output
+    assert "event (date): 1 queries" in output
+    assert "galaxy" not in output
+    assert "index=models.Index(fields=['astronomical_object', 'observation_date']" in output
+    assert "migrations.AddIndex(" in output
+
+
+@pytest.mark.django_db
+def test_index_advice_without_slow_queries():
+    """Checks that the advisor reports when there is nothing to suggest."""
+    out = StringIO()
+    call_command("index_advice", stdout=out)
+    assert "No index suggestions from 0 slow queries." in out.getvalue()
@@ -0,0 +1,65 @@
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+from NebulaNotesApp.storage import purge_css
+
+
+def test_purge_css_keeps_used_rules():
+    """Checks that rules only matching unused classes are removed, everything else is kept."""
+    css = (
+        '@charset "UTF-8";/*! license */:root{--x:1}.btn,.unused{a:1}.btn:not(.unused){b:2}'
+        '.card .unused{c:3}@media (min-width:1px){.unused{d:4}.btn{e:5}}@keyframes spin{to{f:6}}'
+    )
+    assert purge_css(css, {"btn", "card"}) == (
+        '@charset "UTF-8";/*! license */:root{--x:1}.btn{a:1}.btn:not(.unused){b:2}'
+        '@media (min-width:1px){.btn{e:5}}@keyframes spin{to{f:6}}'
+    )
+
+
+@pytest.fixture
+def collected_static(settings, tmp_path):
+    settings.DEBUG = False
+    settings.STATIC_ROOT = tmp_path
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "staticfiles": {"BACKEND": "NebulaNotesApp.storage.StaticAssetsStorage"},
+    }
+    call_command("collectstatic", interactive=False, verbosity=0)
+    return tmp_path, json.loads((tmp_path / "staticfiles.json").read_text())["paths"]
+
+
+def test_collectstatic_writes_hashed_purged_and_compressed_files(collected_static):
+    """Checks that Bootstrap is purged, hashed and precompressed."""
+    root, manifest = collected_static
+    hashed = manifest["vendor/bootstrap/bootstrap.min.css"]
+    assert hashed != "vendor/bootstrap/bootstrap.min.css"
+
+    purged = (root / hashed).read_bytes()
+    source = Path(apps.get_app_config("NebulaNotesApp").path) / "static/vendor/bootstrap/bootstrap.min.css"
+    assert len(purged) < source.stat().st_size / 2
+    assert b".list-group-item" in purged
+    assert b".carousel-item" not in purged
+    assert gzip.decompress((root / f"{hashed}.gz").read_bytes()) == purged
+
+
+def test_static_files_are_served_precompressed_and_immutable(client, collected_static):
+    """Checks that hashed files are sent compressed with far-future cache headers."""
+    _, manifest = collected_static
+    url = "/static/" + manifest["styles.css"]
+    response = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+    assert response.status_code == 200
+    assert response["Content-Encoding"] == "gzip"
+    assert response["Content-Type"] == "text/css"
+    assert response["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert "Accept-Encoding" in response["Vary"]
+
+    revalidated = client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+    assert revalidated.status_code == 304
+
+    plain = client.get("/static/styles.css", HTTP_ACCEPT_ENCODING="identity")
+    assert "Content-Encoding" not in plain
+    assert plain["Cache-Control"] == "public, max-age=0, must-revalidate"
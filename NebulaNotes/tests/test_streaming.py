@@ -0,0 +1,82 @@
+import asyncio
+import gzip
+
+import brotli
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+from conftest import astronomical_objects, observations, test_user, events
+from NebulaNotesApp.models import AstronomicalObject
+from NebulaNotesApp import streaming
+
+
+@pytest.fixture
+def many_objects(astronomical_objects):
+    object_type = astronomical_objects[0].type
+    AstronomicalObject.objects.bulk_create(
+        AstronomicalObject(name=f"Minor planet {number}", type=object_type, distance_from_earth=0.0003) for number in range(250)
+    )
+    return AstronomicalObject.objects.count()
+
+
+@pytest.mark.django_db
+def test_object_list_is_paginated(client, many_objects):
+    """Checks that the object list shows one page of objects and links to the full list."""
+    response = client.get(reverse("list-objects"))
+    assert response.status_code == 200
+    assert len(response.context["objects"]) == 100
+    assert response.context["page_obj"].paginator.num_pages == 3
+    assert "all=1" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_full_object_list_is_streamed_in_batches(client, many_objects, monkeypatch):
+    """Checks that ?all=1 streams every object between the page head and tail, in batches."""
+    monkeypatch.setattr(streaming, "ROWS_PER_CHUNK", 100)
+    response = client.get(reverse("list-objects"), {"all": 1})
+    assert response.streaming
+    assert "Content-Encoding" not in response
+
+    chunks = [chunk.decode() for chunk in response.streaming_content]
+    assert len(chunks) == 5  # head, three batches of rows, tail
+    html = "".join(chunks)
+    assert html.count("Minor planet") == 250
+    assert "Mars" in html and "Sirius" in html
+    assert html.rstrip().endswith("</html>")
+    assert streaming.ROWS_MARKER not in html
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)])
+def test_streamed_list_is_compressed(client, many_objects, encoding, decompress):
+    """Checks that the streamed list is compressed with the encoding the client prefers."""
+    response = client.get(reverse("list-objects"), {"all": 1}, HTTP_ACCEPT_ENCODING=f"{encoding}, identity")
+    assert response["Content-Encoding"] == encoding
+    assert "Accept-Encoding" in response["Vary"]
+    html = decompress(b"".join(response.streaming_content)).decode()
+    assert html.count("Minor planet") == 250
+
+
+@pytest.mark.django_db
+def test_observation_list_is_streamed(client, test_user, observations):
+    """Checks that the user's observations can be streamed with the date filter applied."""
+    client.force_login(test_user)
+    response = client.get(reverse("list-observations"), {"all": 1, "since": "2024-04-16"})
+    html = b"".join(response.streaming_content).decode()
+    assert "Sirius" in html
+    assert "Mars" not in html
+
+
+@pytest.mark.django_db(transaction=True)
+def test_full_object_list_is_streamed_under_asgi(many_objects, monkeypatch):
+    """Checks that under ASGI the streamed list is an async iterator sent a batch at a time, not consumed whole."""
+    monkeypatch.setattr(streaming, "ROWS_PER_CHUNK", 100)
+
+    async def main():
+        response = await AsyncClient().get(reverse("list-objects"), {"all": 1})
+        return response.is_async, [chunk async for chunk in response.streaming_content]
+
+    is_async, chunks = asyncio.run(main())
+    assert is_async
+    assert len(chunks) == 5
+    assert b"".join(chunks).decode().count("Minor planet") == 250
@@ -0,0 +1,119 @@
+import datetime
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils.timezone import make_aware
+from conftest import test_user, astronomical_objects, galaxies, events, observations
+from NebulaNotesApp import sync
+from NebulaNotesApp.models import AstronomicalObject, Change, Galaxy, Observation
+
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+def test_sync_requires_login(client):
+    """Checks that anonymous users can't sync."""
+    response = client.get(reverse("sync"))
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_sync_returns_changes_after_cursor(client, test_user, galaxies):
+    """Checks that only rows changed after the cursor are returned."""
+    client.login(username=test_user.username, password="testpass")
+    cursor = client.get(reverse("sync")).json()["cursor"]
+
+    milky_way = galaxies[0]
+    milky_way.description = "Home"
+    milky_way.save()
+
+    result = client.get(reverse("sync"), {"cursor": cursor}).json()
+    assert [(change["model"], change["id"]) for change in result["changes"]] == [("galaxy", milky_way.id)]
+    assert result["changes"][0]["data"]["description"] == "Home"
+    assert result["cursor"] != cursor
+    assert result["more"] is False
+
+
+@pytest.mark.django_db
+def test_sync_keeps_one_entry_per_row(galaxies):
+    """Checks that the change log is compacted to the latest change of every row."""
+    milky_way = galaxies[0]
+    for i in range(5):
+        milky_way.description = str(i)
+        milky_way.save()
+    assert Change.objects.filter(model="galaxy", object_id=milky_way.id).count() == 1
+
+
+@pytest.mark.django_db
+def test_sync_reports_tombstones(client, test_user, galaxies):
+    """Checks that deleted rows are sent as tombstones."""
+    client.login(username=test_user.username, password="testpass")
+    cursor = client.get(reverse("sync")).json()["cursor"]
+    galaxy_id = galaxies[1].id
+    Galaxy.objects.filter(pk=galaxy_id).delete()
+
+    changes = client.get(reverse("sync"), {"cursor": cursor}).json()["changes"]
+    assert changes == [{"seq": changes[0]["seq"], "model": "galaxy", "id": galaxy_id, "deleted": True, "data": None}]
+
+
+@pytest.mark.django_db
+def test_sync_reports_objects_detached_from_a_deleted_galaxy(client, test_user, galaxies, astronomical_objects):
+    """Checks that deleting a galaxy sends its objects again, with their galaxy cleared."""
+    mars, sirius, _ = astronomical_objects
+    AstronomicalObject.objects.filter(pk__in=[mars.pk, sirius.pk]).update(galaxy=galaxies[0])
+    client.login(username=test_user.username, password="testpass")
+    cursor = client.get(reverse("sync")).json()["cursor"]
+    galaxy_id = galaxies[0].pk
+    galaxies[0].delete()
+
+    changes = client.get(reverse("sync"), {"cursor": cursor}).json()["changes"]
+    objects = {change["id"]: change["data"] for change in changes if change["model"] == "astronomicalobject"}
+    assert set(objects) == {mars.pk, sirius.pk}
+    assert all(data["galaxy_id"] is None for data in objects.values())
+    assert [change["id"] for change in changes if change["model"] == "galaxy" and change["deleted"]] == [galaxy_id]
+
+
+@pytest.mark.django_db
+def test_sync_hides_other_users_observations(client, test_user, observations, astronomical_objects):
+    """Checks that observations of other users are not synced, while catalog rows are."""
+    other = User.objects.create_user(username="other", password="otherpass")
+    Observation.objects.create(user=other, astronomical_object=astronomical_objects[0], observation_date=make_aware(datetime.datetime(2024, 1, 1)))
+
+    client.login(username=test_user.username, password="testpass")
+    changes = client.get(reverse("sync")).json()["changes"]
+    synced_observations = {change["id"] for change in changes if change["model"] == "observation"}
+    assert synced_observations == {observation.id for observation in observations}
+    assert {change["model"] for change in changes} >= {"astronomicalobject", "astronomicalobjecttype", "event"}
+
+
+@pytest.mark.django_db
+def test_sync_batches(client, test_user, galaxies):
+    """Checks that a limited batch reports that more changes are pending."""
+    client.login(username=test_user.username, password="testpass")
+    first = client.get(reverse("sync"), {"limit": 2}).json()
+    assert len(first["changes"]) == 2
+    assert first["more"] is True
+    second = client.get(reverse("sync"), {"cursor": first["cursor"], "limit": 2}).json()
+    assert [change["id"] for change in second["changes"]] == [galaxies[2].id]
+
+
+@pytest.mark.django_db
+def test_sync_cursor_follows_transaction_order(galaxies, test_user, monkeypatch):
+    """Checks that changes are read in transaction order and only up to the oldest running transaction."""
+    Change.objects.all().delete()
+    late = Change.objects.create(model="galaxy", object_id=galaxies[0].id, txid=7)   # lower key, later transaction
+    early = Change.objects.create(model="galaxy", object_id=galaxies[1].id, txid=5)
+    running = Change.objects.create(model="galaxy", object_id=galaxies[2].id, txid=9)
+
+    monkeypatch.setattr(sync, "visible_horizon", lambda: 9)
+    batch = sync.changes_since(test_user, "0")
+    assert [change["seq"] for change in batch["changes"]] == [early.pk, late.pk]
+    assert batch["cursor"] == f"7.{late.pk}"
+
+    monkeypatch.setattr(sync, "visible_horizon", lambda: 10)
+    assert [change["seq"] for change in sync.changes_since(test_user, batch["cursor"])["changes"]] == [running.pk]
+    assert sync.parse_cursor(12) == (0, 12)
+    with pytest.raises(ValueError):
+        sync.parse_cursor("a.b")
@@ -650,3 +650,49 @@ def test_observation_delete_view_not_found(client, test_user, observations):
     client.login(username=test_user.username, password="testpass")
     response = client.get(reverse("observation-delete", args=[999]))
     assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_galaxy_and_type_lists_show_object_counts(client, galaxies, astronomical_objects, django_assert_max_num_queries):
+    """Checks that the lists get their object counts from one grouped query."""
+    AstronomicalObject.objects.filter(name__in=["Mars", "Jupiter"]).update(galaxy=galaxies[0])
+
+    with django_assert_max_num_queries(1):
+        galaxies_context = client.get(reverse("list-galaxies")).context["galaxies"]
+        counts = {galaxy.name: galaxy.object_count for galaxy in galaxies_context}
+    assert counts == {"Milky Way": 2, "Andromeda": 0, "Triangulum": 0}
+
+    types = client.get(reverse("list-object-types")).context["object_types"]
+    assert {object_type.name: object_type.object_count for object_type in types} == {"Planet": 2, "Star": 1}
+
+
+@pytest.mark.django_db
+def test_galaxy_detail_lists_members_by_type(client, galaxies, astronomical_objects):
+    """Checks that the galaxy detail view breaks its objects down by type and paginates them."""
+    AstronomicalObject.objects.update(galaxy=galaxies[0])
+    response = client.get(reverse("galaxy-detail", args=[galaxies[0].id]))
+    assert response.context["breakdown"] == [{"label": "Planet", "count": 2}, {"label": "Star", "count": 1}]
+    assert [member.name for member in response.context["members"]] == ["Jupiter", "Mars", "Sirius"]
+    assert response.context["members"].paginator.count == 3
+    assert b"Objects by type" in response.content
+
+
+@pytest.mark.django_db
+def test_object_type_detail_lists_members_by_galaxy(client, galaxies, astronomical_objects):
+    """Checks that the type detail view pages through its objects."""
+    planet = astronomical_objects[0].type
+    AstronomicalObject.objects.filter(name="Mars").update(galaxy=galaxies[0])
+    AstronomicalObject.objects.bulk_create(
+        AstronomicalObject(name=f"Exoplanet {number:02}", type=planet, galaxy=galaxies[1], distance_from_earth=2.5e6)
+        for number in range(1, 23)
+    )
+    response = client.get(reverse("object-type-detail", args=[planet.id]), {"page": 2})
+    assert response.context["breakdown"] == [
+        {"label": None, "count": 1}, {"label": "Andromeda", "count": 22}, {"label": "Milky Way", "count": 1},
+    ]
+    members = response.context["members"]
+    assert (members.number, members.paginator.num_pages) == (2, 2)
+    assert [(member.name, member.galaxy and member.galaxy.name) for member in members] == [
+        ("Exoplanet 21", "Andromeda"), ("Exoplanet 22", "Andromeda"), ("Jupiter", None), ("Mars", "Milky Way"),
+    ]
+    assert b"Unknown" in response.content